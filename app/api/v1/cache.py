@@ -0,0 +1,167 @@
+import os
+import time
+import pickle
+import shutil
+import hashlib
+import threading
+import structlog
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from app.config import config
+from app.models.connection import DATASET_RELOAD_CHANNEL
+from app.models.repository import transaction, listen
+
+logger = structlog.get_logger()
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    media_type: str
+    etag: str
+    expires_at: float
+    headers: Dict[str, str] = field(default_factory=dict)
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+class ResultCache:
+    """
+        LRU cache of rendered data API responses keyed by (database, table, query parameters).
+        Entries expire after a TTL and the cache is bounded by entry count and total bytes.
+        Entries evicted from memory are spilled to a local directory when one is configured.
+    """
+    def __init__(self, max_entries: int, max_bytes: int, max_entry_bytes: int, ttl: float, spill_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.ttl = ttl
+        self.spill_dir = spill_dir
+        self.entries: "OrderedDict[Tuple, CacheEntry]" = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(database: str, table: str, params: Dict) -> Tuple:
+        return (database, table, tuple(sorted((k, str(v)) for k, v in params.items() if v is not None)))
+
+    def spill_path(self, key: Tuple) -> str:
+        database, table, _ = key
+        table_dir = hashlib.sha1(f"{database}.{table}".encode()).hexdigest()
+        return os.path.join(self.spill_dir, table_dir, hashlib.sha1(repr(key).encode()).hexdigest())
+
+    def get(self, key: Tuple) -> Optional[CacheEntry]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry:
+                if entry.expires_at < time.monotonic():
+                    self.remove(key)
+                    return None
+                self.entries.move_to_end(key)
+                return entry
+        return self.load_spilled(key)
+
+    def put(self, key: Tuple, entry: CacheEntry):
+        if len(entry.body) > self.max_entry_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = entry
+            self.size += len(entry.body)
+            while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+                evicted_key, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted.body)
+                self.spill(evicted_key, evicted)
+
+    def remove(self, key: Tuple):
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.size -= len(entry.body)
+
+    def spill(self, key: Tuple, entry: CacheEntry):
+        if not self.spill_dir:
+            return
+        try:
+            path = self.spill_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Store the wall clock expiry since monotonic time does not survive a restart.
+            with open(path, "wb") as f:
+                pickle.dump((key, entry, time.time() + entry.expires_at - time.monotonic()), f)
+        except Exception as e:
+            logger.warning(f"Failed to spill cache entry for {key[0]}.{key[1]}: {e}")
+
+    def load_spilled(self, key: Tuple) -> Optional[CacheEntry]:
+        if not self.spill_dir:
+            return None
+        path = self.spill_path(key)
+        try:
+            with open(path, "rb") as f:
+                stored_key, entry, expires_at = pickle.load(f)
+            # Missing by now if a concurrent reader took the entry or an invalidation removed it, either way it is not used.
+            os.remove(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Failed to read spilled cache entry for {key[0]}.{key[1]}: {e}")
+            return None
+        if stored_key != key or expires_at < time.time():
+            return None
+        entry.expires_at = time.monotonic() + expires_at - time.time()
+        self.put(key, entry)
+        return entry
+
+    def invalidate(self, database: str, table: Optional[str] = None):
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == database and (table is None or k[1] == table)]:
+                self.remove(key)
+        if self.spill_dir and table is not None:
+            table_dir = hashlib.sha1(f"{database}.{table}".encode()).hexdigest()
+            shutil.rmtree(os.path.join(self.spill_dir, table_dir), ignore_errors=True)
+        elif self.spill_dir:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+        logger.info(f"Invalidated cached results for {database}.{table or '*'}")
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+        if self.spill_dir:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+def invalidate_connection_datasets(connection_id: str):
+    """
+        Drop the cached results of every dataset published by a connection.
+    """
+    try:
+        with transaction() as cursor:
+            cursor.execute("SELECT dataset_owner, table_name FROM Datasets WHERE connection_id = %s;", (connection_id,))
+            datasets = cursor.fetchall()
+        for database, table in datasets:
+            result_cache.invalidate(database, table)
+    except Exception as e:
+        # Without the dataset list it is safer to drop everything than to serve stale data.
+        logger.warning(f"Failed to look up datasets of connection {connection_id}, clearing the whole cache: {e}")
+        result_cache.clear()
+
+def listen_for_reloads(stop_event: threading.Event):
+    """
+        Listen on the Postgres reload channel, which Connection.update_state notifies when a connection
+        reaches Stored or Loaded, and invalidate the cached results of the affected datasets.
+    """
+    listen(DATASET_RELOAD_CHANNEL, invalidate_connection_datasets, stop_event)
+
+result_cache = ResultCache(
+    max_entries=config.api_service.cache_max_entries,
+    max_bytes=config.api_service.cache_max_bytes,
+    max_entry_bytes=config.api_service.cache_max_entry_bytes,
+    ttl=config.api_service.cache_ttl,
+    spill_dir=config.api_service.cache_spill_dir
+)
@@ -1,26 +1,220 @@
-
+import json
+import time
 import structlog
-from fastapi import APIRouter, status, HTTPException
+from functools import partial
+from typing import Dict, List, Literal, Optional
+from fastapi import APIRouter, status, HTTPException, Query, Header, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from app.config import config
+from app.api.v1.limiter import limiter
+from app.api.v1.cache import result_cache, CacheEntry, make_etag, etag_matches
+from app.metrics import (
+    UNKNOWN_LABEL, observe_duration, data_query_seconds, data_serialization_seconds, data_stream_seconds, data_rows, data_bytes, data_cache_requests
+)
+from app.controllers.clickhouse import (
+    TableQuery, get_table_columns, get_primary_key, has_sampling_key, build_select_query, stream_json_rows, stream_raw_format
+)
 
 logger = structlog.get_logger()
 router = APIRouter(prefix="/data", tags=["Get Data"])
 
+MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+    "csv": "text/csv",
+}
+
+# Formats that ClickHouse renders natively and that are passed through as raw bytes.
+CLICKHOUSE_FORMATS = {
+    "arrow": "ArrowStream",
+    "parquet": "Parquet",
+    "csv": "CSVWithNames",
+}
+
+ACCEPT_FORMATS = {
+    "application/vnd.apache.arrow.stream": "arrow",
+    "application/vnd.apache.parquet": "parquet",
+    "application/x-parquet": "parquet",
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/json": "json",
+}
+
+def negotiate_format(output_format: Optional[str], accept: Optional[str]) -> str:
+    """
+        Pick the response format from the `format` query parameter, falling back to the Accept header.
+    """
+    if output_format:
+        return output_format
+    for media_range in (accept or "").split(","):
+        media_type = media_range.split(";")[0].strip().lower()
+        if media_type in ACCEPT_FORMATS:
+            return ACCEPT_FORMATS[media_type]
+    return "json"
+
+def observe_stream(chunks, database: str, table: str, output_format: str):
+    """
+        Record the duration and size of a streamed response once it has been fully sent or closed.
+        A stream that fails is recorded without its database and table.
+    """
+    start = time.perf_counter()
+    byte_count = 0
+    try:
+        for chunk in chunks:
+            byte_count += len(chunk) if isinstance(chunk, bytes) else len(chunk.encode("utf-8"))
+            yield chunk
+    except Exception:
+        database = table = UNKNOWN_LABEL
+        raise
+    finally:
+        data_stream_seconds.labels(database=database, table=table, format=output_format).observe(time.perf_counter() - start)
+        data_bytes.labels(database=database, table=table, format=output_format).observe(byte_count)
+
+def fetch_records(client, query: str, parameters: Dict, key_name: Optional[str], limit: Optional[int], database: str, table: str):
+    """
+        Run the query and render the result as a JSON array of row-wise objects. Runs on the query executor.
+        Returns the body, the row count and the keyset cursor of the next page, if there is one.
+    """
+    with observe_duration(data_query_seconds, database=database, table=table):
+        result = client.query(query, parameters=parameters)
+    with observe_duration(data_serialization_seconds, database=database, table=table, format="json"):
+        # Convert to array of objects (row-wise dicts)
+        records = jsonable_encoder([dict(zip(result.column_names, row)) for row in result.result_rows])
+        next_after = None
+        if key_name and limit is not None and len(records) == limit:
+            next_after = str(records[-1][key_name])
+        body = json.dumps(records, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+    data_rows.labels(database=database, table=table).observe(len(records))
+    data_bytes.labels(database=database, table=table, format="json").observe(len(body))
+    return body, len(records), next_after
+
+def cached_response(entry: CacheEntry, if_none_match: Optional[str], cache_status: str) -> Response:
+    headers = {**entry.headers, "ETag": entry.etag, "X-Cache": cache_status}
+    if etag_matches(if_none_match, entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(entry.body, media_type=entry.media_type, headers=headers)
+
 @router.get("/{database}/{table}",status_code=status.HTTP_200_OK,)
-def get_table_data(database: str, table: str):
+async def get_table_data(
+    database: str,
+    table: str,
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of rows to return. Buffered JSON defaults to API_DEFAULT_LIMIT rows, follow X-Next-After or stream for more."),
+    offset: int = Query(0, ge=0, description="Number of rows to skip. Ignored when `after` is set."),
+    after: Optional[str] = Query(None, description="Keyset cursor: return rows whose primary key is greater than this value."),
+    stream: bool = Query(False, description="Stream the rows block by block instead of buffering the whole result."),
+    columns: Optional[str] = Query(None, description="Comma separated list of columns to return."),
+    where: Optional[List[str]] = Query(None, description="Filter as column:operator:value, operator one of eq, ne, gt, gte, lt, lte, like, in (values separated by |). Repeat for AND."),
+    order_by: Optional[str] = Query(None, description="Comma separated columns to order by, prefix with - for descending."),
+    group_by: Optional[str] = Query(None, description="Comma separated columns to group by."),
+    aggregate: Optional[str] = Query(None, description="Comma separated aggregates such as count(*), sum(column), avg(column), min, max, uniq."),
+    sample: Optional[float] = Query(None, description="Fraction of rows to sample, for tables with a sampling key."),
+    output_format: Optional[Literal["json", "ndjson", "arrow", "parquet", "csv"]] = Query(None, alias="format"),
+    accept: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+):
+    output_format = negotiate_format(output_format, accept)
+    if limit is None and output_format == "json" and not stream:
+        # A buffered result is held in memory whole, so it is never unbounded.
+        limit = config.api_service.default_limit
     try:
-        client = config.clickhouse.get_connection(database)
+        table_query = TableQuery.parse(columns, where, order_by, group_by, aggregate, sample)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Buffered JSON responses are served from the result cache without touching ClickHouse.
+    cacheable = config.api_service.cache_enabled and output_format == "json" and not stream
+    cache_key = result_cache.make_key(database, table, {
+        "limit": limit, "offset": offset, "after": after, "columns": columns, "where": where,
+        "order_by": order_by, "group_by": group_by, "aggregate": aggregate, "sample": sample
+    })
+    if cacheable:
+        entry = result_cache.get(cache_key)
+        data_cache_requests.labels(result="hit" if entry else "miss").inc()
+        if entry:
+            return cached_response(entry, if_none_match, "HIT")
+
+    # Wait for a query slot on this database, or fail fast with 429/503 when it is saturated.
+    await limiter.acquire(database)
+    client = None
+    streaming = False
+    try:
+        client = await limiter.run(config.clickhouse.acquire, database)
+
+        # The table is validated before anything is recorded, so the metrics only get series of existing tables.
+        table_columns = await limiter.run(get_table_columns, client, database, table)
+        if not table_columns:
+            raise HTTPException(status_code=404, detail=f"Table {database}.{table} does not exist")
+        key = None
+        column_types = {}
+        if after is not None or limit is not None or not table_query.is_empty:
+            # Every identifier in the request is checked against the table's columns.
+            column_types = {name: column_type for name, column_type, _ in table_columns}
+            key = get_primary_key(table_columns)
+            if after is not None and key is None:
+                raise HTTPException(status_code=400, detail="Keyset pagination requires a table with a single column primary key")
+        if table_query.sample and not await limiter.run(has_sampling_key, client, database, table):
+            raise HTTPException(status_code=400, detail=f"Table {database}.{table} has no sampling key")
 
-        query = f"SELECT * FROM {database}.{table}"
-        result = client.query(query)
-        if not result.result_rows:
+        try:
+            query, parameters = build_select_query(database, table, limit=limit, offset=offset, key=key, after=after,
+                                                   table_query=table_query, column_types=column_types)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        if output_format in CLICKHOUSE_FORMATS:
+            logger.info(f"Streaming {output_format} output from {database}.{table}")
+            streaming = True
+            body = limiter.stream(observe_stream(stream_raw_format(client, query, parameters, CLICKHOUSE_FORMATS[output_format]), database, table, output_format),
+                                  database, on_close=partial(config.clickhouse.release, database, client))
+            # The background task frees the slot and the client when the body is never iterated.
+            return StreamingResponse(
+                body,
+                media_type=MEDIA_TYPES[output_format],
+                headers={"Content-Disposition": f'attachment; filename="{table}.{output_format}"'},
+                background=BackgroundTask(body.close)
+            )
+
+        if stream or output_format == "ndjson":
+            logger.info(f"Streaming records from {database}.{table}")
+            streaming = True
+            body = limiter.stream(observe_stream(stream_json_rows(client, query, parameters, output_format), database, table, output_format),
+                                  database, on_close=partial(config.clickhouse.release, database, client))
+            return StreamingResponse(
+                body,
+                media_type=MEDIA_TYPES[output_format],
+                background=BackgroundTask(body.close)
+            )
+
+        key_name = key[0] if key and not table_query.is_aggregate and not table_query.order_by else None
+        if key_name and table_query.columns and key_name not in table_query.columns:
+            key_name = None
+        body, row_count, next_after = await limiter.run(fetch_records, client, query, parameters, key_name, limit, database, table)
+        if not row_count:
             logger.warning(f"No data returned from {database}.{table}")
-            return []
+        else:
+            logger.info(f"Retrieved {row_count} records from {database}.{table}")
 
-        # Convert to array of objects (row-wise dicts)
-        records = [dict(zip(result.column_names, row)) for row in result.result_rows]
-        logger.info(f"Retrieved {len(records)} records from {database}.{table}")
-        return records
+        entry = CacheEntry(
+            body=body,
+            media_type=MEDIA_TYPES["json"],
+            etag=make_etag(body),
+            expires_at=time.monotonic() + result_cache.ttl,
+            headers={"X-Next-After": next_after} if next_after else {}
+        )
+        if cacheable:
+            result_cache.put(cache_key, entry)
+        return cached_response(entry, if_none_match, "MISS")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching data from {database}.{table}: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Internal server error while retrieving data")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Internal server error while retrieving data")
+    finally:
+        if not streaming:
+            if client:
+                config.clickhouse.release(database, client)
+            limiter.release(database)
\ No newline at end of file
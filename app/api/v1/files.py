@@ -0,0 +1,73 @@
+
+import posixpath
+import structlog
+from typing import Optional, Tuple
+from fastapi import APIRouter, status, HTTPException, Query, Header
+from fastapi.responses import StreamingResponse
+from app.config import config
+from app.controllers.hadoop import get_file_size, stream_file_range
+
+logger = structlog.get_logger()
+router = APIRouter(prefix="/files", tags=["Download Files"])
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+        Parse a single `bytes=` range into an inclusive (start, end) pair. Returns None when the header is
+        absent or uses a form we do not serve partially (multiple ranges), and raises 416 when unsatisfiable.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_text, _, end_text = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(end_text), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, min(end, size - 1)
+
+@router.get("", status_code=status.HTTP_200_OK,)
+def download_file(path: str = Query(..., description="Absolute HDFS path of the file."), range: Optional[str] = Header(None)):
+    path = posixpath.normpath(path)
+    if not any(path == root or path.startswith(root.rstrip("/") + "/") for root in config.hadoop.download_roots):
+        raise HTTPException(status_code=403, detail="Downloads are only allowed from the data lake directories")
+
+    try:
+        size = get_file_size(path)
+    except Exception as e:
+        logger.error(f"Error reading file status of {path}: {str(e)}")
+        raise HTTPException(status_code=404, detail="File not found")
+    if size is None:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{posixpath.basename(path)}"',
+    }
+    byte_range = parse_range(range, size)
+    if byte_range:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+    else:
+        start, end = 0, size - 1
+        status_code = status.HTTP_200_OK
+    headers["Content-Length"] = str(end - start + 1)
+
+    logger.info(f"Streaming bytes {start}-{end} of {path}")
+    return StreamingResponse(
+        stream_file_range(path, start, end - start + 1, config.hadoop.download_chunk_size),
+        status_code=status_code,
+        media_type="application/octet-stream",
+        headers=headers
+    )
@@ -0,0 +1,120 @@
+import anyio
+import asyncio
+import structlog
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from functools import partial
+from typing import AsyncIterator, Callable, Iterator, Optional
+
+from fastapi import HTTPException
+
+from app.config import config
+
+logger = structlog.get_logger()
+
+class DatabaseLimiter:
+    """
+        Runs ClickHouse work on a dedicated, sized executor and caps the number of concurrent queries
+        per database. Requests beyond the cap wait in a bounded queue; when the queue is full the
+        caller gets a 429, and when the wait times out a 503, both with a Retry-After header.
+    """
+    def __init__(self, workers: int, concurrency: int, queue_size: int, queue_timeout: float, retry_after: int):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="clickhouse")
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.semaphores = {}
+        self.waiting = {}
+
+    def busy(self, status_code: int, detail: str) -> HTTPException:
+        return HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(self.retry_after)})
+
+    async def acquire(self, database: str):
+        semaphore = self.semaphores.setdefault(database, asyncio.Semaphore(self.concurrency))
+        if semaphore.locked() and self.waiting.get(database, 0) >= self.queue_size:
+            logger.warning(f"Rejecting request for {database}: {self.queue_size} requests already queued")
+            raise self.busy(429, f"Too many concurrent requests for database {database}")
+
+        self.waiting[database] = self.waiting.get(database, 0) + 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Timed out after {self.queue_timeout}s waiting for a query slot on {database}")
+            raise self.busy(503, f"Database {database} is busy, try again later")
+        finally:
+            self.waiting[database] -= 1
+
+    def release(self, database: str):
+        self.semaphores[database].release()
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    def stream(self, chunks: Iterator, database: str, on_close: Optional[Callable[[], None]] = None) -> "LimitedStream":
+        """
+            Wrap a blocking chunk iterator holding a slot of the database as the body of a streamed response.
+        """
+        return LimitedStream(self, chunks, database, on_close)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+class LimitedStream:
+    """
+        Drives a blocking chunk iterator on the query executor. Closing it closes the iterator, runs
+        on_close (such as returning the pooled ClickHouse client) and frees the database slot, exactly once.
+        It is closed when the iteration ends, fails or is cancelled by a client disconnect, and also by
+        close() as a background task of the response, for bodies that are never iterated at all.
+    """
+    def __init__(self, limiter: DatabaseLimiter, chunks: Iterator, database: str, on_close: Optional[Callable[[], None]]):
+        self.limiter = limiter
+        self.chunks = chunks
+        self.database = database
+        self.on_close = on_close
+        self.pending: Optional[Future] = None
+        self.closed = False
+
+    async def __aiter__(self) -> AsyncIterator:
+        done = object()
+        try:
+            while True:
+                self.pending = self.limiter.executor.submit(next, self.chunks, done)
+                chunk = await asyncio.wrap_future(self.pending)
+                if chunk is done:
+                    break
+                yield chunk
+        finally:
+            await self.close()
+
+    def close_chunks(self):
+        # A cancelled await leaves next() running on the executor, the iterator can only be closed once it returns.
+        if self.pending is not None:
+            wait([self.pending])
+        self.chunks.close()
+
+    async def close(self):
+        # Only called on the event loop, so the flag needs no lock.
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            # On a client disconnect the surrounding scope is already cancelled, the cleanup must still run.
+            with anyio.CancelScope(shield=True):
+                await self.limiter.run(self.close_chunks)
+        except Exception as e:
+            logger.error(f"Failed to close the stream of {self.database}: {e}")
+        finally:
+            try:
+                if self.on_close:
+                    self.on_close()
+            finally:
+                self.limiter.release(self.database)
+
+limiter = DatabaseLimiter(
+    workers=config.api_service.query_workers,
+    concurrency=config.api_service.database_concurrency,
+    queue_size=config.api_service.database_queue_size,
+    queue_timeout=config.api_service.queue_timeout,
+    retry_after=config.api_service.retry_after
+)
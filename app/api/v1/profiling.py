@@ -0,0 +1,287 @@
+import os
+import sys
+import json
+import heapq
+import random
+import secrets
+import threading
+import time
+import tracemalloc
+import structlog
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+from asgi_correlation_id import correlation_id
+from fastapi import APIRouter, HTTPException, Header, Request
+from fastapi.responses import PlainTextResponse
+
+from app.config import config
+
+logger = structlog.get_logger()
+router = APIRouter(prefix="/profiles", tags=["Profiling"])
+
+# Blocking work of a request runs on the query executor or on Starlette's thread pool, not on the event loop.
+PROFILED_THREAD_PREFIXES = ("clickhouse", "AnyIO worker thread")
+TOP_ENTRIES = 30
+# Only one request at a time can own tracemalloc, which is process wide.
+allocation_lock = threading.Lock()
+
+def frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def is_waiting_for_events(frame) -> bool:
+    code = frame.f_code
+    return code.co_name == "select" and code.co_filename.endswith("selectors.py")
+
+def is_idle(frame) -> bool:
+    """
+        True for a pool thread waiting for work, whose samples say nothing about the request.
+    """
+    code = frame.f_code
+    if code.co_name == "_worker" and code.co_filename.endswith(os.path.join("futures", "thread.py")):
+        return True
+    caller = frame.f_back
+    return (code.co_name == "wait" and code.co_filename.endswith("threading.py")
+            and caller is not None and caller.f_code.co_name == "get" and caller.f_code.co_filename.endswith("queue.py"))
+
+class StackSampler:
+    """
+        A sampling profiler covering the event loop thread and the threads blocking work of the API runs on.
+        cProfile and pyinstrument only see the thread they are started on, which misses the ClickHouse
+        query, the row conversion and the JSON encoding of the data endpoint. Stacks are kept in the
+        folded format of flame graph tools. Work of concurrent requests on the same threads is included.
+    """
+    def __init__(self, interval: float, loop_thread_id: int):
+        self.interval = interval
+        self.loop_thread_id = loop_thread_id
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="profiler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def thread_names(self) -> Dict[int, str]:
+        names = {thread.ident: thread.name.rstrip("_0123456789") for thread in threading.enumerate()}
+        names[self.loop_thread_id] = "event loop"
+        return {ident: name for ident, name in names.items() if ident == self.loop_thread_id or name.startswith(PROFILED_THREAD_PREFIXES)}
+
+    def run(self):
+        names = self.thread_names()
+        while not self.stop_event.wait(self.interval):
+            # Pool threads come and go, refresh the list now and then rather than on every sample.
+            if self.samples % 100 == 99:
+                names = self.thread_names()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id not in names or (thread_id != self.loop_thread_id and is_idle(frame)):
+                    continue
+                if thread_id == self.loop_thread_id and is_waiting_for_events(frame):
+                    # The loop is waiting for I/O or for the executor, its own stack is of no interest.
+                    self.stacks["[event loop];(idle)"] += 1
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(f"[{names[thread_id]}]")
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+def top_functions(stacks: Dict[str, int], limit: int = TOP_ENTRIES) -> List[Dict]:
+    """
+        The functions that were running in the most samples (self), with the number of samples where
+        they were anywhere on the stack (total).
+    """
+    own, total = Counter(), Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for frame in set(frames[1:]):
+            total[frame] += count
+    ranked = sorted(own, key=lambda function: (own[function], total[function]), reverse=True)[:limit]
+    return [{"function": function, "self": own[function], "total": total[function]} for function in ranked]
+
+def top_allocations(snapshot: tracemalloc.Snapshot, limit: int = TOP_ENTRIES) -> List[Dict]:
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    return [
+        {"location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", "size_bytes": stat.size, "count": stat.count}
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+
+class ProfileSession:
+    """
+        The profile of a single request. Explicit profiles also trace allocations with tracemalloc,
+        sampled ones only sample stacks to keep their overhead low.
+    """
+    def __init__(self, request: Request, mode: str):
+        self.id = uuid4().hex
+        self.mode = mode
+        self.request = request
+        self.started_at = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        self.sampler = StackSampler(config.api_service.profiling_interval, threading.get_ident())
+        self.traces_allocations = mode == "explicit" and allocation_lock.acquire(blocking=False)
+        self.allocations = None
+        self.finished = False
+
+    def begin(self):
+        if self.traces_allocations:
+            tracemalloc.start()
+        self.sampler.start()
+
+    def snapshot_allocations(self):
+        """
+            Record the live allocations made by the request, called once the response is built.
+        """
+        if self.traces_allocations and self.allocations is None:
+            self.allocations = top_allocations(tracemalloc.take_snapshot())
+
+    def finish(self, status_code: int) -> Optional[Dict]:
+        if self.finished:
+            return None
+        self.finished = True
+        duration = time.perf_counter() - self.start
+        self.sampler.stop()
+        memory = None
+        if self.traces_allocations:
+            try:
+                self.snapshot_allocations()
+                memory = {"peak_bytes": tracemalloc.get_traced_memory()[1], "top_allocations": self.allocations}
+            finally:
+                tracemalloc.stop()
+                allocation_lock.release()
+
+        return {
+            "id": self.id,
+            "request_id": correlation_id.get(),
+            "mode": self.mode,
+            "method": self.request.method,
+            "path": self.request.url.path,
+            "query": self.request.url.query,
+            "status": status_code,
+            "started_at": self.started_at.isoformat(),
+            "duration_seconds": duration,
+            "interval_seconds": self.sampler.interval,
+            "samples": self.sampler.samples,
+            "top_functions": top_functions(self.sampler.stacks),
+            "memory": memory,
+            "stacks": dict(self.sampler.stacks),
+        }
+
+class ProfileStore:
+    """
+        Explicit profiles are written as JSON files to API_PROFILING_DIR. Sampled profiles are kept in
+        memory, only the API_PROFILING_KEEP_SLOWEST slowest of them.
+    """
+    def __init__(self, directory: str, keep_slowest: int):
+        self.directory = directory
+        self.keep_slowest = keep_slowest
+        self.slowest = []  # min-heap of (duration, id, profile)
+        self.lock = threading.Lock()
+
+    def path(self, profile_id: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}.json")
+
+    def save(self, profile: Dict):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.path(profile["id"]), "w") as f:
+                json.dump(profile, f)
+            logger.info(f"Stored profile {profile['id']} of {profile['method']} {profile['path']} ({profile['duration_seconds']:.3f}s)")
+        except Exception as e:
+            logger.error(f"Failed to store profile {profile['id']}: {e}")
+
+    def offer(self, profile: Dict):
+        with self.lock:
+            item = (profile["duration_seconds"], profile["id"], profile)
+            if len(self.slowest) < self.keep_slowest:
+                heapq.heappush(self.slowest, item)
+            elif self.slowest and item[0] > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, item)
+
+    def get(self, profile_id: str) -> Optional[Dict]:
+        with self.lock:
+            for _, stored_id, profile in self.slowest:
+                if stored_id == profile_id:
+                    return profile
+        # Ids are generated hex strings, anything else is not looked up on disk.
+        if not profile_id.isalnum():
+            return None
+        try:
+            with open(self.path(profile_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def list(self) -> Dict[str, List[Dict]]:
+        def summary(profile: Dict) -> Dict:
+            return {key: profile[key] for key in ("id", "mode", "method", "path", "status", "started_at", "duration_seconds")}
+
+        with self.lock:
+            slowest = [summary(profile) for _, _, profile in sorted(self.slowest, reverse=True)]
+        stored = []
+        if os.path.isdir(self.directory):
+            names = sorted(os.listdir(self.directory), key=lambda name: os.path.getmtime(os.path.join(self.directory, name)), reverse=True)
+            stored = [name[:-len(".json")] for name in names if name.endswith(".json")][:100]
+        return {"slowest": slowest, "stored": stored}
+
+def is_admin(token: Optional[str]) -> bool:
+    expected = config.api_service.profiling_token
+    return bool(expected and token and secrets.compare_digest(token, expected))
+
+def profiling_mode(request: Request) -> Optional[str]:
+    """
+        Return "explicit" when the request asks to be profiled, "sampled" when it was picked by the
+        always-on sampling, or None. Raises 403 when a non admin asks for a profile.
+    """
+    flag = request.headers.get("X-Profile") or request.query_params.get("profile")
+    if flag and flag.lower() in ("1", "true", "yes"):
+        if not is_admin(request.headers.get("X-Profile-Token")):
+            raise HTTPException(status_code=403, detail="Profiling is restricted to administrators")
+        return "explicit"
+    if config.api_service.profiling_sample_rate and random.random() < config.api_service.profiling_sample_rate:
+        return "sampled"
+    return None
+
+def require_admin(x_profile_token: Optional[str]):
+    if not is_admin(x_profile_token):
+        raise HTTPException(status_code=403, detail="Profiling is restricted to administrators")
+
+@router.get("")
+def list_profiles(x_profile_token: Optional[str] = Header(None)):
+    require_admin(x_profile_token)
+    return profile_store.list()
+
+@router.get("/{profile_id}")
+def get_profile(profile_id: str, x_profile_token: Optional[str] = Header(None)):
+    require_admin(x_profile_token)
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+    return profile
+
+@router.get("/{profile_id}/folded", response_class=PlainTextResponse)
+def get_profile_stacks(profile_id: str, x_profile_token: Optional[str] = Header(None)):
+    """
+        The sampled stacks in the folded format read by flamegraph.pl and speedscope.
+    """
+    require_admin(x_profile_token)
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+    return "".join(f"{stack} {count}\n" for stack, count in profile["stacks"].items())
+
+profile_store = ProfileStore(
+    directory=config.api_service.profiling_dir,
+    keep_slowest=config.api_service.profiling_keep_slowest
+)
@@ -1,21 +1,64 @@
-
 import time
+import asyncio
+import threading
 import structlog
 
+from contextlib import asynccontextmanager
 from typing import Literal
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
 from asgi_correlation_id import CorrelationIdMiddleware
 from asgi_correlation_id.middleware import is_valid_uuid4
+from starlette.datastructures import MutableHeaders
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from uuid import uuid4
+from opentelemetry import context as otel_context, trace
+from opentelemetry.propagate import extract
+from opentelemetry.trace import SpanKind, Status, StatusCode
 
+from app.config import config
 from app.api.v1 import (
-    data
+    data,
+    files,
+    profiling
 )
+from app.api.v1.limiter import limiter
+from app.api.v1.cache import listen_for_reloads
+from app.api.v1.profiling import ProfileSession, profiling_mode, profile_store
+from app.metrics import api_request_seconds, render_metrics
+from app.tracing import setup_tracing, tracer, current_request_id
+
+setup_tracing("data-studio-api")
 
-app = FastAPI(title="Data Studio API", version="1.0.0")
 logger = structlog.get_logger()
 
+async def evict_idle_clients():
+    while True:
+        await asyncio.sleep(config.clickhouse.pool_idle_timeout)
+        config.clickhouse.evict_idle()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the ClickHouse clients up front so the first requests do not pay for the handshake.
+    try:
+        await asyncio.to_thread(config.clickhouse.warm_up)
+    except Exception as e:
+        logger.error(f"Failed to warm up the ClickHouse client pool: {e}")
+    eviction_task = asyncio.create_task(evict_idle_clients())
+    # Invalidate cached dataset results when a connection finishes reloading its data.
+    stop_listener = threading.Event()
+    if config.api_service.cache_enabled:
+        threading.Thread(target=listen_for_reloads, args=(stop_listener,), daemon=True).start()
+    yield
+    stop_listener.set()
+    eviction_task.cancel()
+    limiter.shutdown()
+    config.clickhouse.close_pools()
+    config.database.close_pool()
+
+app = FastAPI(title="Data Studio API", version="1.0.0", lifespan=lifespan)
+
 @app.middleware("http")
 async def log_user_id(request: Request, call_next):
     user_id = request.headers.get("user-id", "unknown")
@@ -32,6 +75,101 @@ async def log_user_id(request: Request, call_next):
     )
     return response
 
+class ProfilingMiddleware:
+    """
+        Profile a request when an administrator asks for it with the X-Profile header or the profile query
+        flag, or when it is picked by the always-on sampling. The profile covers the streamed body too.
+        Explicit profiles are stored and their id returned in the X-Profile-Id header, sampled ones
+        are kept if they are among the slowest. A plain ASGI middleware, so the session is finished
+        when the app returns even if the body is never sent, e.g. when the client disconnects.
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request = Request(scope)
+        try:
+            mode = profiling_mode(request)
+        except HTTPException as e:
+            await JSONResponse({"detail": e.detail}, status_code=e.status_code)(scope, receive, send)
+            return
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        session = ProfileSession(request, mode)
+        status_code = 500
+
+        async def send_profiled(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                session.snapshot_allocations()
+                if mode == "explicit":
+                    MutableHeaders(scope=message).append("X-Profile-Id", session.id)
+            await send(message)
+
+        session.begin()
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            finish_profile(session, status_code)
+
+def finish_profile(session: ProfileSession, status_code: int):
+    profile = session.finish(status_code)
+    if profile is None:
+        return
+    if session.mode == "explicit":
+        profile_store.save(profile)
+    else:
+        profile_store.offer(profile)
+
+# Added before the correlation id middleware so it runs inside it and profiles carry the request id.
+app.add_middleware(ProfilingMiddleware)
+
+class TracingMiddleware(BaseHTTPMiddleware):
+    """
+        Run every request in a server span, continuing the trace of a caller sending a traceparent header.
+        The span is named after the route template and ends with the last chunk of a streamed body.
+    """
+    async def dispatch(self, request: Request, call_next):
+        current = tracer.start_span(
+            f"{request.method} {request.url.path}", context=extract(request.headers), kind=SpanKind.SERVER,
+            attributes={"http.request.method": request.method, "url.path": request.url.path, "request.id": current_request_id() or ""}
+        )
+        token = otel_context.attach(trace.set_span_in_context(current))
+        try:
+            response = await call_next(request)
+        except Exception as e:
+            current.record_exception(e)
+            current.set_status(Status(StatusCode.ERROR))
+            current.end()
+            raise
+        finally:
+            otel_context.detach(token)
+        route = request.scope.get("route")
+        if route is not None:
+            current.update_name(f"{request.method} {route.path}")
+            current.set_attribute("http.route", route.path)
+        current.set_attribute("http.response.status_code", response.status_code)
+        if response.status_code >= 500:
+            current.set_status(Status(StatusCode.ERROR))
+        response.body_iterator = traced_body(response.body_iterator, current)
+        return response
+
+async def traced_body(body_iterator, current):
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        current.end()
+
+# Also inside the correlation id middleware, so spans carry the request id.
+app.add_middleware(TracingMiddleware)
+
 app.add_middleware(
     CorrelationIdMiddleware,
     header_name="X-Request-ID",
@@ -47,12 +185,24 @@ class TimingMiddleware(BaseHTTPMiddleware):
         response = await call_next(request)
         process_time = time.time() - start_time
         response.headers["X-Process-Time"] = str(process_time)
+        # Label by route template rather than path to keep the number of series bounded.
+        route = request.scope.get("route")
+        api_request_seconds.labels(
+            method=request.method, route=getattr(route, "path", "unmatched"), status=response.status_code
+        ).observe(process_time)
         return response
 
 
 app.add_middleware(TimingMiddleware)
 
 app.include_router(data.router, prefix="/api/v1")
+app.include_router(files.router, prefix="/api/v1")
+app.include_router(profiling.router, prefix="/api/v1")
+
+@app.get("/metrics", include_in_schema=False)
+def metrics() -> Response:
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
 
 @app.get("/")
 def read_root() -> Literal["Service is running..."]:
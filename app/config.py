@@ -1,5 +1,9 @@
 import os
+import time
+import threading
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+from contextlib import contextmanager
 from pyhdfs import HdfsClient
 from clickhouse_connect import get_client
 from dotenv import load_dotenv
@@ -12,6 +16,14 @@ class Hadoop:
         self.namenode_port = os.getenv('HDFS_NAMENODE_PORT')
         self.web_port = os.getenv('HDFS_WEB_PORT')
         self.user = os.getenv('HDFS_USER')
+        self.listing_cache_ttl = float(os.getenv('HDFS_LISTING_CACHE_TTL', 30))
+        self.listing_cache_size = int(os.getenv('HDFS_LISTING_CACHE_SIZE', 512))
+        self.listing_prefetch = os.getenv('HDFS_LISTING_PREFETCH', 'false').lower() == 'true'
+        self.listing_prefetch_limit = int(os.getenv('HDFS_LISTING_PREFETCH_LIMIT', 20))
+        self.listing_prefetch_workers = int(os.getenv('HDFS_LISTING_PREFETCH_WORKERS', 4))
+        self.download_chunk_size = int(os.getenv('HDFS_DOWNLOAD_CHUNK_SIZE', 1024 * 1024))
+        self.output_chunk_size = int(os.getenv('HDFS_OUTPUT_CHUNK_SIZE', 64 * 1024 * 1024))
+        self.download_roots = [root.strip() for root in os.getenv('HDFS_DOWNLOAD_ROOTS', '/DataLake,/DeltaLake').split(',') if root.strip()]
 
     def get_connection(self):
         return HdfsClient(hosts=f"{self.host}:{self.web_port}", user_name={self.user})
@@ -24,6 +36,23 @@ class NiFi:
         self.password = os.getenv('NIFI_PASSWORD')
         self.root = os.getenv('NIFI_ROOT')
         self.sql_template_id = os.getenv('SQL_TEMPLATE_ID')
+        self.verify_ssl = os.getenv('NIFI_VERIFY_SSL', 'false').lower() == 'true'
+        self.pool_size = int(os.getenv('NIFI_POOL_SIZE', 10))
+        self.request_timeout = float(os.getenv('NIFI_REQUEST_TIMEOUT', 30))
+        self.max_retries = int(os.getenv('NIFI_MAX_RETRIES', 3))
+        self.retry_backoff = float(os.getenv('NIFI_RETRY_BACKOFF', 0.5))
+        self.retry_max_backoff = float(os.getenv('NIFI_RETRY_MAX_BACKOFF', 8))
+        self.token_refresh_margin = float(os.getenv('NIFI_TOKEN_REFRESH_MARGIN', 60))
+        self.service_enable_timeout = float(os.getenv('NIFI_SERVICE_ENABLE_TIMEOUT', 60))
+        self.service_poll_interval = float(os.getenv('NIFI_SERVICE_POLL_INTERVAL', 0.25))
+        self.service_poll_max_interval = float(os.getenv('NIFI_SERVICE_POLL_MAX_INTERVAL', 2))
+        self.monitor_min_interval = float(os.getenv('NIFI_MONITOR_MIN_INTERVAL', 2))
+        self.monitor_max_interval = float(os.getenv('NIFI_MONITOR_MAX_INTERVAL', 30))
+        self.monitor_backoff = float(os.getenv('NIFI_MONITOR_BACKOFF', 1.5))
+        self.monitor_quiet_polls = int(os.getenv('NIFI_MONITOR_QUIET_POLLS', 3))
+        self.monitor_idle_timeout = float(os.getenv('NIFI_MONITOR_IDLE_TIMEOUT', 300))
+        self.warm_pool_size = int(os.getenv('NIFI_WARM_POOL_SIZE', 0))
+        self.warm_pool_sources = [source.strip() for source in os.getenv('NIFI_WARM_POOL_SOURCES', 'Microsoft SQL Server').split(',') if source.strip()]
 
     def get_api_url(self):
         return f"https://{self.host}:{self.port}/nifi-api"
@@ -32,20 +61,174 @@ class Kafka:
     def __init__(self):
         self.host = os.getenv('KAFKA_HOST')
         self.port = os.getenv('KAFKA_PORT')
+        # sequential, parallel or multi_topic
+        self.ingestion_mode = os.getenv('KAFKA_INGESTION_MODE', 'sequential')
+        self.max_concurrent_queries = int(os.getenv('KAFKA_MAX_CONCURRENT_QUERIES', 4))
+        # full re-reads the topic and overwrites the dataset, incremental appends only new offsets
+        self.load_mode = os.getenv('KAFKA_LOAD_MODE', 'full')
+        self.checkpoint_root = os.getenv('KAFKA_CHECKPOINT_ROOT', '/Checkpoints/Kafka')
 
     def get_url(self):
         return f"{self.host}:{self.port}"
     
+class DeltaLake:
+    def __init__(self):
+        self.enabled = os.getenv('DELTA_SINK_ENABLED', 'false').lower() == 'true'
+        self.root = os.getenv('DELTA_SINK_ROOT', '/DeltaLake')
+        # delta or parquet
+        self.format = os.getenv('DELTA_SINK_FORMAT', 'delta')
+        self.compression = os.getenv('DELTA_SINK_COMPRESSION', 'snappy')
+        self.rows_per_file = int(os.getenv('DELTA_SINK_ROWS_PER_FILE', 1000000))
+        self.optimize = os.getenv('DELTA_SINK_OPTIMIZE', 'false').lower() == 'true'
+        self.schema_dir = os.getenv('DELTA_SCHEMA_DIR')
+        self.schema_sampling_ratio = float(os.getenv('DELTA_SCHEMA_SAMPLING_RATIO', 1.0))
+        self.package = os.getenv('DELTA_SPARK_PACKAGE', 'io.delta:delta-spark_2.12:3.2.0')
+
+    def uses_delta(self) -> bool:
+        return self.enabled and self.format == "delta"
+
+class Spark:
+    def __init__(self):
+        self.app_name = os.getenv('SPARK_APP_NAME', 'KafkaStreamProcessor')
+        self.fair_scheduler_file = os.getenv('SPARK_FAIR_SCHEDULER_FILE')
+
+class ClickHousePool:
+    """
+        A bounded pool of ClickHouse clients for a single database. Clients are checked out exclusively,
+        pinged before reuse when they have been idle for a while and closed once idle for too long.
+    """
+    def __init__(self, factory, size: int, idle_timeout: float, health_check_interval: float, acquire_timeout: float):
+        self.factory = factory
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self.idle = []  # (client, last_used) pairs, most recently used last
+        self.created = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        deadline = time.monotonic() + self.acquire_timeout
+        with self.condition:
+            while True:
+                self.evict_idle(locked=True)
+                if self.idle:
+                    client, last_used = self.idle.pop()
+                    break
+                if self.created < self.size:
+                    self.created += 1
+                    client, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Timed out waiting for a ClickHouse client after {self.acquire_timeout}s")
+                self.condition.wait(remaining)
+
+        try:
+            if client is None:
+                return self.factory()
+            if time.monotonic() - last_used > self.health_check_interval and not client.ping():
+                client.close()
+                return self.factory()
+            return client
+        except Exception:
+            with self.condition:
+                self.created -= 1
+                self.condition.notify()
+            raise
+
+    def release(self, client, discard: bool = False):
+        with self.condition:
+            if discard:
+                self.created -= 1
+                client.close()
+            else:
+                self.idle.append((client, time.monotonic()))
+            self.condition.notify()
+
+    def evict_idle(self, locked: bool = False):
+        if not locked:
+            with self.condition:
+                return self.evict_idle(locked=True)
+        now = time.monotonic()
+        expired = [client for client, last_used in self.idle if now - last_used > self.idle_timeout]
+        self.idle = [(client, last_used) for client, last_used in self.idle if now - last_used <= self.idle_timeout]
+        for client in expired:
+            self.created -= 1
+            client.close()
+
+    def close(self):
+        with self.condition:
+            for client, _ in self.idle:
+                client.close()
+            self.created -= len(self.idle)
+            self.idle = []
+
 class ClickHouse:
     def __init__(self):
         self.host = os.getenv('CLICKHOUSE_HOST')
         self.port = os.getenv('CLICKHOUSE_PORT')
         self.username = os.getenv('CLICKHOUSE_USERNAME')
         self.password = os.getenv('CLICKHOUSE_PASSWORD')
+        self.pool_size = int(os.getenv('CLICKHOUSE_POOL_SIZE', 8))
+        self.pool_idle_timeout = float(os.getenv('CLICKHOUSE_POOL_IDLE_TIMEOUT', 300))
+        self.pool_health_check_interval = float(os.getenv('CLICKHOUSE_POOL_HEALTH_CHECK_INTERVAL', 30))
+        self.pool_acquire_timeout = float(os.getenv('CLICKHOUSE_POOL_ACQUIRE_TIMEOUT', 30))
+        self.warm_databases = [db.strip() for db in os.getenv('CLICKHOUSE_WARM_DATABASES', '').split(',') if db.strip()]
+        self.publish_enabled = os.getenv('CLICKHOUSE_PUBLISH_ENABLED', 'false').lower() == 'true'
+        self.publish_batch_size = int(os.getenv('CLICKHOUSE_PUBLISH_BATCH_SIZE', 100000))
+        self.publish_visibility = os.getenv('CLICKHOUSE_PUBLISH_VISIBILITY', 'Private')
+        self.publish_retries = int(os.getenv('CLICKHOUSE_PUBLISH_RETRIES', 2))
+        self.publish_retry_backoff = float(os.getenv('CLICKHOUSE_PUBLISH_RETRY_BACKOFF', 10))
+        self.pools = {}
+        self.pools_lock = threading.Lock()
 
     def get_connection(self, database: str):
         return get_client(host=self.host, port=self.port, username=self.username, password=self.password, database=database)
 
+    def get_pool(self, database: str) -> ClickHousePool:
+        with self.pools_lock:
+            if database not in self.pools:
+                self.pools[database] = ClickHousePool(
+                    lambda: self.get_connection(database),
+                    size=self.pool_size,
+                    idle_timeout=self.pool_idle_timeout,
+                    health_check_interval=self.pool_health_check_interval,
+                    acquire_timeout=self.pool_acquire_timeout
+                )
+            return self.pools[database]
+
+    def acquire(self, database: str):
+        return self.get_pool(database).acquire()
+
+    def release(self, database: str, client, discard: bool = False):
+        self.get_pool(database).release(client, discard)
+
+    @contextmanager
+    def connection(self, database: str):
+        client = self.acquire(database)
+        try:
+            yield client
+        except Exception:
+            self.release(database, client, discard=not client.ping())
+            raise
+        else:
+            self.release(database, client)
+
+    def warm_up(self):
+        for database in self.warm_databases:
+            self.release(database, self.acquire(database))
+
+    def evict_idle(self):
+        for pool in list(self.pools.values()):
+            pool.evict_idle()
+
+    def close_pools(self):
+        with self.pools_lock:
+            for pool in self.pools.values():
+                pool.close()
+            self.pools = {}
+
 class Database:
     def __init__(self):
         self.host = os.getenv('DATABASE_HOST')
@@ -53,26 +236,117 @@ class Database:
         self.username = os.getenv('DATABASE_USER')
         self.password = os.getenv('DATABASE_PASSWORD')
         self.dbname = os.getenv('DATABASE_NAME')
+        self.pool_min_size = int(os.getenv('DATABASE_POOL_MIN_SIZE', 1))
+        self.pool_max_size = int(os.getenv('DATABASE_POOL_MAX_SIZE', 10))
+        self.pool_acquire_timeout = float(os.getenv('DATABASE_POOL_ACQUIRE_TIMEOUT', 30))
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        # ThreadedConnectionPool raises instead of waiting when it is exhausted, so callers queue here.
+        self.pool_slots = threading.BoundedSemaphore(self.pool_max_size)
 
     def get_connection(self):
         return psycopg2.connect(dbname=self.dbname, host=self.host, user=self.username, password=self.password, port=self.port)
+
+    def get_pool(self) -> ThreadedConnectionPool:
+        with self.pool_lock:
+            if self.pool is None:
+                self.pool = ThreadedConnectionPool(
+                    self.pool_min_size, self.pool_max_size,
+                    dbname=self.dbname, host=self.host, user=self.username, password=self.password, port=self.port
+                )
+            return self.pool
+
+    def acquire(self):
+        if not self.pool_slots.acquire(timeout=self.pool_acquire_timeout):
+            raise TimeoutError(f"Timed out waiting for a database connection after {self.pool_acquire_timeout}s")
+        try:
+            pool = self.get_pool()
+            conn = pool.getconn()
+            if conn.closed:
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+            return conn
+        except Exception:
+            self.pool_slots.release()
+            raise
+
+    def release(self, conn, discard: bool = False):
+        try:
+            self.get_pool().putconn(conn, close=discard or bool(conn.closed))
+        finally:
+            self.pool_slots.release()
+
+    def close_pool(self):
+        with self.pool_lock:
+            if self.pool is not None:
+                self.pool.closeall()
+                self.pool = None
     
 class APIService:
     def __init__(self):
         self.host = os.getenv('API_SERVER_URL')
         self.port = os.getenv('API_SERVER_PORT')
+        self.query_workers = int(os.getenv('API_QUERY_WORKERS', 32))
+        self.database_concurrency = int(os.getenv('API_DATABASE_CONCURRENCY', 4))
+        self.database_queue_size = int(os.getenv('API_DATABASE_QUEUE_SIZE', 16))
+        self.queue_timeout = float(os.getenv('API_QUEUE_TIMEOUT', 10))
+        self.retry_after = int(os.getenv('API_RETRY_AFTER', 5))
+        # Rows returned by a buffered JSON request without a limit, larger results are paged or streamed.
+        self.default_limit = int(os.getenv('API_DEFAULT_LIMIT', 10000))
+        self.cache_enabled = os.getenv('API_CACHE_ENABLED', 'true').lower() == 'true'
+        self.cache_max_entries = int(os.getenv('API_CACHE_MAX_ENTRIES', 256))
+        self.cache_max_bytes = int(os.getenv('API_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+        self.cache_max_entry_bytes = int(os.getenv('API_CACHE_MAX_ENTRY_BYTES', 32 * 1024 * 1024))
+        self.cache_ttl = float(os.getenv('API_CACHE_TTL', 60))
+        self.cache_spill_dir = os.getenv('API_CACHE_SPILL_DIR') or None
+        # Request profiling is only available to callers sending this token, and disabled when it is empty.
+        self.profiling_token = os.getenv('API_PROFILING_TOKEN') or None
+        self.profiling_dir = os.getenv('API_PROFILING_DIR', '/tmp/data-studio-profiles')
+        self.profiling_interval = float(os.getenv('API_PROFILING_INTERVAL', 0.002))
+        # Fraction of requests profiled by the always-on sampling, of which the slowest are kept.
+        self.profiling_sample_rate = float(os.getenv('API_PROFILING_SAMPLE_RATE', 0))
+        self.profiling_keep_slowest = int(os.getenv('API_PROFILING_KEEP_SLOWEST', 10))
 
     def get_api_url(self):
         return f"http://{self.host}:{self.port}"
 
+class Jobs:
+    def __init__(self):
+        self.enabled = os.getenv('JOBS_ENABLED', 'false').lower() == 'true'
+        self.worker_processes = int(os.getenv('JOBS_WORKER_PROCESSES', 2))
+        self.worker_slots = int(os.getenv('JOBS_WORKER_SLOTS', 4))
+        self.poll_interval = float(os.getenv('JOBS_POLL_INTERVAL', 2))
+        self.heartbeat_interval = float(os.getenv('JOBS_HEARTBEAT_INTERVAL', 10))
+        self.stale_timeout = float(os.getenv('JOBS_STALE_TIMEOUT', 60))
+        self.recovery_interval = float(os.getenv('JOBS_RECOVERY_INTERVAL', 30))
+        self.max_attempts = int(os.getenv('JOBS_MAX_ATTEMPTS', 3))
+        # job type -> (max running overall, max running per source type)
+        self.limits = {
+            "kafka_to_hadoop": (int(os.getenv('JOBS_MAX_RUNNING', 4)), int(os.getenv('JOBS_MAX_RUNNING_PER_SOURCE', 2))),
+            "monitor_flow": (int(os.getenv('JOBS_MAX_MONITORS', 100)), int(os.getenv('JOBS_MAX_MONITORS_PER_SOURCE', 100))),
+        }
+
+class Tracing:
+    def __init__(self):
+        self.enabled = os.getenv('TRACING_ENABLED', 'false').lower() == 'true'
+        # file writes JSON spans to TRACING_FILE_DIR, otlp sends them to a collector over HTTP.
+        self.exporter = os.getenv('TRACING_EXPORTER', 'file').lower()
+        self.otlp_endpoint = os.getenv('TRACING_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+        self.file_dir = os.getenv('TRACING_FILE_DIR', '/tmp/data-studio-traces')
+        self.sample_ratio = float(os.getenv('TRACING_SAMPLE_RATIO', 1.0))
+
 class Config:
     def __init__(self):
         self.hadoop = Hadoop()
         self.nifi = NiFi()
         self.kafka = Kafka()
+        self.spark = Spark()
+        self.delta = DeltaLake()
+        self.jobs = Jobs()
         self.clickhouse = ClickHouse()
         self.database = Database()
         self.api_service = APIService()
+        self.tracing = Tracing()
         self.debug_mode = False
 
 config = Config()
\ No newline at end of file
@@ -0,0 +1,241 @@
+import re
+import json
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+from clickhouse_connect.driver.binding import quote_identifier
+from structlog import get_logger
+
+logger = get_logger()
+
+FILTER_OPERATORS = {
+    "eq": "=",
+    "ne": "!=",
+    "gt": ">",
+    "gte": ">=",
+    "lt": "<",
+    "lte": "<=",
+    "like": "LIKE",
+    "in": "IN",
+}
+
+AGGREGATE_FUNCTIONS = ("count", "sum", "avg", "min", "max", "uniq")
+AGGREGATE_PATTERN = re.compile(r"^(\w+)\((\*|[^()]+)\)$")
+
+@dataclass
+class TableQuery:
+    """
+        The projection, filters, ordering, aggregation and sampling requested for a table.
+    """
+    columns: List[str] = field(default_factory=list)
+    filters: List[Tuple[str, str, str]] = field(default_factory=list)  # (column, operator, value)
+    order_by: List[Tuple[str, bool]] = field(default_factory=list)  # (column, descending)
+    group_by: List[str] = field(default_factory=list)
+    aggregates: List[Tuple[str, str]] = field(default_factory=list)  # (function, column or *)
+    sample: Optional[float] = None
+
+    @property
+    def is_aggregate(self) -> bool:
+        return bool(self.group_by or self.aggregates)
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.columns or self.filters or self.order_by or self.is_aggregate or self.sample)
+
+    @staticmethod
+    def parse(columns: Optional[str] = None, where: Optional[List[str]] = None, order_by: Optional[str] = None,
+              group_by: Optional[str] = None, aggregate: Optional[str] = None, sample: Optional[float] = None) -> "TableQuery":
+        """
+            Parse the query string syntax of the data API:
+            columns=a,b  where=col:op:value  order_by=a,-b  group_by=a  aggregate=sum(b),count(*)  sample=0.1
+        """
+        def split(value: Optional[str]) -> List[str]:
+            return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+        filters = []
+        for condition in where or []:
+            parts = condition.split(":", 2)
+            if len(parts) != 3 or parts[1] not in FILTER_OPERATORS:
+                raise ValueError(f"Invalid filter '{condition}', expected column:operator:value with operator in {', '.join(FILTER_OPERATORS)}")
+            filters.append((parts[0], parts[1], parts[2]))
+
+        aggregates = []
+        for expression in split(aggregate):
+            match = AGGREGATE_PATTERN.match(expression)
+            if not match or match.group(1).lower() not in AGGREGATE_FUNCTIONS:
+                raise ValueError(f"Invalid aggregate '{expression}', expected one of {', '.join(AGGREGATE_FUNCTIONS)} applied to a column")
+            function, column = match.group(1).lower(), match.group(2).strip()
+            if column == "*" and function != "count":
+                raise ValueError("Only count can be applied to *")
+            aggregates.append((function, column))
+
+        if sample is not None and not 0 < sample <= 1:
+            raise ValueError("sample must be a fraction between 0 and 1")
+
+        return TableQuery(
+            columns=split(columns),
+            filters=filters,
+            order_by=[(item.lstrip("-"), item.startswith("-")) for item in split(order_by)],
+            group_by=split(group_by),
+            aggregates=aggregates,
+            sample=sample
+        )
+
+def aggregate_alias(function: str, column: str) -> str:
+    return function if column == "*" else f"{function}_{column}"
+
+def get_table_columns(client, database: str, table: str) -> List[Tuple[str, str, bool]]:
+    """
+        Return the (name, type, is_in_primary_key) of every column of a table, in table order.
+    """
+    result = client.query(
+        """
+            SELECT name, type, is_in_primary_key FROM system.columns
+            WHERE database = {database:String} AND table = {table:String}
+            ORDER BY position
+        """,
+        parameters={"database": database, "table": table}
+    )
+    return [(name, column_type, bool(in_key)) for name, column_type, in_key in result.result_rows]
+
+def get_primary_key(table_columns: List[Tuple[str, str, bool]]) -> Optional[Tuple[str, str]]:
+    """
+        Return the (name, type) of the single column primary key of a table, or None if the table
+        has no primary key or a composite one.
+    """
+    key_columns = [(name, column_type) for name, column_type, in_key in table_columns if in_key]
+    return key_columns[0] if len(key_columns) == 1 else None
+
+def has_sampling_key(client, database: str, table: str) -> bool:
+    result = client.query(
+        "SELECT sampling_key FROM system.tables WHERE database = {database:String} AND name = {table:String}",
+        parameters={"database": database, "table": table}
+    )
+    return bool(result.result_rows and result.result_rows[0][0])
+
+def build_select_query(database: str, table: str, limit: Optional[int] = None, offset: int = 0,
+                       key: Optional[Tuple[str, str]] = None, after: Optional[str] = None,
+                       table_query: Optional[TableQuery] = None,
+                       column_types: Optional[Dict[str, str]] = None) -> Tuple[str, Dict]:
+    """
+        Build a parameterized SELECT for a table with optional projection, filters, aggregation, sampling
+        and limit/offset or keyset pagination. The database and table names are bound as identifiers and
+        every column name is checked against the table's columns from system.columns before it is quoted
+        into the query, so nothing from the request is interpolated as SQL. Filter values are bound with
+        the column's own type. Raises ValueError for unknown columns or invalid combinations.
+    """
+    table_query = table_query or TableQuery()
+    column_types = column_types or {}
+    parameters = {"database": database, "table": table}
+
+    def column(name: str) -> str:
+        if name not in column_types:
+            raise ValueError(f"Unknown column '{name}' in {database}.{table}")
+        return quote_identifier(name)
+
+    if table_query.is_aggregate:
+        if after is not None:
+            raise ValueError("Keyset pagination cannot be combined with group_by or aggregate")
+        if table_query.columns:
+            raise ValueError("columns cannot be combined with group_by or aggregate, the output columns are the groups and aggregates")
+        select = [column(name) for name in table_query.group_by]
+        for function, name in table_query.aggregates:
+            argument = "" if name == "*" else column(name)
+            select.append(f"{function}({argument}) AS {quote_identifier(aggregate_alias(function, name))}")
+        output_columns = set(table_query.group_by) | {aggregate_alias(function, name) for function, name in table_query.aggregates}
+    else:
+        select = [column(name) for name in table_query.columns] or ["*"]
+        output_columns = set(column_types)
+
+    query = f"SELECT {', '.join(select)} FROM {{database:Identifier}}.{{table:Identifier}}"
+    if table_query.sample:
+        query += " SAMPLE {sample:Float64}"
+        parameters["sample"] = table_query.sample
+
+    # The column types come from system.columns, so they are safe to place in the query.
+    conditions = []
+    for index, (name, operator, value) in enumerate(table_query.filters):
+        if operator == "in":
+            placeholders = []
+            for item_index, item in enumerate(value.split("|")):
+                parameters[f"w{index}_{item_index}"] = item
+                placeholders.append(f"{{w{index}_{item_index}:{column_types.get(name)}}}")
+            conditions.append(f"{column(name)} IN ({', '.join(placeholders)})")
+        else:
+            value_type = "String" if operator == "like" else column_types.get(name)
+            parameters[f"w{index}"] = value
+            conditions.append(f"{column(name)} {FILTER_OPERATORS[operator]} {{w{index}:{value_type}}}")
+
+    order_by = []
+    if key and not table_query.is_aggregate:
+        key_name, key_type = key
+        if after is not None:
+            if table_query.order_by:
+                raise ValueError("Keyset pagination cannot be combined with order_by")
+            conditions.append(f"{quote_identifier(key_name)} > {{after:{key_type}}}")
+            parameters["after"] = after
+        if not table_query.order_by:
+            order_by.append(quote_identifier(key_name))
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if table_query.group_by:
+        query += " GROUP BY " + ", ".join(column(name) for name in table_query.group_by)
+
+    for name, descending in table_query.order_by:
+        if name not in output_columns:
+            raise ValueError(f"Cannot order by '{name}', it is not part of the output")
+        order_by.append(quote_identifier(name) + (" DESC" if descending else ""))
+    if order_by:
+        query += " ORDER BY " + ", ".join(order_by)
+
+    if limit is not None:
+        query += " LIMIT {limit:UInt64}"
+        parameters["limit"] = limit
+    if offset and after is None:
+        query += " OFFSET {offset:UInt64}"
+        parameters["offset"] = offset
+
+    return query, parameters
+
+def stream_json_rows(client, query: str, parameters: Dict, output_format: str = "ndjson") -> Iterator[str]:
+    """
+        Stream rows block by block from ClickHouse as NDJSON lines or as chunks of a JSON array.
+        Only one block is held in memory at a time.
+    """
+    row_count = 0
+    try:
+        if output_format == "json":
+            yield "["
+        with client.query_row_block_stream(query, parameters=parameters) as stream:
+            columns = stream.source.column_names
+            for block in stream:
+                if output_format == "json":
+                    chunk = ",".join(json.dumps(dict(zip(columns, row)), default=str) for row in block)
+                    yield ("," if row_count else "") + chunk
+                else:
+                    yield "".join(json.dumps(dict(zip(columns, row)), default=str) + "\n" for row in block)
+                row_count += len(block)
+        if output_format == "json":
+            yield "]"
+        logger.info(f"Module:ClickHouseController. Streamed {row_count} records.")
+    except Exception as e:
+        # The response has already started, re-raising aborts it so the client sees a truncated body rather than a complete one.
+        logger.error(f"Module:ClickHouseController. Failed while streaming records after {row_count} rows: {e}")
+        raise
+
+def stream_raw_format(client, query: str, parameters: Dict, clickhouse_format: str, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+    """
+        Stream the bytes of a query rendered by ClickHouse in a native output format
+        (ArrowStream, Parquet, CSVWithNames, ...) without decoding rows in Python.
+    """
+    byte_count = 0
+    try:
+        with client.raw_stream(query, parameters=parameters, fmt=clickhouse_format) as raw:
+            for chunk in iter(lambda: raw.read(chunk_size), b""):
+                byte_count += len(chunk)
+                yield chunk
+        logger.info(f"Module:ClickHouseController. Streamed {byte_count} bytes in {clickhouse_format} format.")
+    except Exception as e:
+        # The response has already started, re-raising aborts it so the client sees a truncated body rather than a complete one.
+        logger.error(f"Module:ClickHouseController. Failed while streaming {clickhouse_format} output after {byte_count} bytes: {e}")
+        raise
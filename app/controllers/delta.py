@@ -0,0 +1,107 @@
+import os
+import json
+import math
+from functools import reduce
+from typing import Optional
+from structlog import get_logger
+from pyspark.sql import DataFrame
+from pyspark.sql.functions import col, date_format, lit
+from pyspark.sql.types import StructType
+
+from app.controllers.hadoop import get_hdfs_path, invalidate_hdfs_directory
+from app.config import config
+
+logger = get_logger()
+
+def load_registered_schema(dataset_name: str) -> Optional[StructType]:
+    '''
+    Return the schema registered for a dataset as a Spark StructType JSON file in DELTA_SCHEMA_DIR, if any.
+    '''
+    if not config.delta.schema_dir:
+        return None
+    schema_file = os.path.join(config.delta.schema_dir, f"{dataset_name}.json")
+    if not os.path.exists(schema_file):
+        return None
+    with open(schema_file) as f:
+        return StructType.fromJson(json.load(f))
+
+def parse_payload(json_df: DataFrame, dataset_name: str) -> DataFrame:
+    '''
+    Parse the raw JSON values of a batch into typed columns.
+    Each value may be a single record or a JSON array of records (as written by NiFi), and
+    Debezium change events are unwrapped to the row state after the change; deletes are skipped.
+    When the batch has the Kafka timestamp of its values, every record gets the ingest_date of that
+    timestamp, the date partition used by the JSON layer for the same record.
+    '''
+    spark = json_df.sparkSession
+    read_values = lambda df: df.select("value").rdd.map(lambda row: row.value)
+    schema = load_registered_schema(dataset_name)
+    if schema is None:
+        schema = spark.read.option("samplingRatio", config.delta.schema_sampling_ratio).json(read_values(json_df)).schema
+
+    extra_columns = []
+    if "timestamp" in json_df.columns:
+        # A value may hold several records, so the date is attached per value before parsing, one date at a time.
+        dated_df = json_df.withColumn("ingest_date", date_format(col("timestamp"), "yyyy-MM-dd"))
+        dates = sorted(row.ingest_date for row in dated_df.select("ingest_date").distinct().collect())
+        records = reduce(DataFrame.unionByName, [
+            spark.read.schema(schema).json(read_values(dated_df.filter(col("ingest_date") == ingest_date))).withColumn("ingest_date", lit(ingest_date))
+            for ingest_date in dates
+        ]) if dates else spark.createDataFrame([], schema)
+        extra_columns = ["ingest_date"] if dates else []
+    else:
+        records = spark.read.schema(schema).json(read_values(json_df))
+
+    if "payload" in records.columns:
+        records = records.select("payload.*", *extra_columns)
+    if "after" in records.columns and "op" in records.columns:
+        records = records.filter(col("op") != "d").select("after.*", *extra_columns)
+    return records
+
+def write_delta_sink(json_df: DataFrame, topic_prefix: str, dataset_name: str, mode: str = "overwrite",
+                     app_id: Optional[str] = None, batch_id: Optional[int] = None) -> bool:
+    '''
+    This function writes a batch of raw JSON values as a compressed Delta or Parquet table under the
+    Delta Lake root, partitioned by the ingest date of the Kafka timestamp of each record. Output files
+    are sized by DELTA_SINK_ROWS_PER_FILE, and Delta tables are compacted with OPTIMIZE after the write
+    when DELTA_SINK_OPTIMIZE is set.
+
+    Appends of a streaming batch pass its app_id and batch_id, which Delta records with the commit, so a
+    batch replayed after a crash between this write and the checkpoint is skipped instead of appended twice.
+    Parquet has no such log and is at-least-once: a replayed batch is appended again.
+    '''
+    folder_path = f"{config.delta.root}/{topic_prefix}/{dataset_name}"
+    try:
+        logger.info(f"Module:DeltaController. Start writing {config.delta.format} table: {folder_path}")
+        records = parse_payload(json_df, dataset_name)
+        records.persist()
+        try:
+            row_count = records.count()
+            if row_count == 0:
+                return True
+            files = max(1, math.ceil(row_count / config.delta.rows_per_file))
+            hdfs_path = get_hdfs_path(folder_path)
+
+            writer = records.repartition(files) \
+                .write.format(config.delta.format) \
+                .mode(mode) \
+                .option("compression", config.delta.compression) \
+                .partitionBy("ingest_date")
+            if config.delta.format == "delta":
+                # Schema evolution only applies to Delta, Parquet writes ignore mergeSchema.
+                writer = writer.option("mergeSchema", "true")
+                if app_id is not None and batch_id is not None:
+                    writer = writer.option("txnAppId", app_id).option("txnVersion", batch_id)
+            writer.save(hdfs_path)
+
+            if config.delta.format == "delta" and config.delta.optimize:
+                records.sparkSession.sql(f"OPTIMIZE delta.`{hdfs_path}`")
+        finally:
+            records.unpersist()
+
+        invalidate_hdfs_directory(folder_path)
+        logger.info(f"Module:DeltaController. Finished writing {row_count} rows to {config.delta.format} table: {folder_path}")
+        return True
+    except Exception as e:
+        logger.error(f"Module:DeltaController. Failed to write {config.delta.format} table: {folder_path}. {str(e)}")
+        return False
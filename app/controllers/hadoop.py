@@ -1,47 +1,251 @@
 import os
 import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from pyhdfs import HdfsFileNotFoundException
 from structlog import get_logger
 
 from app.config import config
+from app.models.repository import transaction, listen
+from app.tracing import tracer, traced, span
 
 logger = get_logger()
 
+# Postgres NOTIFY channel carrying the paths written by the ingestion workers to the Streamlit process.
+HDFS_INVALIDATION_CHANNEL = "hdfs_invalidation"
+
+# Written by the ingestion output layer in every dataset folder, lists its files with row counts and sizes.
+MANIFEST_FILE = "_manifest.json"
+
 def get_hdfs_path(folder_path: str):
     return f"hdfs://{config.hadoop.host}:{config.hadoop.namenode_port}{folder_path}"
 
-def get_list_hdfs_directory(path):
+class ListingCache:
+    """
+        A TTL and LRU bounded cache of HDFS directory listings keyed by path, shared by every page
+        of the Streamlit process so reruns do not go back to the NameNode.
+    """
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # path -> (expires_at, listing)
+        self.lock = threading.Lock()
+
+    def get(self, path: str):
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[path]
+                return None
+            self.entries.move_to_end(path)
+            return entry[1]
+
+    def put(self, path: str, listing):
+        with self.lock:
+            self.entries[path] = (time.monotonic() + self.ttl, listing)
+            self.entries.move_to_end(path)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, path: str):
+        """
+            Drop the listing of a path, of everything below it and of its parent directory.
+        """
+        path = path.rstrip("/") or "/"
+        parent = path.rsplit("/", 1)[0] or "/"
+        with self.lock:
+            for cached_path in list(self.entries):
+                if cached_path in (path, parent) or cached_path.startswith(path + "/"):
+                    del self.entries[cached_path]
+
+listing_cache = ListingCache(ttl=config.hadoop.listing_cache_ttl, max_entries=config.hadoop.listing_cache_size)
+listener_lock = threading.Lock()
+listener_started = False
+prefetch_executor = ThreadPoolExecutor(max_workers=config.hadoop.listing_prefetch_workers, thread_name_prefix="hdfs-prefetch")
+
+def list_hdfs_directory(path):
+    dfs = config.hadoop.get_connection()
+    with span("hdfs.list_status", path=path) as current:
+        files = dfs.list_status(path)
+        current.set_attribute("entries", len(files))
+    return sorted(
+        [
+            {
+                "name": f["pathSuffix"],
+                "type": "Folder" if f["type"] == "DIRECTORY" else "File",
+                "size_kb": round(f.get("length", 0) / 1024, 2),
+                "mod_time": datetime.fromtimestamp(f["modificationTime"] / 1000).strftime("%d %b %Y, %H:%M %p")
+            }
+            for f in files
+        ],
+        key=lambda x: (x["type"] != "Folder", x["name"])  # Sort: folders first, then files
+    )
+
+def read_manifest(folder_path, use_cache: bool = True):
+    """
+        This function returns the manifest of a dataset folder written by the ingestion output layer,
+        or None if the folder has no manifest. Missing manifests are cached too, unless the manifest
+        is being replaced by write_manifest.
+    """
+    manifest_path = f"{folder_path.rstrip('/')}/{MANIFEST_FILE}"
+    manifest = listing_cache.get(manifest_path) if use_cache else None
+    if manifest is None:
+        dfs = config.hadoop.get_connection()
+        with span("hdfs.read_manifest", path=manifest_path):
+            try:
+                with dfs.open(manifest_path) as f:
+                    manifest = json.loads(f.read())
+            except HdfsFileNotFoundException:
+                # WebHDFS cannot rename over a file, so between the delete and the rename of write_manifest
+                # only its temporary file exists. The folder is listed from the NameNode until it is renamed.
+                if dfs.exists(f"{manifest_path}.tmp"):
+                    return None
+                manifest = {}
+        listing_cache.put(manifest_path, manifest)
+    return manifest or None
+
+@traced("hdfs.write_manifest")
+def write_manifest(folder_path, manifest):
+    """
+        This function replaces the manifest of a dataset folder. The new manifest is written next to the
+        old one first, so a failed write never leaves a truncated manifest behind. Readers that look up
+        the manifest before the rename see the temporary file and do not cache the miss.
+    """
+    dfs = config.hadoop.get_connection()
+    manifest_path = f"{folder_path.rstrip('/')}/{MANIFEST_FILE}"
+    temp_path = f"{manifest_path}.tmp"
+    dfs.create(temp_path, json.dumps(manifest, indent=2).encode("utf-8"), overwrite=True)
+    dfs.delete(manifest_path)
+    dfs.rename(temp_path, manifest_path)
+    invalidate_hdfs_directory(folder_path)
+
+def manifest_listing(manifest):
+    """
+        This function builds a directory listing from a manifest. Files below a sub folder
+        (such as ingest date partitions) are grouped into a single folder entry.
+    """
+    files, folders = [], {}
+    for entry in manifest["files"]:
+        folder, _, name = entry["path"].rpartition("/")
+        mod_time = datetime.fromtimestamp(entry["modification_time"] / 1000).strftime("%d %b %Y, %H:%M %p")
+        if folder:
+            top_folder = folder.split("/")[0]
+            folders[top_folder] = {"name": top_folder, "type": "Folder", "size_kb": 0, "mod_time": mod_time}
+        else:
+            files.append({
+                "name": name,
+                "type": "File",
+                "size_kb": round(entry["bytes"] / 1024, 2),
+                "mod_time": mod_time,
+                "rows": entry["rows"]
+            })
+    return sorted(folders.values(), key=lambda x: x["name"]) + sorted(files, key=lambda x: x["name"])
+
+def load_hdfs_directory(path):
+    """
+        List a directory from its manifest when it has one, otherwise from the NameNode.
+    """
+    manifest = read_manifest(path)
+    if manifest:
+        return manifest_listing(manifest)
+    return list_hdfs_directory(path)
+
+def prefetch_hdfs_directory(path):
+    try:
+        if listing_cache.get(path) is None:
+            listing_cache.put(path, load_hdfs_directory(path))
+    except Exception as e:
+        logger.warning(f"Module:HadoopController. Failed to prefetch directory list of {path}: {e}")
+
+def get_list_hdfs_directory(path, use_cache: bool = True):
     """
         This function retrieves a list of files and folders along with their metadata from a Hadoop directory.
+        Dataset folders are listed from their manifest. Listings are served from the shared listing
+        cache while fresh, and child directories are optionally prefetched in the background.
     """
+    start_invalidation_listener()
     try:
-        dfs = config.hadoop.get_connection()
-        files = dfs.list_status(path)
-        return sorted(
-            [
-                {
-                    "name": f["pathSuffix"],
-                    "type": "Folder" if f["type"] == "DIRECTORY" else "File",
-                    "size_kb": round(f.get("length", 0) / 1024, 2),
-                    "mod_time": datetime.fromtimestamp(f["modificationTime"] / 1000).strftime("%d %b %Y, %H:%M %p")
-                }
-                for f in files
-            ],
-            key=lambda x: (x["type"] != "Folder", x["name"])  # Sort: folders first, then files
-        )
+        files = listing_cache.get(path) if use_cache else None
+        if files is None:
+            files = load_hdfs_directory(path)
+            listing_cache.put(path, files)
+
+            if config.hadoop.listing_prefetch:
+                folders = [f["name"] for f in files if f["type"] == "Folder"]
+                for folder in folders[:config.hadoop.listing_prefetch_limit]:
+                    prefetch_executor.submit(prefetch_hdfs_directory, f"{path.rstrip('/')}/{folder}")
+        return files
     except Exception as e:
         logger.error(f"Module:HadoopController. Error getting directory list from Hadoop: {e}")
 
-def fetch_file_bytes(file_path):
+def invalidate_hdfs_directory(path):
+    """
+        Drop cached listings affected by a write or rename under the given path. With JOBS_ENABLED the
+        writes run on the ingestion workers, so the path is also published to the Streamlit process.
+    """
+    listing_cache.invalidate(path)
+    if config.jobs.enabled:
+        try:
+            with transaction() as cursor:
+                cursor.execute("SELECT pg_notify(%s, %s);", (HDFS_INVALIDATION_CHANNEL, path))
+        except Exception as e:
+            logger.warning(f"Module:HadoopController. Failed to publish the invalidation of {path}, other processes rely on the TTL: {e}")
+
+def start_invalidation_listener():
+    """
+        Start listening, once per process, for the paths written by the ingestion workers.
+    """
+    global listener_started
+    if not config.jobs.enabled:
+        return
+    with listener_lock:
+        if listener_started:
+            return
+        listener_started = True
+    threading.Thread(target=listen, args=(HDFS_INVALIDATION_CHANNEL, listing_cache.invalidate, threading.Event()),
+                     name="hdfs-invalidation", daemon=True).start()
+
+@traced("hdfs.get_file_status")
+def get_file_size(file_path):
+    """
+        This function returns the size in bytes of a Hadoop file, or None if the path is not a file.
+    """
+    dfs = config.hadoop.get_connection()
+    status = dfs.get_file_status(file_path)
+    if status.type != "FILE":
+        return None
+    return status.length
+
+def stream_file_range(file_path, offset: int, length: int, chunk_size: int = 1024 * 1024):
     """
-        This function read the whole file from the Hadoop directory.
+        This function streams a byte range of a Hadoop file through WebHDFS OPEN in fixed-size chunks,
+        so the whole file never has to be held in memory.
     """
+    sent = 0
+    # Not made the current span, a generator is resumed in whatever context iterates it.
+    current = tracer.start_span("hdfs.open", attributes={"path": file_path, "offset": offset, "length": length})
     try:
         dfs = config.hadoop.get_connection()
-        with dfs.open(file_path) as f:
-            return f.read()
+        with dfs.open(file_path, offset=offset, length=length, buffersize=chunk_size) as f:
+            while sent < length:
+                chunk = f.read(min(chunk_size, length - sent))
+                if not chunk:
+                    raise IOError(f"File ended after {sent} of {length} bytes")
+                sent += len(chunk)
+                yield chunk
     except Exception as e:
-        logger.error(f"Module:HadoopController. Failed to fetch the file {file_path}: {e}")
+        # The response has already started with its Content-Length, re-raising aborts it rather than serving a short file.
+        current.record_exception(e)
+        logger.error(f"Module:HadoopController. Failed to stream the file {file_path} after {sent} bytes: {e}")
+        raise
+    finally:
+        current.set_attribute("bytes", sent)
+        current.end()
 
 def string_to_json(data: str):
     # If data contains full block of data
@@ -72,7 +276,7 @@ def fetch_head_from_file(file_path, max_bytes=1024 * 500):
     try:
         extension = os.path.splitext(file_path)[-1].lower()
         dfs = config.hadoop.get_connection()
-        with dfs.open(file_path) as f:
+        with span("hdfs.open", path=file_path, length=max_bytes), dfs.open(file_path) as f:
             raw_data = f.read(max_bytes)
 
             if extension == ".txt":
@@ -0,0 +1,167 @@
+import os
+import time
+import socket
+import threading
+import multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+from structlog import get_logger
+
+from app.config import config
+from app.models.job import Job
+from app.models.connection import Connection
+from app.controllers.kafka import store_data_kafka_to_hadoop
+from app.controllers.nifi import nifi_monitor, process_group_pool
+from app.tracing import setup_tracing, attach_context, span
+
+logger = get_logger()
+
+def run_kafka_to_hadoop(job: Job, connection: Connection):
+    store_data_kafka_to_hadoop(connection)
+    # The transfer records its failures on the connection instead of raising them.
+    stored = Connection.get(connection.id)
+    if stored is not None and stored.state == "Failed":
+        raise RuntimeError(f"Kafka to Hadoop transfer of Connection ID {connection.id} failed")
+
+def run_monitor_flow(job: Job, connection: Connection) -> Future:
+    # Returns at once, the job completes once the flow has been cleaned up; cleanup queues the Kafka to Hadoop job.
+    return nifi_monitor.track(job.payload["process_group_id"], connection)
+
+# Jobs whose handler returns a future at once, they are started on the claim loop instead of taking a slot.
+ASYNC_JOBS = ("monitor_flow",)
+
+JOB_HANDLERS = {
+    "monitor_flow": run_monitor_flow,
+    "kafka_to_hadoop": run_kafka_to_hadoop,
+}
+
+def recover_jobs():
+    """
+        Requeue jobs of workers that stopped sending heartbeats, and queue jobs for connections
+        left Loading or Storing without one, e.g. by a crash before the job queue existed.
+    """
+    _, failed_connection_ids = Job.recover_stale(config.jobs.stale_timeout, config.jobs.max_attempts)
+    for connection_id in failed_connection_ids:
+        connection = Connection.get(connection_id)
+        if connection:
+            connection.update_state("Failed")
+
+    # Younger connections may still be between being saved and queueing their first job.
+    for record in Job.list_orphaned_connections(config.jobs.stale_timeout):
+        if record["state"] == "Loading" and record["nifi_process_id"]:
+            Job.enqueue("monitor_flow", record["id"], record["source_type"], {"process_group_id": record["nifi_process_id"]})
+        elif record["state"] == "Storing":
+            Job.enqueue("kafka_to_hadoop", record["id"], record["source_type"])
+
+class Worker:
+    """
+        An ingestion worker process. It claims queued jobs while it has free slots, runs them on a
+        thread pool, sends heartbeats for its running jobs and periodically recovers stale jobs.
+        JOBS_WORKER_SLOTS bounds the Kafka to Hadoop transfers of the process; flow monitors share
+        one asyncio loop, hold no thread while they wait and are only bounded by JOBS_MAX_MONITORS.
+    """
+    def __init__(self, worker_id: str):
+        self.worker_id = worker_id
+        self.executor = ThreadPoolExecutor(max_workers=config.jobs.worker_slots, thread_name_prefix="job")
+        self.running = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def execute(self, job: Job):
+        try:
+            connection = Connection.get(job.connection_id)
+            if connection is None:
+                self.complete(job, "Connection no longer exists")
+                return
+            # The job continues the trace of the action that queued it, stored on the connection.
+            with attach_context(connection.trace_context), \
+                    span(f"job.{job.job_type}", job_id=job.id, connection_id=connection.id, source_type=connection.source_type):
+                result = JOB_HANDLERS[job.job_type](job, connection)
+        except Exception as e:
+            logger.error(f"Module:JobController. Job {job.id} failed: {e}")
+            self.complete(job, str(e))
+            return
+        if isinstance(result, Future):
+            result.add_done_callback(lambda future: self.complete(job, str(future.exception()) if future.exception() else None))
+        else:
+            self.complete(job)
+
+    def complete(self, job: Job, error: Optional[str] = None):
+        try:
+            job.finish("failed" if error is not None else "succeeded", error)
+        finally:
+            with self.lock:
+                self.running.pop(job.id, None)
+
+    def send_heartbeats(self):
+        while not self.stop_event.wait(config.jobs.heartbeat_interval):
+            with self.lock:
+                job_ids = list(self.running)
+            if job_ids:
+                Job.heartbeat(self.worker_id, job_ids)
+
+    def claim_next(self):
+        with self.lock:
+            local_transfers = sum(1 for job in self.running.values() if job.job_type == "kafka_to_hadoop")
+        for job_type in JOB_HANDLERS:
+            # Monitors only wait on NiFi, so only Spark transfers are bounded by the slots of this worker.
+            if job_type == "kafka_to_hadoop" and local_transfers >= config.jobs.worker_slots:
+                continue
+            max_running, max_running_per_source = config.jobs.limits[job_type]
+            job = Job.claim(self.worker_id, job_type, max_running, max_running_per_source)
+            if job:
+                return job
+        return None
+
+    def run(self):
+        logger.info(f"Module:JobController. Worker {self.worker_id} started with {config.jobs.worker_slots} slot(s).")
+        threading.Thread(target=self.send_heartbeats, name="job-heartbeat", daemon=True).start()
+        next_recovery = 0.0
+        while not self.stop_event.is_set():
+            if time.monotonic() >= next_recovery:
+                recover_jobs()
+                next_recovery = time.monotonic() + config.jobs.recovery_interval
+
+            job = self.claim_next()
+            if job is None:
+                self.stop_event.wait(config.jobs.poll_interval)
+                continue
+            with self.lock:
+                self.running[job.id] = job
+            if job.job_type in ASYNC_JOBS:
+                self.execute(job)
+            else:
+                self.executor.submit(self.execute, job)
+
+def run_worker(index: int):
+    setup_tracing("data-studio-worker")
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        logger.warning("Module:JobController. PROMETHEUS_MULTIPROC_DIR is not set, the NiFi and Spark metrics of this worker are not exported.")
+    process_group_pool.warm_up(config.nifi.warm_pool_sources)
+    Worker(f"{socket.gethostname()}-{os.getpid()}-{index}").run()
+
+def run_workers():
+    """
+        Start JOBS_WORKER_PROCESSES worker processes and restart any that exits.
+    """
+    context = multiprocessing.get_context("spawn")
+    processes = {}
+    try:
+        while True:
+            for index in range(config.jobs.worker_processes):
+                process = processes.get(index)
+                if process is None or not process.is_alive():
+                    if process is not None:
+                        logger.warning(f"Module:JobController. Worker process {index} exited with code {process.exitcode}, restarting.")
+                    processes[index] = context.Process(target=run_worker, args=(index,), name=f"ingestion-worker-{index}")
+                    processes[index].start()
+            time.sleep(config.jobs.poll_interval)
+    except KeyboardInterrupt:
+        logger.info("Module:JobController. Stopping worker processes.")
+    finally:
+        for process in processes.values():
+            process.terminate()
+            process.join()
+
+if __name__ == "__main__":
+    run_workers()
@@ -1,36 +1,56 @@
 import os
-import threading
+import json
+import time
+import contextvars
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
 from structlog import get_logger
 from pyspark.sql import SparkSession, DataFrame
+from pyhdfs import HdfsClient
+from pyspark.sql.functions import col, date_format, max as spark_max
 from pyspark.sql.streaming import StreamingQuery
 
 from app.models.connection import Connection
-from app.controllers.hadoop import get_hdfs_path
+from app.models.kafka_offset import KafkaOffset
+from app.models.job import Job
+from app.controllers.hadoop import get_hdfs_path, invalidate_hdfs_directory, read_manifest, write_manifest, MANIFEST_FILE
+from app.controllers.spark import spark_service
+from app.controllers.delta import write_delta_sink
+from app.controllers.publish import publish_connection_datasets
 from app.config import config
+from app.metrics import spark_batch_seconds, spark_batch_rows, spark_batch_rows_per_second
+from app.tracing import span, traced, inject_context, attach_context, start_thread
 
 logger = get_logger()
 
-# Configure Spark to include Kafka packages
-os.environ['PYSPARK_SUBMIT_ARGS'] = (
-    '--packages org.apache.spark:spark-streaming-kafka-0-10_2.12:3.2.0,'
-    'org.apache.spark:spark-sql-kafka-0-10_2.12:3.2.0 pyspark-shell'
-)
+# Configure Spark to include Kafka packages, and Delta Lake when the Delta sink is enabled
+spark_packages = [
+    'org.apache.spark:spark-streaming-kafka-0-10_2.12:3.2.0',
+    'org.apache.spark:spark-sql-kafka-0-10_2.12:3.2.0'
+]
+if config.delta.uses_delta():
+    spark_packages.append(config.delta.package)
+os.environ['PYSPARK_SUBMIT_ARGS'] = f"--packages {','.join(spark_packages)} pyspark-shell"
 os.environ['HADOOP_USER_NAME'] = config.hadoop.user
 
 def run_kafka_to_hadoop_thread(connection: Connection):
+    # With the job queue the transfer runs on an ingestion worker instead of a thread of this process.
+    if config.jobs.enabled:
+        # The worker continues the trace of whoever queued the transfer, such as the Load To Storage button.
+        connection.update_trace_context(inject_context())
+        return Job.enqueue("kafka_to_hadoop", connection.id, connection.source_type) is not None \
+            or Job.is_active("kafka_to_hadoop", connection.id)
     try:
-        threading.Thread(
-            target = store_data_kafka_to_hadoop,
-            args = (connection,),
-            daemon = True
-        ).start()
+        start_thread(store_data_kafka_to_hadoop, connection)
         return True
     except Exception as e:
         return False
 
 
 def initialize_spark() -> SparkSession:
-    spark = SparkSession.builder.appName("KafkaStreamProcessor").getOrCreate()
+    # The session is shared by every ingestion run and is never stopped between runs.
+    spark = spark_service.get_session()
     return spark
 
 def get_dataset_list(connection: Connection):
@@ -47,9 +67,10 @@ def get_topic_prefix(connection: Connection):
     if connection.source_type == "Microsoft SQL Server":
         return connection.connection_properties['db_name']
 
-def get_kafka_stream(topic: str, spark: SparkSession):
+def get_kafka_stream(topic: str, spark: SparkSession, with_offsets: bool = False):
     '''
     This function retrieve data from a Kafka stream for a specific topic.
+    The Kafka timestamp of every record is kept next to the value, and with with_offsets its partition and offset too.
     '''
     try:
         logger.info(f"Module:KafkaController. Start getting stream from kafka topic: {topic}")
@@ -59,12 +80,13 @@ def get_kafka_stream(topic: str, spark: SparkSession):
             "startingOffsets": "earliest",
             "failOnDataLoss": "false"
         }
+        columns = ["partition", "offset", "timestamp", "CAST(value AS STRING) AS value"] if with_offsets else ["timestamp", "CAST(value AS STRING) AS value"]
         # Create a Kafka DataFrame
         kafkaStream = spark.readStream \
             .format("kafka") \
             .options(**kafkaParams) \
             .load() \
-            .selectExpr("CAST(value AS STRING)")
+            .selectExpr(*columns)
 
         logger.info(f"Module:KafkaController. Finished getting stream from kafka topic: {topic}")
         return kafkaStream
@@ -72,24 +94,113 @@ def get_kafka_stream(topic: str, spark: SparkSession):
         logger.error(f"Module:KafkaController. Failed to get stream from kafka topic: {topic}. {str(e)}")
         return False
 
+def write_json_parts(batch_df: DataFrame, folder_path: str, file_prefix: str) -> List[Dict]:
+    '''
+    This function writes the values of a batch into a HDFS folder with one file per Spark partition,
+    written in parallel by the executors and named {file_prefix}-{partition:05d}.json.
+    Empty partitions produce no file.
+
+    Returns:
+    - List[Dict]: the path (relative to folder_path), row count, byte size and modification time of every file
+    '''
+    hosts = f"{config.hadoop.host}:{config.hadoop.web_port}"
+    user = config.hadoop.user
+    chunk_size = config.hadoop.output_chunk_size
+    relative_prefix = file_prefix.rstrip("/")
+
+    # Defined here so it is shipped to the executors by value and only needs pyhdfs there.
+    def write_partition(index, rows):
+        dfs = HdfsClient(hosts=hosts, user_name=user)
+        file_name = f"{relative_prefix}-{index:05d}.json"
+        file_path = f"{folder_path}/{file_name}"
+        chunk, chunk_bytes, row_count, byte_count = [], 0, 0, 0
+        for row in rows:
+            line = (json.dumps({"value": row.value}, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+            chunk.append(line)
+            chunk_bytes += len(line)
+            row_count += 1
+            if chunk_bytes >= chunk_size:
+                if byte_count:
+                    dfs.append(file_path, b"".join(chunk))
+                else:
+                    dfs.create(file_path, b"".join(chunk), overwrite=True)
+                byte_count += chunk_bytes
+                chunk, chunk_bytes = [], 0
+        if chunk:
+            if byte_count:
+                dfs.append(file_path, b"".join(chunk))
+            else:
+                dfs.create(file_path, b"".join(chunk), overwrite=True)
+            byte_count += chunk_bytes
+        if row_count:
+            yield {"path": file_name, "rows": row_count, "bytes": byte_count, "modification_time": int(time.time() * 1000)}
+
+    return batch_df.select("value").rdd.mapPartitionsWithIndex(write_partition).collect()
+
+def observe_batch(mode: str, dataset_name: str, files: List[Dict], elapsed: float):
+    rows = sum(entry["rows"] for entry in files)
+    spark_batch_seconds.labels(mode=mode, dataset=dataset_name).observe(elapsed)
+    spark_batch_rows.labels(mode=mode, dataset=dataset_name).inc(rows)
+    if elapsed > 0:
+        spark_batch_rows_per_second.labels(mode=mode, dataset=dataset_name).observe(rows / elapsed)
+    logger.info(f"Module:KafkaController. Wrote {rows} rows of {dataset_name} in {elapsed:.2f}s.")
+
+def build_manifest(dataset_name: str, files: List[Dict]) -> Dict:
+    return {
+        "dataset": dataset_name,
+        "format": "json",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "row_count": sum(entry["rows"] for entry in files),
+        "byte_size": sum(entry["bytes"] for entry in files),
+        "files": sorted(files, key=lambda entry: entry["path"])
+    }
+
+@traced("spark.write_dataset_to_hadoop")
+def write_dataset_to_hadoop(batch_df: DataFrame, topic_prefix: str, dataset_name: str):
+    '''
+    This function replaces the content of a dataset folder with one micro-batch and its manifest.
+    The files of every load are named after the load, so readers of the previous manifest keep reading
+    complete files while the new ones are written. They are deleted after the manifest is replaced.
+    '''
+    folder_path = f"/DataLake/{topic_prefix}/{dataset_name}"
+    load_id = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S%f")
+    batch_df.persist()
+    try:
+        start = time.perf_counter()
+        previous = read_manifest(folder_path, use_cache=False)
+        files = write_json_parts(batch_df, folder_path, f"{dataset_name}-{load_id}")
+        write_manifest(folder_path, build_manifest(dataset_name, files))
+        observe_batch("full", dataset_name, files, time.perf_counter() - start)
+
+        dfs = config.hadoop.get_connection()
+        written = {entry["path"] for entry in files} | {MANIFEST_FILE}
+        if previous:
+            stale = [entry["path"] for entry in previous["files"] if entry["path"] not in written]
+        else:
+            # Folders written before manifests existed are cleaned up once with a listing.
+            stale = [name for name in dfs.listdir(folder_path) if name not in written]
+        for path in stale:
+            dfs.delete(f"{folder_path}/{path}", recursive=True)
+        invalidate_hdfs_directory(folder_path)
+
+        # The batch fails rather than leaving the dataset Stored while its columnar copy, the source of publishing, is stale.
+        if config.delta.enabled and not write_delta_sink(batch_df, topic_prefix, dataset_name, mode="overwrite"):
+            raise IOError(f"Failed to write the {config.delta.format} table of {dataset_name}")
+    finally:
+        batch_df.unpersist()
+
 def store_kafka_stream(kafkaStream: DataFrame, topic_prefix: str, dataset_name: str):
     '''
     This function store the Kafka data stream into Hadoop Distributed File System (HDFS)
     '''
     try:
         logger.info(f"Module:KafkaController. Start storring stream in Hadoop dataset: {dataset_name}")
+        # Micro-batches run on a callback thread of Spark, which does not share the context of this one.
+        trace_context = inject_context()
         def store_in_hadoop(batch_df: DataFrame, batch_id: int):
-            if not batch_df.isEmpty():
-                # Store the batch in the specified folder
-                folder_path = f"/DataLake/{topic_prefix}/{dataset_name}"
-                hdfs_path = get_hdfs_path(folder_path)
-                batch_df.write.mode("overwrite").json(hdfs_path)
-
-                # Rename the randomly generated file name to actual file name.
-                dfs = config.hadoop.get_connection()
-                old_file_name = f"{folder_path}/{dfs.list_status(folder_path)[1]["pathSuffix"]}"
-                new_file_name = f"{folder_path}/{dataset_name}.json"
-                dfs.rename(old_file_name,new_file_name)
+            with attach_context(trace_context), span("spark.batch", dataset=dataset_name, batch_id=batch_id):
+                if not batch_df.isEmpty():
+                    write_dataset_to_hadoop(batch_df, topic_prefix, dataset_name)
 
             query.stop()
 
@@ -106,6 +217,199 @@ def store_kafka_stream(kafkaStream: DataFrame, topic_prefix: str, dataset_name:
         if 'query' in locals() and query:
             query.stop()
 
+def store_kafka_stream_incremental(kafkaStream: DataFrame, topic_prefix: str, dataset_name: str, topic: str, connection_id):
+    '''
+    This function appends only the Kafka records that arrived since the last run into HDFS.
+    Progress is kept in a checkpoint per topic on HDFS, the output is partitioned by ingest date and
+    added to the dataset manifest, and the committed offsets are recorded per connection in the metadata database.
+    '''
+    try:
+        logger.info(f"Module:KafkaController. Start incremental storring of stream in Hadoop dataset: {dataset_name}")
+        folder_path = f"/DataLake/{topic_prefix}/{dataset_name}"
+        checkpoint_path = f"{config.kafka.checkpoint_root}/{topic_prefix}/{dataset_name}"
+        trace_context = inject_context()
+
+        def store_in_hadoop(batch_df: DataFrame, batch_id: int):
+            with attach_context(trace_context), span("spark.batch", dataset=dataset_name, batch_id=batch_id):
+                store_batch(batch_df, batch_id)
+
+        def store_batch(batch_df: DataFrame, batch_id: int):
+            if batch_df.isEmpty():
+                return
+            batch_df.persist()
+            try:
+                # Batch ids are kept in the checkpoint and the date partitions come from the Kafka timestamps
+                # of the records, so a replayed batch rewrites the same files, even on another day.
+                start = time.perf_counter()
+                dated_df = batch_df.withColumn("ingest_date", date_format(col("timestamp"), "yyyy-MM-dd"))
+                files = []
+                for ingest_date in sorted(row.ingest_date for row in dated_df.select("ingest_date").distinct().collect()):
+                    files += write_json_parts(dated_df.filter(col("ingest_date") == ingest_date), folder_path,
+                                              f"ingest_date={ingest_date}/{dataset_name}-{batch_id:06d}")
+                previous = read_manifest(folder_path, use_cache=False)
+                manifest_files = {entry["path"]: entry for entry in (previous or {}).get("files", [])}
+                manifest_files.update({entry["path"]: entry for entry in files})
+                write_manifest(folder_path, build_manifest(dataset_name, list(manifest_files.values())))
+                observe_batch("incremental", dataset_name, files, time.perf_counter() - start)
+
+                committed = batch_df.groupBy("partition").agg(spark_max("offset").alias("offset")).collect()
+                KafkaOffset.save_offsets(connection_id, topic, {row["partition"]: row["offset"] for row in committed})
+                invalidate_hdfs_directory(folder_path)
+
+                # Batch ids belong to the checkpoint, so its path identifies the writer of the Delta transactions.
+                if config.delta.enabled and not write_delta_sink(batch_df, topic_prefix, dataset_name, mode="append",
+                                                                 app_id=checkpoint_path, batch_id=batch_id):
+                    raise IOError(f"Failed to write the {config.delta.format} table of {dataset_name}")
+            finally:
+                batch_df.unpersist()
+
+        # availableNow processes every offset that is new since the checkpoint and then stops.
+        query: StreamingQuery = kafkaStream.writeStream \
+            .foreachBatch(store_in_hadoop) \
+            .option("checkpointLocation", get_hdfs_path(checkpoint_path)) \
+            .trigger(availableNow=True) \
+            .start()
+        query.awaitTermination()
+        logger.info(f"Module:KafkaController. Finished incremental storring of stream in Hadoop dataset: {dataset_name}")
+        return True
+    except Exception as e:
+        logger.error(f"Module:KafkaController. Failed incremental storring of stream in Hadoop dataset: {dataset_name}. {str(e)}")
+        return False
+    finally:
+        if 'query' in locals() and query:
+            query.stop()
+
+def get_kafka_multi_topic_stream(topics: List[str], spark: SparkSession):
+    '''
+    This function retrieve a single Kafka stream subscribed to several topics, keeping the topic of every row.
+    '''
+    try:
+        logger.info(f"Module:KafkaController. Start getting stream from {len(topics)} kafka topics")
+        kafkaParams = {
+            "kafka.bootstrap.servers": config.kafka.get_url(),
+            "subscribe": ",".join(topics),
+            "startingOffsets": "earliest",
+            "failOnDataLoss": "false"
+        }
+        kafkaStream = spark.readStream \
+            .format("kafka") \
+            .options(**kafkaParams) \
+            .load() \
+            .selectExpr("topic", "timestamp", "CAST(value AS STRING) AS value")
+
+        logger.info(f"Module:KafkaController. Finished getting stream from {len(topics)} kafka topics")
+        return kafkaStream
+    except Exception as e:
+        logger.error(f"Module:KafkaController. Failed to get stream from kafka topics: {topics}. {str(e)}")
+        return False
+
+def store_kafka_multi_topic_stream(kafkaStream: DataFrame, topic_prefix: str, datasets: Dict[str, str]) -> Dict[str, bool]:
+    '''
+    This function store a multi-topic Kafka stream into HDFS, splitting the rows of each batch by topic.
+
+    Parameters:
+    - datasets: Dict[str, str] — topic name to dataset name
+
+    Returns:
+    - Dict[str, bool]: dataset name to whether it was stored successfully
+    '''
+    results = {dataset_name: False for dataset_name in datasets.values()}
+    try:
+        logger.info(f"Module:KafkaController. Start storring multi-topic stream in Hadoop datasets: {list(results)}")
+        trace_context = inject_context()
+        def store_in_hadoop(batch_df: DataFrame, batch_id: int):
+            with attach_context(trace_context), span("spark.batch", datasets=len(datasets), batch_id=batch_id):
+                store_batch(batch_df)
+
+            query.stop()
+
+        def store_batch(batch_df: DataFrame):
+            # The batch is read once from Kafka and then filtered per topic.
+            batch_df.persist()
+            try:
+                present_topics = set(row.topic for row in batch_df.select("topic").distinct().collect())
+                for topic, dataset_name in datasets.items():
+                    # Topics without data have nothing to write, which is not a failure.
+                    if topic not in present_topics:
+                        results[dataset_name] = True
+                        continue
+                    try:
+                        write_dataset_to_hadoop(batch_df.filter(col("topic") == topic).select("timestamp", "value"), topic_prefix, dataset_name)
+                        results[dataset_name] = True
+                    except Exception as e:
+                        logger.error(f"Module:KafkaController. Failed storring Hadoop dataset: {dataset_name}. {str(e)}")
+            finally:
+                batch_df.unpersist()
+
+        query: StreamingQuery = kafkaStream.writeStream \
+            .foreachBatch(store_in_hadoop) \
+            .start()
+        query.awaitTermination()
+        logger.info(f"Module:KafkaController. Finished storring multi-topic stream in Hadoop datasets: {list(results)}")
+        return results
+    except Exception as e:
+        logger.error(f"Module:KafkaController. Failed storring multi-topic stream in Hadoop. {str(e)}")
+        return results
+    finally:
+        if 'query' in locals() and query:
+            query.stop()
+
+def load_dataset(spark: SparkSession, topic_prefix: str, dataset_name: str, connection_id) -> Tuple[bool, bool]:
+    '''
+    This function moves one dataset from its Kafka topic to HDFS, either as a full reload or,
+    with KAFKA_LOAD_MODE=incremental, as an append of the records that are new since the last run.
+
+    Returns:
+    - (loaded, stored): whether the stream could be read and whether it was stored
+    '''
+    topic = f"{topic_prefix}{dataset_name}"
+    incremental = config.kafka.load_mode == "incremental"
+    with span("kafka.load_dataset", topic=topic, dataset=dataset_name, load_mode=config.kafka.load_mode):
+        kafkaStream = get_kafka_stream(topic, spark, with_offsets=incremental)
+        if not kafkaStream:
+            return False, False
+        if incremental:
+            return True, store_kafka_stream_incremental(kafkaStream, topic_prefix, dataset_name, topic, connection_id)
+        return True, store_kafka_stream(kafkaStream, topic_prefix, dataset_name)
+
+def load_datasets(spark: SparkSession, topic_prefix: str, dataset_list: List[str], connection_id, pool_name: str) -> List[Tuple[bool, bool]]:
+    '''
+    This function moves every dataset of a connection to HDFS using the configured ingestion mode:
+    - sequential: one streaming query per topic, one after the other
+    - parallel: one streaming query per topic, at most KAFKA_MAX_CONCURRENT_QUERIES at once
+    - multi_topic: a single streaming query subscribed to all topics, split by topic when written
+    All Spark work runs in the given FAIR scheduler pool.
+    '''
+    mode = config.kafka.ingestion_mode
+    if mode == "multi_topic" and config.kafka.load_mode == "incremental":
+        # Incremental loads keep one checkpoint per topic, so they need one query per topic.
+        logger.warning(f"Module:KafkaController. Incremental loads run one query per topic, using parallel mode instead of multi_topic.")
+        mode = "parallel"
+    logger.info(f"Module:KafkaController. Loading {len(dataset_list)} dataset(s) in {mode} mode.")
+
+    if mode == "multi_topic":
+        datasets = {f"{topic_prefix}{dataset_name}": dataset_name for dataset_name in dataset_list}
+        kafkaStream = get_kafka_multi_topic_stream(list(datasets), spark)
+        if not kafkaStream:
+            return [(False, False)]
+        with spark_service.scheduler_pool(pool_name):
+            results = store_kafka_multi_topic_stream(kafkaStream, topic_prefix, datasets)
+        return [(True, stored) for stored in results.values()]
+
+    def load_in_pool(dataset_name: str) -> Tuple[bool, bool]:
+        # The scheduler pool is a thread-local property, so it is set by the thread that starts the query.
+        with spark_service.scheduler_pool(pool_name):
+            return load_dataset(spark, topic_prefix, dataset_name, connection_id)
+
+    if mode == "parallel":
+        with ThreadPoolExecutor(max_workers=config.kafka.max_concurrent_queries) as executor:
+            # Each query runs in a copy of this context, so its spans stay in the trace of the transfer.
+            futures = [executor.submit(contextvars.copy_context().run, load_in_pool, dataset_name) for dataset_name in dataset_list]
+            return [future.result() for future in futures]
+
+    return [load_in_pool(dataset_name) for dataset_name in dataset_list]
+
+@traced("kafka.store_data_kafka_to_hadoop")
 def store_data_kafka_to_hadoop(connection: Connection):
     '''
     This function is a data ingestion pipeline that continuously retrieves streaming data from Apache Kafka 
@@ -113,26 +417,22 @@ def store_data_kafka_to_hadoop(connection: Connection):
     '''
     try:
         logger.info(f"Module:KafkaController. Start transferring data Kafka to Hadoop. Process id:{connection.nifi_process_id}")
-        successfully_loaded = True
-        successfully_stored = True
         connection.update_state("Storing")
         dataset_list = get_dataset_list(connection)
         topic_prefix = get_topic_prefix(connection)
 
         # Initialize spark session
         spark = initialize_spark()
-        for dataset_name in dataset_list:
-            topic = f"{topic_prefix}{dataset_name}"
-            kafkaStream = get_kafka_stream(topic, spark)
-            if kafkaStream:
-                stored = store_kafka_stream(kafkaStream, topic_prefix, dataset_name)
-                if not stored:
-                    successfully_stored = False
-            else:
-                successfully_loaded = False
+        results = load_datasets(spark, topic_prefix, dataset_list, connection.id, pool_name=f"connection_{connection.id}")
+        successfully_loaded = all(loaded for loaded, _ in results)
+        successfully_stored = all(stored for loaded, stored in results if loaded)
             
         if successfully_stored:
             connection.update_state("Stored")
+            # Make the stored datasets queryable through the data API.
+            if config.clickhouse.publish_enabled and not publish_connection_datasets(spark, connection, topic_prefix, dataset_list):
+                # The data is safely in HDFS, so the connection stays Stored and the next load publishes again.
+                logger.error(f"Module:KafkaController. Connection ID {connection.id} is stored but not all of its datasets could be published to ClickHouse.")
         elif successfully_loaded:
             connection.update_state("Loaded")
         else:
@@ -142,8 +442,3 @@ def store_data_kafka_to_hadoop(connection: Connection):
     except Exception as e:
         connection.update_state("Failed")
         logger.error(f"Module:KafkaController. Failed to transfer data Kafka to Hadoop. Process id:{connection.nifi_process_id}. {str(e)}")
-    finally:
-        if 'spark' in locals() and spark:
-            spark.stop()
-
-    
\ No newline at end of file
@@ -1,52 +1,24 @@
 import time 
 import json
-import requests
+import asyncio
 import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
 
 from structlog import get_logger
 
 from app.config import config
 from app.models.connection import Connection
-from app.controllers.kafka import store_data_kafka_to_hadoop
+from app.models.job import Job
+from app.models.pool_group import PoolGroup
+from app.controllers.kafka import store_data_kafka_to_hadoop, run_kafka_to_hadoop_thread
+from app.controllers.nifi_client import nifi_client
+from app.metrics import observe_stage, nifi_flow_seconds
+from app.tracing import traced, inject_context, attach_context
 
 logger = get_logger()
 
-def get_nifi_token():
-    """
-        This function generates an access token for communicating with NiFi.
-    """
-    logger.info(f"Module:NiFiController. Generating NiFi Access Token.")
-    TOKEN_URL = f"{config.nifi.get_api_url()}/access/token"
-    data = {
-        "username": config.nifi.username,
-        "password": config.nifi.password
-    }
-    headers = {
-        "Content-Type": "application/x-www-form-urlencoded"
-    }
-    
-    try:
-        response = requests.post(TOKEN_URL, data=data, headers=headers, verify=False)
-        if response.status_code == 201:
-            logger.info(f"Module:NiFiController. Successfully generated the access token.")
-            return response.text
-        else:
-            logger.error(f"Module:NiFiController. Failed to get token: {response.text}")
-            return None
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Module:NiFiController. Error connecting to NiFi: {e}")
-        return None
-
-def get_request_headers(token):
-    """
-        Initialize the API headers.
-    """
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
-    return headers
-
 def get_template_payload_for_source(source_type):
     """
         This function creates a copy of the specified source template at position (0,0).
@@ -59,7 +31,8 @@ def get_template_payload_for_source(source_type):
         }
     return template_payload
 
-def create_template_instance(headers, source_type):
+@observe_stage("create_template")
+def create_template_instance(source_type):
     """
         Create the template in the NiFi workspace.
     """
@@ -69,8 +42,8 @@ def create_template_instance(headers, source_type):
         template_payload = get_template_payload_for_source(source_type)
 
         # Creating the template in root process group
-        response = requests.post(f"{config.nifi.get_api_url()}/process-groups/{config.nifi.root}/template-instance", 
-                                json=template_payload, headers=headers, verify=False)
+        response = nifi_client.post(f"/process-groups/{config.nifi.root}/template-instance", 
+                                json=template_payload)
 
         if response.status_code == 201:
             flow_details = response.json()
@@ -84,14 +57,14 @@ def create_template_instance(headers, source_type):
         logger.error(f"Module:NiFiController. Failed to instantiate flow: {e}")
         return False
     
-def get_payload_from_variable_registry(headers, process_group_id):
+@observe_stage("get_variables")
+def get_payload_from_variable_registry(process_group_id):
     """
         Get the variables registry from the template.
     """
     logger.info(f"Module:NiFiController. Getting payload from NiFi variable registry.")
     try:
-        var_response = requests.get(f"{config.nifi.get_api_url()}/process-groups/{process_group_id}/variable-registry", 
-                                        headers=headers, verify=False)
+        var_response = nifi_client.get(f"/process-groups/{process_group_id}/variable-registry")
 
         if var_response.status_code == 200:
             logger.info(f"Module:NiFiController. Successfully feached template variable registry")
@@ -136,14 +109,15 @@ def set_payload_on_variable_registry(payload, connection:Connection):
         logger.error(f"Module:NiFiController. Failed to set variable on NiFi variable registry: {e}")
         return False
     
-def update_template_variable_registry(headers, process_group_id, update_payload):
+@observe_stage("update_variables")
+def update_template_variable_registry(process_group_id, update_payload):
     """
         Update the variables in the template's variable registry.
     """
     logger.info(f"Module:NiFiController. Updating NiFi template variable registry.")
     try:
-        update_response = requests.put(f"{config.nifi.get_api_url()}/process-groups/{process_group_id}/variable-registry", 
-                                                json=update_payload, headers=headers, verify=False)
+        update_response = nifi_client.put(f"/process-groups/{process_group_id}/variable-registry", 
+                                                json=update_payload)
 
         if update_response.status_code == 200:
             logger.info("Module:NiFiController. Flow variables updated successfully")
@@ -155,14 +129,13 @@ def update_template_variable_registry(headers, process_group_id, update_payload)
         logger.error(f"Module:NiFiController. Failed to update flow variables: {e}")
         return False
     
-def get_controller_services_of_template(headers, process_group_id):
+def get_controller_services_of_template(process_group_id):
     """
         Fetch all controller services from the template.
     """
     logger.info(f"Module:NiFiController. Getting controller services from NiFi template.")
     try:
-        response = requests.get(f"{config.nifi.get_api_url()}/flow/process-groups/{process_group_id}/controller-services", 
-                                headers=headers, verify=False)
+        response = nifi_client.get(f"/flow/process-groups/{process_group_id}/controller-services")
         
         if response.status_code == 200:
             services = response.json()["controllerServices"]
@@ -176,64 +149,88 @@ def get_controller_services_of_template(headers, process_group_id):
         logger.error(f"Module:NiFiController. Failed to fetch controller services: {e}")
         return False
 
-def enable_controller_services_of_template(headers, process_group_id):
+def enable_controller_service(service):
+    """
+        Send the enable request of a single controller service. Returns True if NiFi accepted it.
+    """
+    service_id = service["id"]
+    service_type = service["component"].get("type")
+    properties = service["component"].get("properties", {})
+
+    if service_type == "org.apache.nifi.dbcp.DBCPConnectionPool":
+        properties["Password"] = "${PASS}"
+
+    enable_payload = {
+        "revision": {"version": service["revision"]["version"]},
+        "component": {
+            "id": service_id,
+            "properties": properties,
+            "state": "ENABLED"
+        }
+    }
+
+    enable_response = nifi_client.put(f"/controller-services/{service_id}", 
+                                json=enable_payload)
+
+    if enable_response.status_code == 200:
+        logger.info(f"Module:NiFiController. Enabled Controller Service: {service['component']['name']}")
+        return True
+    logger.error(f"Module:NiFiController. Failed to enable service {service['component']['name']}: {enable_response.text}")
+    return False
+
+def wait_for_controller_services(process_group_id, state="ENABLED"):
+    """
+        Poll the controller services of the template until all of them are in a state, ENABLED by default,
+        or NIFI_SERVICE_ENABLE_TIMEOUT passes.
     """
-        Enable all the services within the template.
+    deadline = time.monotonic() + config.nifi.service_enable_timeout
+    interval = config.nifi.service_poll_interval
+    while True:
+        services = get_controller_services_of_template(process_group_id)
+        pending = [svc["component"]["name"] for svc in services or [] if svc["component"]["state"] != state]
+        if services and not pending:
+            return True
+        if time.monotonic() + interval > deadline:
+            logger.error(f"Module:NiFiController. Controller services not {state.lower()} after {config.nifi.service_enable_timeout}s: {pending}")
+            return False
+        time.sleep(interval)
+        interval = min(interval * 2, config.nifi.service_poll_max_interval)
+
+@observe_stage("enable_services")
+def enable_controller_services_of_template(process_group_id):
+    """
+        Enable all the services within the template concurrently and wait until they are ready.
     """
     logger.info(f"Module:NiFiController. Starting controller services of the NiFi template.")
 
     try:
-        services = get_controller_services_of_template(headers, process_group_id)
+        services = get_controller_services_of_template(process_group_id)
 
         if services:
-            all_service_is_enabled = True
-            for service in services:
-                service_id = service["id"]
-                service_state = service["component"]["state"]
-                service_type = service["component"].get("type")
-                properties = service["component"].get("properties", {})
-
-                if service_type == "org.apache.nifi.dbcp.DBCPConnectionPool":
-                    properties["Password"] = "${PASS}"
-
-                # Enable only if it's DISABLED
-                if service_state == "DISABLED":
-                    enable_payload = {
-                        "revision": {"version": service["revision"]["version"]},
-                        "component": {
-                            "id": service_id,
-                            "properties": properties,
-                            "state": "ENABLED"
-                        }
-                    }
-
-                    enable_response = requests.put(f"{config.nifi.get_api_url()}/controller-services/{service_id}", 
-                                                json=enable_payload, headers=headers, verify=False)
-
-                    if enable_response.status_code == 200:
-                        logger.info(f"Module:NiFiController. Enabled Controller Service: {service['component']['name']}")
-                    else:
-                        all_service_is_enabled = False
-                        logger.error(f"Module:NiFiController. Failed to enable service {service['component']['name']}: {enable_response.text}")
+            # Enable only if it's DISABLED
+            disabled_services = [svc for svc in services if svc["component"]["state"] == "DISABLED"]
+            with ThreadPoolExecutor(max_workers=config.nifi.pool_size) as executor:
+                results = list(executor.map(enable_controller_service, disabled_services))
+            if not all(results):
+                return False
 
             # Wait for services to fully enable before proceeding
-            time.sleep(5)
-            return all_service_is_enabled
+            return wait_for_controller_services(process_group_id)
         else:
             return False
     except Exception as e:
         logger.error(f"Module:NiFiController. Failed to enable all controller services: {e}")
         return False
 
-def stop_all_processors(headers, process_group_id):
+@observe_stage("stop_processors")
+def stop_all_processors(process_group_id):
     """
         Stop all running processors in the specified process group.
     """
     logger.info(f"Module:NiFiController. Stopping all processors for process group {process_group_id}.")
     try:
-        processors_resp = requests.get(
-            f"{config.nifi.get_api_url()}/process-groups/{process_group_id}/processors",
-            headers=headers, verify=False
+        processors_resp = nifi_client.get(
+            f"/process-groups/{process_group_id}/processors"
         )
 
         if processors_resp.status_code != 200:
@@ -256,9 +253,9 @@ def stop_all_processors(headers, process_group_id):
                     }
                 }
 
-                stop_resp = requests.put(
-                    f"{config.nifi.get_api_url()}/processors/{proc_id}",
-                    headers=headers, json=stop_payload, verify=False
+                stop_resp = nifi_client.put(
+                    f"/processors/{proc_id}",
+                    json=stop_payload
                 )
 
                 if stop_resp.status_code != 200:
@@ -272,13 +269,14 @@ def stop_all_processors(headers, process_group_id):
         logger.error(f"Module:NiFiController. Exception while stopping processors: {e}")
         return False
 
-def stop_all_services(headers, process_group_id):
+@observe_stage("disable_services")
+def stop_all_services(process_group_id):
     """
         Disable all controller services in the specified process group.
     """
     logger.info(f"Module:NiFiController. Disabling all controller services for process group {process_group_id}.")
     try:
-        services = get_controller_services_of_template(headers, process_group_id)
+        services = get_controller_services_of_template(process_group_id)
 
         for service in services:
             service_id = service["id"]
@@ -291,9 +289,9 @@ def stop_all_services(headers, process_group_id):
                 }
             }
 
-            update_response = requests.put(
-                f"{config.nifi.get_api_url()}/controller-services/{service_id}",
-                json=body, headers=headers, verify=False
+            update_response = nifi_client.put(
+                f"/controller-services/{service_id}",
+                json=body
             )
 
             if update_response.status_code != 200:
@@ -307,15 +305,15 @@ def stop_all_services(headers, process_group_id):
         logger.error(f"Module:NiFiController. Exception while disabling services: {e}")
         return False
 
-def empty_all_queues(headers, process_group_id):
+@observe_stage("empty_queues")
+def empty_all_queues(process_group_id):
     """
         Drop all flowfiles from queues in the process group.
     """
     logger.info(f"Module:NiFiController. Emptying all queues for process group {process_group_id}.")
     try:
-        connections_response = requests.get(
-            f"{config.nifi.get_api_url()}/process-groups/{process_group_id}/connections",
-            headers=headers, verify=False
+        connections_response = nifi_client.get(
+            f"/process-groups/{process_group_id}/connections"
         )
 
         if connections_response.status_code != 200:
@@ -325,9 +323,9 @@ def empty_all_queues(headers, process_group_id):
         connections = connections_response.json()['connections']
         for conn in connections:
             conn_id = conn['id']
-            drop_request = requests.post(
-                f"{config.nifi.get_api_url()}/flowfile-queues/{conn_id}/drop-requests",
-                headers=headers, verify=False
+            # Dropping a queue twice is harmless, so the request can be retried.
+            drop_request = nifi_client.post(
+                f"/flowfile-queues/{conn_id}/drop-requests", idempotent=True
             )
 
             if drop_request.status_code != 202:
@@ -341,16 +339,16 @@ def empty_all_queues(headers, process_group_id):
         logger.error(f"Module:NiFiController. Exception while emptying queues: {e}")
         return False
 
-def delete_process_group(headers, process_group_id):
+@observe_stage("delete_group")
+def delete_process_group(process_group_id):
     """
         Delete the process group.
     """
     logger.info(f"Module:NiFiController. Deleting process group {process_group_id}.")
     try:
         # Fetch current revision/version
-        get_response = requests.get(
-            f"{config.nifi.get_api_url()}/process-groups/{process_group_id}",
-            headers=headers, verify=False
+        get_response = nifi_client.get(
+            f"/process-groups/{process_group_id}"
         )
 
         if get_response.status_code != 200:
@@ -359,10 +357,9 @@ def delete_process_group(headers, process_group_id):
 
         revision = get_response.json()['revision']
 
-        delete_response = requests.delete(
-            f"{config.nifi.get_api_url()}/process-groups/{process_group_id}",
-            params={"version": revision['version']},
-            headers=headers, verify=False
+        delete_response = nifi_client.delete(
+            f"/process-groups/{process_group_id}",
+            params={"version": revision['version']}
         )
 
         if delete_response.status_code == 200:
@@ -376,43 +373,39 @@ def delete_process_group(headers, process_group_id):
         logger.error(f"Module:NiFiController. Exception while deleting process group: {e}")
         return False
 
-def is_ingestion_complete(headers, process_group_id):
+def get_root_status():
     """
-        Check if ingestion is complete by verifying: All connections have zero flowfiles queued.
+        Fetch the status of the root process group and of every group below it in a single call.
     """
-    logger.info(f"Module:NiFiController. Checking if ingestion is complete for process group {process_group_id}.")
-    try:
-        status_resp = requests.get(
-            f"{config.nifi.get_api_url()}/flow/process-groups/{process_group_id}/status",
-            headers=headers, verify=False
-        )
-
-        if status_resp.status_code != 200:
-            logger.error(f"Module:NiFiController. Failed to get process group status: {status_resp.text}")
-            return False
-
-        status_snapshot = status_resp.json()['processGroupStatus']['aggregateSnapshot']
-        queued_count = status_snapshot.get('flowFilesQueued', "0")
-
-        if int(queued_count) > 0:
-            return False
-
-        logger.info(f"Module:NiFiController. Ingestion is complete for process group {process_group_id}.")
-        return True
+    status_resp = nifi_client.get(
+        f"/flow/process-groups/{config.nifi.root}/status",
+        params={"recursive": "true"}
+    )
+    if status_resp.status_code != 200:
+        logger.error(f"Module:NiFiController. Failed to get root process group status: {status_resp.text}")
+        return None
+    return status_resp.json()['processGroupStatus']['aggregateSnapshot']
 
-    except Exception as e:
-        logger.error(f"Module:NiFiController. Exception while checking ingestion status: {e}")
-        return False
+def index_group_snapshots(snapshot, snapshots=None):
+    """
+        Flatten a recursive process group status snapshot into a dict of group id to snapshot.
+    """
+    snapshots = {} if snapshots is None else snapshots
+    snapshots[snapshot['id']] = snapshot
+    for child in snapshot.get('processGroupStatusSnapshots', []):
+        index_group_snapshots(child['processGroupStatusSnapshot'], snapshots)
+    return snapshots
 
-def start_the_process(headers, process_group_id):
+@observe_stage("start_flow")
+def start_the_process(process_group_id):
     """
         Run all processors within the template.
     """
     logger.info(f"Module:NiFiController. Starting the NiFi process.")
     try:
         start_payload = {"id": process_group_id, "state": "RUNNING"}
-        start_response = requests.put(f"{config.nifi.get_api_url()}/flow/process-groups/{process_group_id}", 
-                                    json=start_payload, headers=headers, verify=False)
+        start_response = nifi_client.put(f"/flow/process-groups/{process_group_id}", 
+                                    json=start_payload)
         
         if start_response.status_code == 200:
             logger.info("Module:NiFiController. Flow started successfully!")
@@ -424,112 +417,344 @@ def start_the_process(headers, process_group_id):
         logger.error(f"Module:NiFiController. Failed to start flow: {e}")
         return False
 
-def monitor_and_cleanup_process(headers, process_group_id, connection:Connection):
+@observe_stage("clear_state")
+def clear_processor_state(process_group_id):
+    """
+        Clear the stored state of every processor in the specified process group.
+    """
+    processors_resp = nifi_client.get(f"/process-groups/{process_group_id}/processors")
+    if processors_resp.status_code != 200:
+        logger.error(f"Module:NiFiController. Failed to retrieve processors: {processors_resp.text}")
+        return False
+    for proc in processors_resp.json().get('processors', []):
+        clear_resp = nifi_client.post(f"/processors/{proc['id']}/state/clear-requests", idempotent=True)
+        if clear_resp.status_code != 200:
+            logger.error(f"Module:NiFiController. Failed to clear state of processor {proc['id']}: {clear_resp.text}")
+            return False
+    return True
+
+class ProcessGroupPool:
+    """
+        An optional pool of pre-instantiated process groups per source type, sized by NIFI_WARM_POOL_SIZE.
+        A new connection checks out an idle group and only sets its variables, enables its services and
+        starts it. When the flow completes the group is stopped, its services disabled and its queues
+        emptied, then it goes back to the pool instead of being deleted. The pool lives in the Pool_Groups
+        table, so the UI and every worker process share it and a group is only checked out once, whichever
+        process returns it. Checkouts are refilled in the background, and the workers fill it on start.
+    """
+    # A reservation not filled by then was left by a process that stopped while creating its group.
+    STALE_RESERVATION_SECONDS = 600
+
+    def __init__(self, size: int):
+        self.size = size
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="nifi-pool")
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def warm_up(self, source_types):
+        if self.enabled:
+            for source_type in source_types:
+                self.executor.submit(self.fill, source_type)
+
+    def fill(self, source_type):
+        try:
+            while True:
+                slot_id = PoolGroup.reserve(source_type, self.size, self.STALE_RESERVATION_SECONDS)
+                if slot_id is None:
+                    return
+                process_group_id = create_template_instance(source_type)
+                if not process_group_id:
+                    PoolGroup.remove(slot_id=slot_id)
+                    return
+                if not PoolGroup.add(slot_id, process_group_id):
+                    PoolGroup.remove(slot_id=slot_id)
+                    delete_process_group(process_group_id)
+                    return
+                logger.info(f"Module:NiFiController. Added process group {process_group_id} to the {source_type} warm pool.")
+        except Exception as e:
+            logger.error(f"Module:NiFiController. Failed to fill the {source_type} warm pool: {e}")
+
+    @observe_stage("pool_checkout")
+    def checkout(self, source_type) -> Optional[str]:
+        """
+            Take an idle process group for a source type, or None if the pool is disabled or empty.
+        """
+        if not self.enabled:
+            return None
+        process_group_id = PoolGroup.checkout(source_type)
+        self.executor.submit(self.fill, source_type)
+        if process_group_id:
+            logger.info(f"Module:NiFiController. Checked out process group {process_group_id} from the warm pool.")
+        return process_group_id
+
+    def release(self, process_group_id) -> bool:
+        """
+            Return a stopped and emptied process group to the pool. Returns False if the group was not
+            checked out of the pool, the pool is full, or its services do not reach DISABLED or its state
+            cannot be cleared, in which case it should be deleted.
+        """
+        if not self.enabled or not PoolGroup.is_in_use(process_group_id):
+            return False
+        # Services still DISABLING would be skipped by the next checkout, which only enables DISABLED ones.
+        # Processors such as QueryDatabaseTable keep their last max values, which must not leak into the next connection.
+        returned = wait_for_controller_services(process_group_id, "DISABLED") \
+            and clear_processor_state(process_group_id) \
+            and PoolGroup.release(process_group_id, self.size)
+        if not returned:
+            PoolGroup.remove(process_group_id)
+            return False
+        logger.info(f"Module:NiFiController. Returned process group {process_group_id} to the warm pool.")
+        return True
+
+    def discard(self, process_group_id):
+        if self.enabled:
+            PoolGroup.remove(process_group_id)
+
+process_group_pool = ProcessGroupPool(config.nifi.warm_pool_size)
+
+@traced("nifi.cleanup_process", child_only=True)
+def cleanup_process(process_group_id, connection:Connection):
     """
-        Continuously monitor the process, and automatically delete it once it completes successfully.
+        Remove a completed flow from the workspace, or return it to the warm pool,
+        and move its data from Kafka to Hadoop.
     """
-    logger.info(f"Module:NiFiController. Started monitoring the process: {process_group_id}")
     try:
-        while True:
-            if is_ingestion_complete(headers, process_group_id):
-                if stop_all_processors(headers, process_group_id):
-                    if stop_all_services(headers, process_group_id):
-                        if empty_all_queues(headers, process_group_id):
-                            if delete_process_group(headers, process_group_id):
-                                # Update database record
-                                connection.update_state("Loaded")
-                                logger.info(f"Module:NiFiController. NiFi flow {process_group_id} completed and cleaned up.")
-                                store_data_kafka_to_hadoop(connection)
-                                break
-                            else:
-                                connection.update_state("Failed")
-                                break
-                        else:
-                            connection.update_state("Failed")
-                            break
-                    else:
-                        connection.update_state("Failed")
-                        break
-                else:
-                    connection.update_state("Failed")
-                    break
-            time.sleep(10)  # Polling interval
+        cleaned_up = stop_all_processors(process_group_id) \
+            and stop_all_services(process_group_id) \
+            and empty_all_queues(process_group_id) \
+            and (process_group_pool.release(process_group_id) or delete_process_group(process_group_id))
+        if not cleaned_up:
+            connection.update_state("Failed")
+            return
+        # Update database record
+        connection.update_state("Loaded")
+        logger.info(f"Module:NiFiController. NiFi flow {process_group_id} completed and cleaned up.")
+        if config.jobs.enabled:
+            run_kafka_to_hadoop_thread(connection)
+        else:
+            store_data_kafka_to_hadoop(connection)
     except Exception as e:
         connection.update_state("Failed")
         logger.error(f"Module:NiFiController. Error in background cleanup task: {str(e)}")
 
-def remove_failed_template(headers, process_group_id, stage):
+@dataclass
+class TrackedFlow:
+    process_group_id: str
+    connection: Connection
+    started_at: float = field(default_factory=time.monotonic)
+    progress: Optional[Tuple] = None
+    active: bool = False
+    quiet_polls: int = 0
+    done: Future = field(default_factory=Future)
+    # Captured from the thread that started tracking, the cleanup continues its trace.
+    trace_context: Dict[str, str] = field(default_factory=inject_context)
+
+class NiFiMonitor:
+    """
+        A single asyncio loop, running on its own thread, that watches every active process group.
+        Each poll is one recursive status call on the root group, whatever the number of flows.
+        A flow is complete once it has processed data and then stayed idle (nothing queued, no active
+        threads and no change in its processed counts and bytes) for NIFI_MONITOR_QUIET_POLLS polls.
+        A flow that never shows any activity is considered complete after NIFI_MONITOR_IDLE_TIMEOUT.
+        The poll interval backs off while nothing changes and resets when a flow makes progress.
+    """
+    PROGRESS_FIELDS = ('flowFilesIn', 'bytesIn', 'flowFilesOut', 'bytesOut', 'bytesRead', 'bytesWritten',
+                       'flowFilesSent', 'bytesSent', 'flowFilesTransferred', 'bytesTransferred')
+
+    def __init__(self):
+        self.flows: Dict[str, TrackedFlow] = {}
+        self.loop = None
+        self.wakeup = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.loop is None:
+                ready = threading.Event()
+                threading.Thread(target=self.run_loop, args=(ready,), name="nifi-monitor", daemon=True).start()
+                ready.wait()
+
+    def run_loop(self, ready: threading.Event):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.wakeup = asyncio.Event()
+        ready.set()
+        self.loop.run_until_complete(self.poll_forever())
+
+    def track(self, process_group_id, connection:Connection) -> Future:
+        """
+            Start watching a process group. Safe to call from any thread.
+            The returned future is resolved once the flow has completed and been cleaned up.
+        """
+        self.start()
+        flow = TrackedFlow(process_group_id=process_group_id, connection=connection)
+        def add():
+            self.flows[process_group_id] = flow
+            self.wakeup.set()
+        self.loop.call_soon_threadsafe(add)
+        logger.info(f"Module:NiFiController. Started monitoring the process: {process_group_id}")
+        return flow.done
+
+    async def poll_forever(self):
+        interval = config.nifi.monitor_min_interval
+        while True:
+            if not self.flows:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                interval = config.nifi.monitor_min_interval
+            try:
+                progressed = await self.poll()
+            except Exception as e:
+                logger.error(f"Module:NiFiController. Error while monitoring NiFi flows: {e}")
+                progressed = False
+            interval = config.nifi.monitor_min_interval if progressed \
+                else min(interval * config.nifi.monitor_backoff, config.nifi.monitor_max_interval)
+            self.wakeup.clear()
+            try:
+                # A newly tracked flow cuts the wait short.
+                await asyncio.wait_for(self.wakeup.wait(), timeout=interval)
+                interval = config.nifi.monitor_min_interval
+            except asyncio.TimeoutError:
+                pass
+
+    async def poll(self) -> bool:
+        """
+            Update every tracked flow from one status call. Returns True if any flow made progress.
+        """
+        root_snapshot = await asyncio.to_thread(get_root_status)
+        if root_snapshot is None:
+            return False
+        snapshots = index_group_snapshots(root_snapshot)
+
+        progressed = False
+        for process_group_id, flow in list(self.flows.items()):
+            snapshot = snapshots.get(process_group_id)
+            if snapshot is None:
+                logger.warning(f"Module:NiFiController. Process group {process_group_id} is no longer in NiFi.")
+                del self.flows[process_group_id]
+                await asyncio.to_thread(flow.connection.update_state, "Failed")
+                flow.done.set_result(False)
+                continue
+
+            progress = tuple(int(snapshot.get(name, 0)) for name in self.PROGRESS_FIELDS)
+            busy = int(snapshot.get('flowFilesQueued', 0)) > 0 or int(snapshot.get('bytesQueued', 0)) > 0 \
+                or int(snapshot.get('activeThreadCount', 0)) > 0
+            # The counters cover a rolling five minute window, so only a growing counter means new work.
+            grew = flow.progress is not None and any(new > old for new, old in zip(progress, flow.progress))
+            flow.progress = progress
+            flow.active = flow.active or busy or any(progress)
+            if grew or busy:
+                progressed = progressed or grew
+                flow.quiet_polls = 0
+            else:
+                flow.quiet_polls += 1
+
+            complete = not busy and (
+                (flow.active and flow.quiet_polls >= config.nifi.monitor_quiet_polls)
+                or (not flow.active and time.monotonic() - flow.started_at > config.nifi.monitor_idle_timeout)
+            )
+            if complete:
+                logger.info(f"Module:NiFiController. Ingestion is complete for process group {process_group_id}.")
+                nifi_flow_seconds.labels(source_type=flow.connection.source_type).observe(time.monotonic() - flow.started_at)
+                del self.flows[process_group_id]
+                # Cleanup and the Kafka to Hadoop transfer are long running, so they get their own thread.
+                threading.Thread(target=self.finish, args=(flow,), daemon=True).start()
+        return progressed
+
+    @staticmethod
+    def finish(flow: TrackedFlow):
+        try:
+            with attach_context(flow.trace_context):
+                cleanup_process(flow.process_group_id, flow.connection)
+        finally:
+            flow.done.set_result(True)
+
+nifi_monitor = NiFiMonitor()
+
+def start_flow_monitoring(process_group_id, connection:Connection) -> bool:
+    """
+        Hand a started flow over to the monitor, through the job queue when it is enabled
+        so monitoring survives a restart of this process. A monitor already queued for the
+        connection, e.g. by a recovery pass of a worker, monitors the flow just as well.
+    """
+    if config.jobs.enabled:
+        return Job.enqueue("monitor_flow", connection.id, connection.source_type, {"process_group_id": process_group_id}) is not None \
+            or Job.is_active("monitor_flow", connection.id)
+    nifi_monitor.track(process_group_id, connection)
+    return True
+
+def remove_failed_template(process_group_id, stage):
     """
         Remove the failed template from the workspace based on the error stage.
     """
     logger.info(f"Module:NiFiController. Started removing the faulty process: {process_group_id}")
     try:
         if stage > 2:
-            stop_all_processors(headers, process_group_id)
+            stop_all_processors(process_group_id)
         if stage > 1:
-            stop_all_services(headers, process_group_id)
-            empty_all_queues(headers, process_group_id)
+            stop_all_services(process_group_id)
+            empty_all_queues(process_group_id)
 
-        deleted = delete_process_group(headers, process_group_id)
+        # A failed group may be in an unknown state, so it is never returned to the pool.
+        process_group_pool.discard(process_group_id)
+        deleted = delete_process_group(process_group_id)
         if deleted:
             logger.info(f"Module:NiFiController. NiFi flow {process_group_id} deleted successfully.")
 
     except Exception as e:
         logger.error(f"Module:NiFiController. Error in removing the faulty process: {str(e)}")
 
+@traced("nifi.instantiate_flow")
 def instantiate_flow(connection:Connection):
-    token = get_nifi_token()
-    headers = get_request_headers(token)
-    process_group_id = create_template_instance(headers, connection.source_type)
+    process_group_id = process_group_pool.checkout(connection.source_type) or create_template_instance(connection.source_type)
     if process_group_id:
-        payload = get_payload_from_variable_registry(headers, process_group_id)
+        payload = get_payload_from_variable_registry(process_group_id)
         if payload:
             update_payload = set_payload_on_variable_registry(payload, connection)
             if update_payload:
-                variable_updated = update_template_variable_registry(headers, process_group_id, update_payload)
+                variable_updated = update_template_variable_registry(process_group_id, update_payload)
                 if variable_updated:
-                    all_service_is_enabled = enable_controller_services_of_template(headers, process_group_id)
+                    all_service_is_enabled = enable_controller_services_of_template(process_group_id)
                     if all_service_is_enabled:
-                        process_started = start_the_process(headers, process_group_id)
+                        process_started = start_the_process(process_group_id)
                         if process_started:
                             connection.nifi_process_id = process_group_id
                             connection.state = "Loading"
+                            # Stored so the monitoring and the Kafka to Hadoop transfer continue this trace.
+                            connection.trace_context = inject_context()
                             new_conn = connection.save()
                             if new_conn:
-                                threading.Thread(
-                                    target=monitor_and_cleanup_process,
-                                    args=(headers, process_group_id, new_conn),
-                                    daemon=True
-                                ).start()
-                                return True
+                                return start_flow_monitoring(process_group_id, new_conn)
                             else:
                                 connection.update_state("Failed")
-                                remove_failed_template(headers, process_group_id, stage=3)
+                                remove_failed_template(process_group_id, stage=3)
                                 return False
                         else:
                             connection.update_state("Failed")
-                            remove_failed_template(headers, process_group_id, stage=2)
+                            remove_failed_template(process_group_id, stage=2)
                             return False
                     else:
                         connection.update_state("Failed")
                         logger.error(f"Failed to start flow because all controller is not enabled.")
-                        remove_failed_template(headers, process_group_id, stage=2)
+                        remove_failed_template(process_group_id, stage=2)
                         return False
                 else:
                     connection.update_state("Failed")
-                    remove_failed_template(headers, process_group_id, stage=1)
+                    remove_failed_template(process_group_id, stage=1)
                     return False
             else:
                 connection.update_state("Failed")
-                remove_failed_template(headers, process_group_id, stage=1)
+                remove_failed_template(process_group_id, stage=1)
                 return False
         else:
             connection.update_state("Failed")
-            remove_failed_template(headers, process_group_id, stage=1)
+            remove_failed_template(process_group_id, stage=1)
             return False
     else:
         connection.update_state("Failed")
-        remove_failed_template(headers, process_group_id, stage=1)
+        remove_failed_template(process_group_id, stage=1)
         return False
                     
 
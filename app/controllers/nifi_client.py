@@ -0,0 +1,200 @@
+import re
+import json
+import time
+import base64
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from opentelemetry.trace import SpanKind
+from typing import Dict, Optional
+from structlog import get_logger
+
+from app.config import config
+from app.metrics import nifi_request_seconds
+from app.tracing import span, inject_context, REQUEST_ID_KEY
+
+logger = get_logger()
+
+# Ids in request paths are replaced so latency is aggregated per endpoint rather than per component.
+ID_PATTERN = re.compile(r"/[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+class NiFiClient:
+    """
+        A thread safe NiFi REST client sharing one pooled keep-alive session. The access token is cached
+        and refreshed shortly before the expiry in its JWT, or when NiFi answers 401. Timeouts, connection
+        errors and server errors of idempotent requests are retried with jittered exponential backoff.
+        A conflict (409) on a request carrying a revision is retried once the current revision has been
+        read back, other conflicts are returned at once. The latency of every call is recorded per endpoint.
+    """
+    RETRY_STATUSES = (500, 502, 503, 504)
+    # A POST that timed out may have been applied, creating a second template instance or process group.
+    IDEMPOTENT_METHODS = ("GET", "PUT", "DELETE")
+    # Body keys of the revision a PUT is checked against, in the entities and in the variable registry.
+    REVISION_KEYS = ("revision", "processGroupRevision")
+
+    def __init__(self):
+        self.session = requests.Session()
+        self.session.verify = config.nifi.verify_ssl
+        adapter = HTTPAdapter(pool_connections=config.nifi.pool_size, pool_maxsize=config.nifi.pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.token = None
+        self.token_expires_at = 0.0
+        self.token_lock = threading.Lock()
+        self.latencies: Dict[str, Dict[str, float]] = {}
+        self.latencies_lock = threading.Lock()
+
+    @staticmethod
+    def get_token_expiry(token: str) -> float:
+        """
+            Read the expiry of a JWT as a unix timestamp, defaulting to one hour if it cannot be read.
+        """
+        try:
+            payload = token.split(".")[1]
+            payload += "=" * (-len(payload) % 4)
+            return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+        except Exception:
+            return time.time() + 3600
+
+    def get_token(self, refresh: bool = False) -> str:
+        with self.token_lock:
+            if refresh or self.token is None or time.time() > self.token_expires_at - config.nifi.token_refresh_margin:
+                logger.info(f"Module:NiFiClient. Generating NiFi Access Token.")
+                response = self.session.post(
+                    f"{config.nifi.get_api_url()}/access/token",
+                    data={"username": config.nifi.username, "password": config.nifi.password},
+                    headers={"Content-Type": "application/x-www-form-urlencoded"},
+                    timeout=config.nifi.request_timeout,
+                    verify=config.nifi.verify_ssl
+                )
+                if response.status_code != 201:
+                    raise requests.exceptions.HTTPError(f"Failed to get token: {response.text}", response=response)
+                self.token = response.text
+                self.token_expires_at = self.get_token_expiry(self.token)
+                logger.info(f"Module:NiFiClient. Successfully generated the access token.")
+            return self.token
+
+    @staticmethod
+    def endpoint_template(path: str) -> str:
+        return ID_PATTERN.sub('/{id}', path.split('?')[0])
+
+    def record_latency(self, method: str, path: str, elapsed: float, status: str):
+        template = self.endpoint_template(path)
+        nifi_request_seconds.labels(method=method, endpoint=template, status=status).observe(elapsed)
+        endpoint = f"{method} {template}"
+        with self.latencies_lock:
+            stats = self.latencies.setdefault(endpoint, {"count": 0, "total": 0.0, "max": 0.0})
+            stats["count"] += 1
+            stats["total"] += elapsed
+            stats["max"] = max(stats["max"], elapsed)
+
+    def latency_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+            Return the call count, mean and max latency in seconds of every endpoint called so far.
+        """
+        with self.latencies_lock:
+            return {
+                endpoint: {"count": stats["count"], "mean": stats["total"] / stats["count"], "max": stats["max"]}
+                for endpoint, stats in self.latencies.items()
+            }
+
+    def request(self, method: str, path: str, idempotent: Optional[bool] = None, **kwargs) -> requests.Response:
+        """
+            Send a request to a path of the NiFi API, such as /process-groups/root. POSTs are only
+            retried when the caller marks them idempotent, such as a request to drop a queue.
+        """
+        url = f"{config.nifi.get_api_url()}{path}"
+        kwargs.setdefault("timeout", config.nifi.request_timeout)
+        # Passed on every call, a session level verify is overridden by REQUESTS_CA_BUNDLE.
+        kwargs.setdefault("verify", config.nifi.verify_ssl)
+        # Only recorded inside a trace, so the status polls of the flow monitor do not start traces of their own.
+        with span(f"NiFi {method} {self.endpoint_template(path)}", child_only=True, kind=SpanKind.CLIENT,
+                  **{"http.request.method": method, "url.path": path}) as current:
+            if idempotent is None:
+                idempotent = method in self.IDEMPOTENT_METHODS
+            response = self.send(method, url, path, idempotent, **kwargs)
+            if current is not None:
+                current.set_attribute("http.response.status_code", response.status_code)
+            return response
+
+    def refresh_revision(self, url: str, kwargs: Dict) -> bool:
+        """
+            After a 409, replace the revision sent in the body or the version query parameter with the
+            current revision of the component. Returns False when the request carries no revision or the
+            component cannot be read, in which case the conflict is final. The variable registry carries
+            the revision of its process group under processGroupRevision instead of revision.
+        """
+        body, params = kwargs.get("json"), kwargs.get("params")
+        revision_key = next((key for key in self.REVISION_KEYS if isinstance(body, dict) and key in body), None)
+        in_body = revision_key is not None
+        in_params = isinstance(params, dict) and "version" in params
+        if not (in_body or in_params):
+            return False
+        try:
+            response = self.session.get(url, headers={"Authorization": f"Bearer {self.get_token()}"},
+                                        timeout=kwargs["timeout"], verify=kwargs["verify"])
+            revision = response.json().get(revision_key or "revision") if response.status_code == 200 else None
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"Module:NiFiClient. Failed to read the current revision of {url}: {e}")
+            return False
+        if not revision:
+            return False
+        if in_body:
+            kwargs["json"] = {**body, revision_key: {**body[revision_key], "version": revision["version"]}}
+        if in_params:
+            kwargs["params"] = {**params, "version": revision["version"]}
+        return True
+
+    def send(self, method: str, url: str, path: str, idempotent: bool, **kwargs) -> requests.Response:
+        refreshed = False
+        attempt = 0
+        # The trace context and the X-Request-ID of the caller are passed on to NiFi.
+        propagated = {("X-Request-ID" if key == REQUEST_ID_KEY else key): value for key, value in inject_context().items()}
+        while True:
+            headers = {"Authorization": f"Bearer {self.get_token()}", "Content-Type": "application/json", **propagated}
+            started = time.perf_counter()
+            response = None
+            try:
+                response = self.session.request(method, url, headers=headers, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if not idempotent or attempt >= config.nifi.max_retries:
+                    raise
+                logger.warning(f"Module:NiFiClient. {method} {path} failed, retrying: {e}")
+            finally:
+                self.record_latency(method, path, time.perf_counter() - started,
+                                    str(response.status_code) if response is not None else "error")
+
+            if response is not None:
+                if response.status_code == 401 and not refreshed:
+                    # The token was revoked or expired early, get a new one and try again.
+                    self.get_token(refresh=True)
+                    refreshed = True
+                    continue
+                if attempt >= config.nifi.max_retries:
+                    return response
+                if response.status_code == 409:
+                    # The same stale revision can never succeed, a conflict is only retried with the current one.
+                    if not self.refresh_revision(url, kwargs):
+                        return response
+                elif response.status_code not in self.RETRY_STATUSES or not idempotent:
+                    return response
+                logger.warning(f"Module:NiFiClient. {method} {path} returned {response.status_code}, retrying.")
+
+            delay = min(config.nifi.retry_backoff * (2 ** attempt), config.nifi.retry_max_backoff)
+            time.sleep(random.uniform(0, delay))
+            attempt += 1
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path: str, **kwargs) -> requests.Response:
+        return self.request("PUT", path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", path, **kwargs)
+
+nifi_client = NiFiClient()
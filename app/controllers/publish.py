@@ -0,0 +1,216 @@
+import time
+from typing import List, Optional
+from clickhouse_connect.driver.binding import quote_identifier
+from structlog import get_logger
+from pyspark.sql import SparkSession, DataFrame
+from pyspark.sql.functions import col, to_json
+from pyspark.sql.types import (
+    DataType, StructType, ArrayType, MapType, StringType, BooleanType, ByteType, ShortType, IntegerType,
+    LongType, FloatType, DoubleType, DecimalType, DateType, TimestampType
+)
+
+from app.models.connection import Connection
+from app.models.dataset import Dataset
+from app.models.connector.sql_server import SQLServer
+from app.controllers.hadoop import get_hdfs_path, read_manifest
+from app.controllers.delta import parse_payload
+from app.config import config
+from app.metrics import publish_datasets
+
+logger = get_logger()
+
+SPARK_TO_CLICKHOUSE_TYPES = {
+    StringType: "String",
+    BooleanType: "Bool",
+    ByteType: "Int8",
+    ShortType: "Int16",
+    IntegerType: "Int32",
+    LongType: "Int64",
+    FloatType: "Float32",
+    DoubleType: "Float64",
+    DateType: "Date32",
+    TimestampType: "DateTime64(6)",
+}
+
+def clickhouse_type(data_type: DataType, nullable: bool = True) -> str:
+    '''
+    Map a Spark column type to a ClickHouse type. Nested types are stored as JSON strings.
+    '''
+    if isinstance(data_type, DecimalType):
+        base_type = f"Decimal({data_type.precision}, {data_type.scale})"
+    else:
+        base_type = SPARK_TO_CLICKHOUSE_TYPES.get(type(data_type), "String")
+    return f"Nullable({base_type})" if nullable else base_type
+
+def get_source_primary_key(connection: Connection, table: str) -> List[str]:
+    '''
+    Return the primary key columns of a source table, used as the sort key of its ClickHouse table.
+    '''
+    if connection.source_type == "Microsoft SQL Server":
+        return SQLServer(**connection.connection_properties).get_primary_key(table) or []
+    return []
+
+def build_create_table_query(schema: StructType, sort_key: List[str]) -> str:
+    '''
+    Build the CREATE TABLE statement of a MergeTree table for a dataset schema. The sort key columns
+    cannot be Nullable without allow_nullable_key, so they are declared with their plain type and
+    a null key is stored as the default value of the type (see insert_arrow_batches).
+    '''
+    columns = [
+        f"{quote_identifier(field.name)} {clickhouse_type(field.dataType, nullable=field.name not in sort_key)}"
+        for field in schema.fields
+    ]
+    order_by = f"({', '.join(quote_identifier(name) for name in sort_key)})" if sort_key else "tuple()"
+    return (
+        f"CREATE TABLE {{database:Identifier}}.{{table:Identifier}} ({', '.join(columns)}) "
+        f"ENGINE = MergeTree ORDER BY {order_by}"
+    )
+
+def flatten_nested_columns(records: DataFrame) -> DataFrame:
+    '''
+    Serialize struct, array and map columns to JSON strings so every value maps to a scalar ClickHouse type.
+    '''
+    for field in records.schema.fields:
+        if isinstance(field.dataType, (StructType, ArrayType, MapType)):
+            records = records.withColumn(field.name, to_json(col(field.name)))
+    return records
+
+def insert_arrow_batches(records: DataFrame, database: str, table: str) -> int:
+    '''
+    Insert the rows of a DataFrame into ClickHouse from the executors, partition by partition, as Arrow
+    tables of up to CLICKHOUSE_PUBLISH_BATCH_SIZE rows. No row goes through the driver.
+    '''
+    connection_settings = {
+        "host": config.clickhouse.host, "port": config.clickhouse.port,
+        "username": config.clickhouse.username, "password": config.clickhouse.password
+    }
+    batch_size = config.clickhouse.publish_batch_size
+    # Nulls in the non-Nullable sort key columns become the default of the type, as ifNull(key, default) would.
+    insert_settings = {"input_format_null_as_default": 1}
+
+    # Defined here so it is shipped to the executors by value and only needs clickhouse-connect and pyarrow there.
+    def insert_partition(batches):
+        import pyarrow as pa
+        from clickhouse_connect import get_client
+        client = get_client(database=database, **connection_settings)
+        pending, pending_rows, row_count = [], 0, 0
+        try:
+            for batch in batches:
+                pending.append(batch)
+                pending_rows += batch.num_rows
+                if pending_rows >= batch_size:
+                    client.insert_arrow(table, pa.Table.from_batches(pending), database=database, settings=insert_settings)
+                    row_count += pending_rows
+                    pending, pending_rows = [], 0
+            if pending_rows:
+                client.insert_arrow(table, pa.Table.from_batches(pending), database=database, settings=insert_settings)
+                row_count += pending_rows
+        finally:
+            client.close()
+        yield pa.RecordBatch.from_pydict({"rows": [row_count]})
+
+    return sum(row["rows"] for row in records.mapInArrow(insert_partition, "rows long").collect())
+
+def read_dataset(spark: SparkSession, topic_prefix: str, dataset_name: str) -> Optional[DataFrame]:
+    '''
+    Read the typed records of a dataset. With the columnar sink enabled they are read from its Delta or
+    Parquet table, otherwise the JSON output is parsed again. Returns None when there is nothing to read.
+    '''
+    if config.delta.enabled:
+        sink_path = get_hdfs_path(f"{config.delta.root}/{topic_prefix}/{dataset_name}")
+        # ingest_date only partitions the sink, the JSON output has no such column.
+        return spark.read.format(config.delta.format).load(sink_path).drop("ingest_date")
+
+    folder_path = f"/DataLake/{topic_prefix}/{dataset_name}"
+    # The manifest names every file of the dataset, so the folder does not have to be listed.
+    manifest = read_manifest(folder_path, use_cache=False)
+    if manifest:
+        paths = [get_hdfs_path(f"{folder_path}/{entry['path']}") for entry in manifest["files"]]
+    else:
+        paths = [get_hdfs_path(folder_path)]
+    if not paths:
+        return None
+    return parse_payload(spark.read.json(paths), dataset_name)
+
+def publish_dataset(spark: SparkSession, connection: Connection, database: str, topic_prefix: str, dataset_name: str) -> bool:
+    '''
+    This function materializes one dataset from its HDFS output into a ClickHouse MergeTree table and
+    registers it as a Dataset. The table is rebuilt in a staging table and swapped in atomically, so the
+    API keeps serving the previous version until the new one is complete.
+    '''
+    folder_path = f"/DataLake/{topic_prefix}/{dataset_name}"
+    table = dataset_name
+    staging_table = f"{table}__staging"
+    try:
+        logger.info(f"Module:PublishController. Start publishing dataset {folder_path} to ClickHouse table {database}.{table}")
+        records = read_dataset(spark, topic_prefix, dataset_name)
+        if records is None:
+            logger.info(f"Module:PublishController. Dataset {folder_path} has no files to publish.")
+            return True
+        records = flatten_nested_columns(records)
+        sort_key = [name for name in get_source_primary_key(connection, dataset_name) if name in records.columns]
+
+        with config.clickhouse.connection(database) as client:
+            parameters = {"database": database, "table": staging_table}
+            client.command("DROP TABLE IF EXISTS {database:Identifier}.{table:Identifier}", parameters=parameters)
+            client.command(build_create_table_query(records.schema, sort_key), parameters=parameters)
+            row_count = insert_arrow_batches(records, database, staging_table)
+
+            # EXCHANGE swaps both tables atomically; on the first publish there is nothing to swap with.
+            exists = client.command("EXISTS TABLE {database:Identifier}.{table:Identifier}", parameters={"database": database, "table": table})
+            swap = "EXCHANGE TABLES" if int(exists) else "RENAME TABLE"
+            client.command(
+                f"{swap} {{database:Identifier}}.{{staging:Identifier}} {'AND' if int(exists) else 'TO'} {{database:Identifier}}.{{table:Identifier}}",
+                parameters={"database": database, "staging": staging_table, "table": table}
+            )
+            client.command("DROP TABLE IF EXISTS {database:Identifier}.{table:Identifier}", parameters=parameters)
+
+        Dataset.register(Dataset(
+            dataset_name=dataset_name,
+            api_version="v1",
+            dataset_owner=database,
+            visibility=config.clickhouse.publish_visibility,
+            table_name=table,
+            connection_id=connection.id
+        ))
+        logger.info(f"Module:PublishController. Published {row_count} rows to ClickHouse table {database}.{table}")
+        return True
+    except Exception as e:
+        logger.error(f"Module:PublishController. Failed to publish dataset {folder_path} to ClickHouse. {str(e)}")
+        return False
+
+def create_database(database: str) -> bool:
+    try:
+        with config.clickhouse.connection("default") as client:
+            client.command("CREATE DATABASE IF NOT EXISTS {database:Identifier}", parameters={"database": database})
+        return True
+    except Exception as e:
+        logger.error(f"Module:PublishController. Failed to create ClickHouse database {database}. {str(e)}")
+        return False
+
+def publish_connection_datasets(spark: SparkSession, connection: Connection, topic_prefix: str, dataset_list: List[str]) -> bool:
+    '''
+    This function publishes every dataset of a stored connection to ClickHouse, in a database named
+    after the topic prefix, and notifies the API service so cached results of the datasets are dropped.
+    Datasets that fail are retried CLICKHOUSE_PUBLISH_RETRIES times with exponential backoff.
+
+    Returns:
+    - bool: True if every dataset was published
+    '''
+    database = topic_prefix
+    pending = list(dataset_list)
+    for attempt in range(config.clickhouse.publish_retries + 1):
+        if attempt:
+            delay = config.clickhouse.publish_retry_backoff * (2 ** (attempt - 1))
+            logger.warning(f"Module:PublishController. Retrying the publish of {pending} in {delay:.0f}s.")
+            time.sleep(delay)
+        if create_database(database):
+            pending = [dataset_name for dataset_name in pending
+                       if not publish_dataset(spark, connection, database, topic_prefix, dataset_name)]
+        if not pending:
+            break
+
+    publish_datasets.labels(outcome="success").inc(len(dataset_list) - len(pending))
+    publish_datasets.labels(outcome="failure").inc(len(pending))
+    connection.notify_dataset_reload()
+    return not pending
@@ -0,0 +1,79 @@
+import atexit
+import threading
+from contextlib import contextmanager
+from structlog import get_logger
+from pyspark.sql import SparkSession
+
+from app.config import config
+
+logger = get_logger()
+
+class SparkService:
+    '''
+    Owns one long-lived SparkSession for the process so ingestion runs do not pay JVM startup,
+    package resolution and executor allocation every time. Jobs run in a FAIR scheduler pool per
+    connection so several connections can ingest at the same time.
+    '''
+    def __init__(self):
+        self.spark = None
+        self.lock = threading.Lock()
+
+    def create_session(self) -> SparkSession:
+        logger.info(f"Module:SparkService. Starting the shared Spark session.")
+        builder = SparkSession.builder \
+            .appName(config.spark.app_name) \
+            .config("spark.scheduler.mode", "FAIR")
+        if config.delta.uses_delta():
+            builder = builder \
+                .config("spark.sql.extensions", "io.delta.sql.DeltaSparkSessionExtension") \
+                .config("spark.sql.catalog.spark_catalog", "org.apache.spark.sql.delta.catalog.DeltaCatalog")
+        if config.spark.fair_scheduler_file:
+            builder = builder.config("spark.scheduler.allocation.file", config.spark.fair_scheduler_file)
+        spark = builder.getOrCreate()
+        logger.info(f"Module:SparkService. Shared Spark session started.")
+        return spark
+
+    def is_healthy(self) -> bool:
+        try:
+            return self.spark is not None and not self.spark.sparkContext._jsc.sc().isStopped()
+        except Exception as e:
+            logger.warning(f"Module:SparkService. Spark session health check failed: {e}")
+            return False
+
+    def get_session(self) -> SparkSession:
+        '''
+        Return the shared session, starting it or replacing it when it is not healthy.
+        '''
+        with self.lock:
+            if not self.is_healthy():
+                if self.spark is not None:
+                    logger.warning(f"Module:SparkService. Shared Spark session is not healthy, restarting it.")
+                    self.stop(locked=True)
+                self.spark = self.create_session()
+            return self.spark
+
+    @contextmanager
+    def scheduler_pool(self, pool_name: str):
+        '''
+        Run the Spark jobs and streaming queries started by the current thread in the given FAIR pool.
+        '''
+        spark_context = self.get_session().sparkContext
+        spark_context.setLocalProperty("spark.scheduler.pool", pool_name)
+        try:
+            yield
+        finally:
+            spark_context.setLocalProperty("spark.scheduler.pool", None)
+
+    def stop(self, locked: bool = False):
+        if not locked:
+            with self.lock:
+                return self.stop(locked=True)
+        if self.spark is not None:
+            try:
+                self.spark.stop()
+            except Exception as e:
+                logger.warning(f"Module:SparkService. Failed to stop the Spark session: {e}")
+            self.spark = None
+
+spark_service = SparkService()
+atexit.register(spark_service.stop)
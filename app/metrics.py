@@ -0,0 +1,125 @@
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Loads .env first, so PROMETHEUS_MULTIPROC_DIR is set before prometheus_client reads it.
+import app.config
+from prometheus_client import REGISTRY, CollectorRegistry, Histogram, Counter, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import multiprocess
+
+from app.tracing import span
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+SIZE_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000, 1_000_000_000)
+
+# Data API
+# Database and table label of data API requests that failed.
+UNKNOWN_LABEL = "unknown"
+api_request_seconds = Histogram(
+    "datastudio_api_request_seconds", "Time to produce an API response.",
+    ["method", "route", "status"], buckets=DURATION_BUCKETS
+)
+data_query_seconds = Histogram(
+    "datastudio_data_query_seconds", "ClickHouse query time of data API requests.",
+    ["database", "table"], buckets=DURATION_BUCKETS
+)
+data_serialization_seconds = Histogram(
+    "datastudio_data_serialization_seconds", "Time to render data API results.",
+    ["database", "table", "format"], buckets=DURATION_BUCKETS
+)
+data_stream_seconds = Histogram(
+    "datastudio_data_stream_seconds", "Time from query to last chunk of streamed data API responses.",
+    ["database", "table", "format"], buckets=DURATION_BUCKETS
+)
+data_rows = Histogram(
+    "datastudio_data_rows", "Rows returned per data API response.",
+    ["database", "table"], buckets=SIZE_BUCKETS
+)
+data_bytes = Histogram(
+    "datastudio_data_bytes", "Bytes returned per data API response.",
+    ["database", "table", "format"], buckets=SIZE_BUCKETS
+)
+data_cache_requests = Counter(
+    "datastudio_data_cache_requests", "Result cache lookups of the data API.", ["result"]
+)
+
+# NiFi
+nifi_stage_seconds = Histogram(
+    "datastudio_nifi_stage_seconds", "Duration of each stage of instantiating and cleaning up NiFi flows.",
+    ["stage", "outcome"], buckets=DURATION_BUCKETS
+)
+nifi_request_seconds = Histogram(
+    "datastudio_nifi_request_seconds", "Latency of NiFi REST calls.",
+    ["method", "endpoint", "status"], buckets=DURATION_BUCKETS
+)
+nifi_flow_seconds = Histogram(
+    "datastudio_nifi_flow_seconds", "Time from starting a NiFi flow to detecting its completion.",
+    ["source_type"], buckets=DURATION_BUCKETS
+)
+
+# Spark
+spark_batch_seconds = Histogram(
+    "datastudio_spark_batch_seconds", "Duration of writing one Spark micro-batch to HDFS.",
+    ["mode", "dataset"], buckets=DURATION_BUCKETS
+)
+spark_batch_rows = Counter(
+    "datastudio_spark_batch_rows", "Rows written to HDFS by Spark micro-batches.", ["mode", "dataset"]
+)
+spark_batch_rows_per_second = Histogram(
+    "datastudio_spark_batch_rows_per_second", "Throughput of Spark micro-batches written to HDFS.",
+    ["mode", "dataset"], buckets=(10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+)
+
+# ClickHouse publishing
+publish_datasets = Counter(
+    "datastudio_publish_datasets", "Datasets published to ClickHouse after being stored, by outcome.", ["outcome"]
+)
+
+@contextmanager
+def observe_duration(histogram: Histogram, **labels):
+    """
+        Record the duration of the block. A block that raises is recorded with its database and table
+        labels set to UNKNOWN_LABEL, so failed requests for arbitrary names add no series.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        labels = {**labels, **{name: UNKNOWN_LABEL for name in ("database", "table") if name in labels}}
+        raise
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start)
+
+def observe_stage(stage: str):
+    """
+        Decorate a NiFi stage function to record its duration, labelled with whether it returned a truthy value.
+        Inside a trace the stage also gets a span, parent of the spans of its NiFi calls.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                with span(f"nifi.{stage}", child_only=True) as current:
+                    result = func(*args, **kwargs)
+                    outcome = "success" if result else "failure"
+                    if current is not None:
+                        current.set_attribute("nifi.outcome", outcome)
+                    return result
+            finally:
+                nifi_stage_seconds.labels(stage=stage, outcome=outcome).observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def render_metrics():
+    """
+        Render the metrics of this process, or of every process sharing PROMETHEUS_MULTIPROC_DIR when it is set.
+        The NiFi and Spark metrics are recorded by the UI and the workers, so without it /metrics lacks them.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
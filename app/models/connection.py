@@ -1,14 +1,18 @@
 from datetime import datetime, timezone
 from psycopg2.extras import Json
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Tuple
 
 from dataclasses import dataclass, field
 from structlog import get_logger
 
-from app.config import config
+from app.models.repository import transaction, fetch_one, fetch_all
+from app.tracing import traced
 
 logger = get_logger()
 
+# Postgres NOTIFY channel the API result cache listens on for dataset reloads.
+DATASET_RELOAD_CHANNEL = "dataset_reload"
+
 @dataclass
 class Connection:
     id: Optional[int] = None
@@ -17,6 +21,8 @@ class Connection:
     state: Optional[str] = None
     connection_properties: Dict[str, str] = field(default_factory=dict)
     nifi_process_id: Optional[str] = None
+    # W3C trace context and X-Request-ID of the action that started the ingestion, continued by the jobs.
+    trace_context: Dict[str, str] = field(default_factory=dict)
     create_date: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
 
     @staticmethod
@@ -28,83 +34,169 @@ class Connection:
                     state = record["state"],
                     connection_properties = record["connection_properties"],
                     nifi_process_id = record["nifi_process_id"],
+                    trace_context = record["trace_context"] or {},
                     create_date = record["create_date"].strftime("%d %b %Y, %H:%M %p")
                 )
 
+    @traced("postgres.Connection.save", child_only=True)
     def save(self):
         """
         Inserts data into the Connections table.
         """
         logger.info(f"Module:ConnectionModels. Started inserting data into Connection table.")
         try:
-            conn = config.database.get_connection()
-            with conn.cursor() as cursor:
+            with transaction() as cursor:
                 insert_query = """
                     INSERT INTO Connections (
-                        connection_name, source_type, connection_properties, state, nifi_process_id
-                    ) VALUES (%s, %s, %s, %s, %s)
-                    RETURNING id, connection_name, source_type, state, connection_properties, nifi_process_id, create_date;
+                        connection_name, source_type, connection_properties, state, nifi_process_id, trace_context
+                    ) VALUES (%s, %s, %s, %s, %s, %s)
+                    RETURNING id, connection_name, source_type, state, connection_properties, nifi_process_id, trace_context, create_date;
                 """
                 cursor.execute(insert_query, (
                     self.connection_name,
                     self.source_type,
                     Json(self.connection_properties),
                     self.state,
-                    self.nifi_process_id
+                    self.nifi_process_id,
+                    Json(self.trace_context)
                 ))
-                inserted_record = cursor.fetchone()
-                columns = [desc[0] for desc in cursor.description]
-                inserted_record = dict(zip(columns, inserted_record))
-                new_connection = Connection.return_connection(inserted_record)
-
-                conn.commit()
-                logger.info(f"Module:ConnectionModels. Insert into Connection table is successful. Record ID: {new_connection.id}")
-                return new_connection
+                new_connection = Connection.return_connection(fetch_one(cursor))
+
+            logger.info(f"Module:ConnectionModels. Insert into Connection table is successful. Record ID: {new_connection.id}")
+            return new_connection
         except Exception as e:
-            if conn:
-                conn.rollback()
             logger.error(f"Module:ConnectionModels. Insert into Connection table is failed: {e}")
-        finally:
-            if 'cursor' in locals() and cursor:
-                cursor.close()
-            if 'conn' in locals() and conn:
-                conn.close()
 
     @staticmethod
+    @traced("postgres.Connection.get", child_only=True)
+    def get(connection_id) -> Optional["Connection"]:
+        """
+        Retrieves a single record of the Connections table by id.
+        """
+        try:
+            with transaction() as cursor:
+                cursor.execute("""
+                    SELECT 
+                        id, connection_name, source_type, state, connection_properties, nifi_process_id, trace_context, create_date
+                    FROM Connections WHERE id = %s;
+                """, (int(connection_id),))
+                record = fetch_one(cursor)
+            return Connection.return_connection(record) if record else None
+        except Exception as e:
+            logger.error(f"Module:ConnectionModels. Failed to retrieve Connection ID {connection_id}: {e}")
+            return None
+
+    @staticmethod
+    @traced("postgres.Connection.list_all", child_only=True)
     def list_all():
         """
         Retrieves all records from the Connections table.
         """
         logger.info("Module:ConnectionModels. Started retrieving data from Connection table.")
         try:
-            conn = config.database.get_connection()
-            with conn.cursor() as cursor:
+            with transaction() as cursor:
                 select_query = """
                     SELECT 
-                        id, connection_name, source_type, state, connection_properties, nifi_process_id, create_date
+                        id, connection_name, source_type, state, connection_properties, nifi_process_id, trace_context, create_date
                     FROM Connections ORDER BY id DESC;
                 """
                 cursor.execute(select_query)
-                rows = cursor.fetchall()
-                columns = [desc[0] for desc in cursor.description]
-
-                results = []
-                for row in rows:
-                    record = dict(zip(columns, row))
-                    results.append(Connection.return_connection(record))
+                results = [Connection.return_connection(record) for record in fetch_all(cursor)]
 
-                logger.info(f"Module:ConnectionModels. Retrieved {len(results)} record(s) from Connection table.")
-                return results
+            logger.info(f"Module:ConnectionModels. Retrieved {len(results)} record(s) from Connection table.")
+            return results
 
         except Exception as e:
             logger.error(f"Module:ConnectionModels. Failed to retrieve data from Connection table: {e}")
             return []
-        finally:
-            if 'cursor' in locals() and cursor:
-                cursor.close()
-            if 'conn' in locals() and conn:
-                conn.close()
 
+    @staticmethod
+    def filter_conditions(state: Optional[str] = None, source_type: Optional[str] = None) -> Tuple[List[str], List]:
+        conditions, params = [], []
+        if state:
+            conditions.append("state = %s")
+            params.append(state)
+        if source_type:
+            conditions.append("source_type = %s")
+            params.append(source_type)
+        return conditions, params
+
+    @staticmethod
+    @traced("postgres.Connection.list_page", child_only=True)
+    def list_page(page_size: int = 20, after_id: Optional[int] = None, state: Optional[str] = None,
+                  source_type: Optional[str] = None) -> Tuple[List["Connection"], Optional[int]]:
+        """
+        Retrieves one page of the Connections table, newest first, using keyset pagination on id.
+
+        Parameters:
+        - page_size: int — the number of records per page
+        - after_id: int — the last id of the previous page, or None for the first page
+        - state, source_type: str — optional filters
+
+        Returns:
+        - (records, next_after_id): next_after_id is None on the last page
+        """
+        logger.info(f"Module:ConnectionModels. Started retrieving a page of the Connection table after ID {after_id}.")
+        try:
+            conditions, params = Connection.filter_conditions(state, source_type)
+            if after_id is not None:
+                conditions.append("id < %s")
+                params.append(int(after_id))
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+            with transaction() as cursor:
+                select_query = f"""
+                    SELECT 
+                        id, connection_name, source_type, state, connection_properties, nifi_process_id, trace_context, create_date
+                    FROM Connections {where} ORDER BY id DESC LIMIT %s;
+                """
+                # Fetch one extra row to know whether another page follows.
+                cursor.execute(select_query, (*params, page_size + 1))
+                records = fetch_all(cursor)
+
+            results = [Connection.return_connection(record) for record in records[:page_size]]
+            next_after_id = int(results[-1].id) if len(records) > page_size else None
+            logger.info(f"Module:ConnectionModels. Retrieved {len(results)} record(s) from Connection table.")
+            return results, next_after_id
+
+        except Exception as e:
+            logger.error(f"Module:ConnectionModels. Failed to retrieve a page of the Connection table: {e}")
+            return [], None
+
+    @staticmethod
+    @traced("postgres.Connection.list_process_ids", child_only=True)
+    def list_process_ids(states: Tuple[str, ...]) -> List[str]:
+        """
+        Retrieves the NiFi process group ids of the connections in the given states.
+        """
+        try:
+            with transaction() as cursor:
+                cursor.execute(
+                    "SELECT nifi_process_id FROM Connections WHERE state = ANY(%s) AND nifi_process_id IS NOT NULL;",
+                    (list(states),)
+                )
+                return [row[0] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Module:ConnectionModels. Failed to retrieve process ids from Connection table: {e}")
+            return []
+
+    @staticmethod
+    @traced("postgres.Connection.count", child_only=True)
+    def count(state: Optional[str] = None, source_type: Optional[str] = None) -> int:
+        """
+        Counts the records of the Connections table that match the filters.
+        """
+        try:
+            conditions, params = Connection.filter_conditions(state, source_type)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            with transaction() as cursor:
+                cursor.execute(f"SELECT COUNT(*) FROM Connections {where};", params)
+                return cursor.fetchone()[0]
+        except Exception as e:
+            logger.error(f"Module:ConnectionModels. Failed to count records of the Connection table: {e}")
+            return 0
+
+    @traced("postgres.Connection.update_state", child_only=True)
     def update_state(self, new_state: str) -> bool:
         """
         Updates the state of a connection record.
@@ -117,8 +209,7 @@ class Connection:
         """
         logger.info(f"Module:ConnectionModels. Attempting to update state for Connection ID {self.id} to '{new_state}'.")
         try:
-            conn = config.database.get_connection()
-            with conn.cursor() as cursor:
+            with transaction() as cursor:
                 update_query = """
                     UPDATE Connections
                     SET state = %s
@@ -129,19 +220,45 @@ class Connection:
                     logger.warning(f"Module:ConnectionModels. No records updated. ID {self.id} may not exist.")
                     return False
 
-                conn.commit()
-                logger.info(f"Module:ConnectionModels. State updated successfully for Connection ID {self.id}.")
-                return True
+                # Tell the API service to drop cached results of this connection's datasets.
+                if new_state in ("Stored", "Loaded"):
+                    cursor.execute("SELECT pg_notify(%s, %s);", (DATASET_RELOAD_CHANNEL, str(self.id)))
+
+            logger.info(f"Module:ConnectionModels. State updated successfully for Connection ID {self.id}.")
+            return True
 
         except Exception as e:
             logger.error(f"Module:ConnectionModels. Failed to update state for Connection ID {self.id}: {e}")
             return False
-        finally:
-            if 'cursor' in locals() and cursor:
-                cursor.close()
-            if 'conn' in locals() and conn:
-                conn.close()
 
+    @traced("postgres.Connection.update_trace_context", child_only=True)
+    def update_trace_context(self, trace_context: Dict[str, str]) -> bool:
+        """
+        Replaces the stored trace context, so the next job of this connection continues the trace of a new action.
+        """
+        try:
+            with transaction() as cursor:
+                cursor.execute("UPDATE Connections SET trace_context = %s WHERE id = %s;", (Json(trace_context), self.id))
+            self.trace_context = trace_context
+            return True
+        except Exception as e:
+            logger.error(f"Module:ConnectionModels. Failed to update trace context for Connection ID {self.id}: {e}")
+            return False
+
+    @traced("postgres.Connection.notify_dataset_reload", child_only=True)
+    def notify_dataset_reload(self) -> bool:
+        """
+        Tells the API service that the datasets of this connection were reloaded, so their cached results are dropped.
+        """
+        try:
+            with transaction() as cursor:
+                cursor.execute("SELECT pg_notify(%s, %s);", (DATASET_RELOAD_CHANNEL, str(self.id)))
+            return True
+        except Exception as e:
+            logger.error(f"Module:ConnectionModels. Failed to notify dataset reload for Connection ID {self.id}: {e}")
+            return False
+
+    @traced("postgres.Connection.delete", child_only=True)
     def delete(self) -> bool:
         """
         Deletes the connection record from the database.
@@ -151,8 +268,7 @@ class Connection:
         """
         logger.info(f"Module:ConnectionModels. Attempting to delete Connection ID {self.id}.")
         try:
-            conn = config.database.get_connection()
-            with conn.cursor() as cursor:
+            with transaction() as cursor:
                 delete_query = """
                     DELETE FROM Connections
                     WHERE id = %s;
@@ -162,20 +278,9 @@ class Connection:
                     logger.warning(f"Module:ConnectionModels. No records deleted. ID {self.id} may not exist.")
                     return False
 
-                conn.commit()
-                logger.info(f"Module:ConnectionModels. Connection ID {self.id} deleted successfully.")
-                return True
+            logger.info(f"Module:ConnectionModels. Connection ID {self.id} deleted successfully.")
+            return True
 
         except Exception as e:
             logger.error(f"Module:ConnectionModels. Failed to delete Connection ID {self.id}: {e}")
             return False
-        finally:
-            if 'cursor' in locals() and cursor:
-                cursor.close()
-            if 'conn' in locals() and conn:
-                conn.close()
-
-
-
-
-
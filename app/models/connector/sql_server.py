@@ -47,3 +47,33 @@ class SQLServer:
             if 'conn' in locals() and conn:
                 conn.close()
 
+    def get_primary_key(self, table: str) -> List:
+        """
+            Retrieve the primary key columns of a table, in key order.
+        """
+        try:
+            logger.info(f"Module:SQLServerModels. Started retrieving the primary key of table {table}.")
+
+            conn_str = f"DRIVER={{ODBC Driver 18 for SQL Server}};SERVER={self.db_url};DATABASE={self.db_name};UID={self.db_username};PWD={self.db_password};TrustServerCertificate=yes;Encrypt=yes;"
+            conn = pyodbc.connect(conn_str)
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT kcu.COLUMN_NAME
+                FROM INFORMATION_SCHEMA.TABLE_CONSTRAINTS tc
+                JOIN INFORMATION_SCHEMA.KEY_COLUMN_USAGE kcu
+                    ON tc.CONSTRAINT_NAME = kcu.CONSTRAINT_NAME AND tc.TABLE_SCHEMA = kcu.TABLE_SCHEMA
+                WHERE tc.CONSTRAINT_TYPE = 'PRIMARY KEY' AND tc.TABLE_NAME = ?
+                ORDER BY kcu.ORDINAL_POSITION
+            """, table)
+            columns = [row[0] for row in cursor.fetchall()]
+
+            logger.info(f"Module:SQLServerModels. Successfully retrieved the primary key of table {table}.")
+            return columns
+        except Exception as e:
+            logger.error(f"Module:SQLServerModels. Failed to retrieve the primary key of table {table}: {e}")
+            return False
+        finally:
+            if 'cursor' in locals() and cursor:
+                cursor.close()
+            if 'conn' in locals() and conn:
+                conn.close()
@@ -1,10 +1,11 @@
 from datetime import datetime, timezone
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Tuple
 
 from dataclasses import dataclass, field
 from structlog import get_logger
 
-from app.config import config
+from app.models.repository import transaction, fetch_all
+from app.tracing import traced
 
 logger = get_logger()
 
@@ -35,39 +36,128 @@ class Dataset:
                 )
 
     @staticmethod
+    @traced("postgres.Dataset.register", child_only=True)
+    def register(dataset: "Dataset") -> Optional["Dataset"]:
+        """
+        Inserts a dataset into the Datasets table unless the connection already published the same table.
+        The unique index on the connection and table makes concurrent publishes of the same table register it once.
+        """
+        logger.info(f"Module:DatasetModels. Started registering dataset {dataset.dataset_owner}.{dataset.table_name}.")
+        try:
+            with transaction() as cursor:
+                insert_query = """
+                    INSERT INTO Datasets (
+                        dataset_name, api_version, dataset_owner, visibility, table_name, dashboard_url, connection_id
+                    )
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (connection_id, dataset_owner, table_name) DO NOTHING
+                    RETURNING id, dataset_name, api_version, dataset_owner, visibility, table_name, dashboard_url, connection_id, create_date;
+                """
+                cursor.execute(insert_query, (
+                    dataset.dataset_name,
+                    dataset.api_version,
+                    dataset.dataset_owner,
+                    dataset.visibility,
+                    dataset.table_name,
+                    dataset.dashboard_url,
+                    dataset.connection_id
+                ))
+                records = fetch_all(cursor)
+
+            if not records:
+                logger.info(f"Module:DatasetModels. Dataset {dataset.dataset_owner}.{dataset.table_name} is already registered.")
+                return None
+            new_dataset = Dataset.return_dataset(records[0])
+            logger.info(f"Module:DatasetModels. Registered dataset. Record ID: {new_dataset.id}")
+            return new_dataset
+        except Exception as e:
+            logger.error(f"Module:DatasetModels. Failed to register dataset {dataset.dataset_owner}.{dataset.table_name}: {e}")
+            return None
+
+    @staticmethod
+    @traced("postgres.Dataset.list_all", child_only=True)
     def list_all():
         """
         Retrieves all records from the Datasets table.
         """
         logger.info("Module:DatasetModels. Started retrieving data from Dataset table.")
         try:
-            conn = config.database.get_connection()
-            with conn.cursor() as cursor:
+            with transaction() as cursor:
                 select_query = """
                     SELECT 
                         id, dataset_name, api_version, dataset_owner, visibility, table_name, dashboard_url, connection_id, create_date
                     FROM Datasets;
                 """
                 cursor.execute(select_query)
-                rows = cursor.fetchall()
-                columns = [desc[0] for desc in cursor.description]
-
-                results = []
-                for row in rows:
-                    record = dict(zip(columns, row))
-                    results.append(Dataset.return_dataset(record))
+                results = [Dataset.return_dataset(record) for record in fetch_all(cursor)]
 
-                logger.info(f"Module:DatasetModels. Retrieved {len(results)} record(s) from Dataset table.")
-                return results
+            logger.info(f"Module:DatasetModels. Retrieved {len(results)} record(s) from Dataset table.")
+            return results
 
         except Exception as e:
             logger.error(f"Module:DatasetModels. Failed to retrieve data from Dataset table: {e}")
             return []
-        finally:
-            if 'cursor' in locals() and cursor:
-                cursor.close()
-            if 'conn' in locals() and conn:
-                conn.close()
 
+    @staticmethod
+    def filter_conditions(dataset_owner: Optional[str] = None, connection_id: Optional[int] = None) -> Tuple[List[str], List]:
+        conditions, params = [], []
+        if dataset_owner:
+            conditions.append("dataset_owner = %s")
+            params.append(dataset_owner)
+        if connection_id is not None:
+            conditions.append("connection_id = %s")
+            params.append(int(connection_id))
+        return conditions, params
 
+    @staticmethod
+    @traced("postgres.Dataset.list_page", child_only=True)
+    def list_page(page_size: int = 20, after_id: Optional[int] = None, dataset_owner: Optional[str] = None,
+                  connection_id: Optional[int] = None) -> Tuple[List["Dataset"], Optional[int]]:
+        """
+        Retrieves one page of the Datasets table, newest first, using keyset pagination on id.
 
+        Returns:
+        - (records, next_after_id): next_after_id is None on the last page
+        """
+        logger.info(f"Module:DatasetModels. Started retrieving a page of the Dataset table after ID {after_id}.")
+        try:
+            conditions, params = Dataset.filter_conditions(dataset_owner, connection_id)
+            if after_id is not None:
+                conditions.append("id < %s")
+                params.append(int(after_id))
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+            with transaction() as cursor:
+                select_query = f"""
+                    SELECT 
+                        id, dataset_name, api_version, dataset_owner, visibility, table_name, dashboard_url, connection_id, create_date
+                    FROM Datasets {where} ORDER BY id DESC LIMIT %s;
+                """
+                # Fetch one extra row to know whether another page follows.
+                cursor.execute(select_query, (*params, page_size + 1))
+                records = fetch_all(cursor)
+
+            results = [Dataset.return_dataset(record) for record in records[:page_size]]
+            next_after_id = int(results[-1].id) if len(records) > page_size else None
+            logger.info(f"Module:DatasetModels. Retrieved {len(results)} record(s) from Dataset table.")
+            return results, next_after_id
+
+        except Exception as e:
+            logger.error(f"Module:DatasetModels. Failed to retrieve a page of the Dataset table: {e}")
+            return [], None
+
+    @staticmethod
+    @traced("postgres.Dataset.count", child_only=True)
+    def count(dataset_owner: Optional[str] = None, connection_id: Optional[int] = None) -> int:
+        """
+        Counts the records of the Datasets table that match the filters.
+        """
+        try:
+            conditions, params = Dataset.filter_conditions(dataset_owner, connection_id)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            with transaction() as cursor:
+                cursor.execute(f"SELECT COUNT(*) FROM Datasets {where};", params)
+                return cursor.fetchone()[0]
+        except Exception as e:
+            logger.error(f"Module:DatasetModels. Failed to count records of the Dataset table: {e}")
+            return 0
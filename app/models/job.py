@@ -0,0 +1,216 @@
+from datetime import datetime, timezone
+from psycopg2.extras import Json
+from typing import Optional, Dict, List, Tuple
+
+from dataclasses import dataclass, field
+from structlog import get_logger
+
+from app.models.repository import transaction, fetch_one, fetch_all
+from app.tracing import traced
+
+logger = get_logger()
+
+# Advisory lock serializing claims, so the concurrency caps hold across worker processes.
+CLAIM_LOCK_ID = 7_340_021
+
+@dataclass
+class Job:
+    id: Optional[int] = None
+    job_type: str = ""
+    connection_id: Optional[int] = None
+    source_type: str = ""
+    payload: Dict = field(default_factory=dict)
+    status: str = "queued"
+    attempts: int = 0
+    worker_id: Optional[str] = None
+    error: Optional[str] = None
+    create_date: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+    @staticmethod
+    def return_job(record : Dict):
+        return Job(
+                    id = record["id"],
+                    job_type = record["job_type"],
+                    connection_id = record["connection_id"],
+                    source_type = record["source_type"],
+                    payload = record["payload"],
+                    status = record["status"],
+                    attempts = record["attempts"],
+                    worker_id = record["worker_id"],
+                    error = record["error"],
+                    create_date = record["create_date"]
+                )
+
+    @staticmethod
+    @traced("postgres.Job.enqueue", child_only=True)
+    def enqueue(job_type: str, connection_id, source_type: str, payload: Optional[Dict] = None) -> Optional["Job"]:
+        """
+        Inserts a queued job, unless the connection already has an active job of the same type.
+
+        Returns:
+        - Job: the new job, or None if one is already queued or running or the insert failed
+        """
+        logger.info(f"Module:JobModels. Enqueuing {job_type} job for Connection ID {connection_id}.")
+        try:
+            with transaction() as cursor:
+                insert_query = """
+                    INSERT INTO Jobs (job_type, connection_id, source_type, payload)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (connection_id, job_type) WHERE status IN ('queued', 'running') DO NOTHING
+                    RETURNING id, job_type, connection_id, source_type, payload, status, attempts, worker_id, error, create_date;
+                """
+                cursor.execute(insert_query, (job_type, int(connection_id), source_type, Json(payload or {})))
+                record = fetch_one(cursor)
+
+            if record is None:
+                logger.warning(f"Module:JobModels. A {job_type} job is already active for Connection ID {connection_id}.")
+                return None
+            return Job.return_job(record)
+        except Exception as e:
+            logger.error(f"Module:JobModels. Failed to enqueue {job_type} job for Connection ID {connection_id}: {e}")
+            return None
+
+    @staticmethod
+    @traced("postgres.Job.is_active", child_only=True)
+    def is_active(job_type: str, connection_id) -> bool:
+        """
+        Whether the connection has a queued or running job of the type.
+        """
+        try:
+            with transaction() as cursor:
+                cursor.execute("""
+                    SELECT 1 FROM Jobs WHERE job_type = %s AND connection_id = %s AND status IN ('queued', 'running');
+                """, (job_type, int(connection_id)))
+                return cursor.fetchone() is not None
+        except Exception as e:
+            logger.error(f"Module:JobModels. Failed to look up {job_type} jobs of Connection ID {connection_id}: {e}")
+            return False
+
+    @staticmethod
+    @traced("postgres.Job.claim", child_only=True)
+    def claim(worker_id: str, job_type: str, max_running: int, max_running_per_source: int) -> Optional["Job"]:
+        """
+        Claims the oldest queued job of a type, if the type is below its concurrency caps overall
+        and for the job's source type.
+        """
+        try:
+            with transaction() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s);", (CLAIM_LOCK_ID,))
+                select_query = """
+                    SELECT j.id FROM Jobs j
+                    WHERE j.status = 'queued' AND j.job_type = %(job_type)s
+                      AND (SELECT COUNT(*) FROM Jobs r WHERE r.status = 'running' AND r.job_type = j.job_type) < %(max_running)s
+                      AND (SELECT COUNT(*) FROM Jobs r WHERE r.status = 'running' AND r.job_type = j.job_type
+                                                         AND r.source_type = j.source_type) < %(max_per_source)s
+                    ORDER BY j.id
+                    LIMIT 1
+                    FOR UPDATE OF j SKIP LOCKED;
+                """
+                cursor.execute(select_query, {
+                    "job_type": job_type, "max_running": max_running, "max_per_source": max_running_per_source
+                })
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+
+                update_query = """
+                    UPDATE Jobs
+                    SET status = 'running', worker_id = %s, attempts = attempts + 1,
+                        start_date = CURRENT_TIMESTAMP, heartbeat_date = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                    RETURNING id, job_type, connection_id, source_type, payload, status, attempts, worker_id, error, create_date;
+                """
+                cursor.execute(update_query, (worker_id, row[0]))
+                job = Job.return_job(fetch_one(cursor))
+
+            logger.info(f"Module:JobModels. Worker {worker_id} claimed {job.job_type} job {job.id}.")
+            return job
+        except Exception as e:
+            logger.error(f"Module:JobModels. Failed to claim a {job_type} job: {e}")
+            return None
+
+    @staticmethod
+    @traced("postgres.Job.heartbeat", child_only=True)
+    def heartbeat(worker_id: str, job_ids: List[int]) -> bool:
+        """
+        Marks the running jobs of a worker as alive.
+        """
+        try:
+            with transaction() as cursor:
+                cursor.execute("""
+                    UPDATE Jobs SET heartbeat_date = CURRENT_TIMESTAMP
+                    WHERE id = ANY(%s) AND worker_id = %s AND status = 'running';
+                """, (job_ids, worker_id))
+            return True
+        except Exception as e:
+            logger.error(f"Module:JobModels. Failed to record heartbeat of worker {worker_id}: {e}")
+            return False
+
+    @traced("postgres.Job.finish", child_only=True)
+    def finish(self, status: str, error: Optional[str] = None) -> bool:
+        """
+        Marks the job as succeeded or failed.
+        """
+        try:
+            with transaction() as cursor:
+                cursor.execute("""
+                    UPDATE Jobs SET status = %s, error = %s, finish_date = CURRENT_TIMESTAMP
+                    WHERE id = %s AND worker_id = %s;
+                """, (status, error, self.id, self.worker_id))
+            logger.info(f"Module:JobModels. Job {self.id} finished as {status}.")
+            return True
+        except Exception as e:
+            logger.error(f"Module:JobModels. Failed to finish job {self.id}: {e}")
+            return False
+
+    @staticmethod
+    @traced("postgres.Job.recover_stale", child_only=True)
+    def recover_stale(stale_after: float, max_attempts: int) -> Tuple[int, List[int]]:
+        """
+        Requeues running jobs whose worker stopped sending heartbeats. Jobs that already used
+        all their attempts are failed instead.
+
+        Returns:
+        - (requeued, failed_connection_ids)
+        """
+        try:
+            with transaction() as cursor:
+                cursor.execute("""
+                    UPDATE Jobs SET status = 'queued', worker_id = NULL
+                    WHERE status = 'running' AND attempts < %s
+                      AND heartbeat_date < CURRENT_TIMESTAMP - make_interval(secs => %s);
+                """, (max_attempts, stale_after))
+                requeued = cursor.rowcount
+                cursor.execute("""
+                    UPDATE Jobs SET status = 'failed', error = 'Worker stopped responding', finish_date = CURRENT_TIMESTAMP
+                    WHERE status = 'running' AND attempts >= %s
+                      AND heartbeat_date < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                    RETURNING connection_id;
+                """, (max_attempts, stale_after))
+                failed = [row[0] for row in cursor.fetchall()]
+            if requeued or failed:
+                logger.warning(f"Module:JobModels. Requeued {requeued} stale job(s), failed {len(failed)}.")
+            return requeued, failed
+        except Exception as e:
+            logger.error(f"Module:JobModels. Failed to recover stale jobs: {e}")
+            return 0, []
+
+    @staticmethod
+    @traced("postgres.Job.list_orphaned_connections", child_only=True)
+    def list_orphaned_connections(min_age: float = 0) -> List[Dict]:
+        """
+        Retrieves connections left Loading or Storing without an active job, e.g. after a crash.
+        Connections created less than min_age seconds ago are skipped.
+        """
+        try:
+            with transaction() as cursor:
+                cursor.execute("""
+                    SELECT c.id, c.state, c.source_type, c.nifi_process_id FROM Connections c
+                    WHERE c.state IN ('Loading', 'Storing')
+                      AND c.create_date < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                      AND NOT EXISTS (SELECT 1 FROM Jobs j WHERE j.connection_id = c.id AND j.status IN ('queued', 'running'));
+                """, (min_age,))
+                return fetch_all(cursor)
+        except Exception as e:
+            logger.error(f"Module:JobModels. Failed to retrieve orphaned connections: {e}")
+            return []
@@ -0,0 +1,65 @@
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from dataclasses import dataclass, field
+from structlog import get_logger
+
+from app.models.repository import transaction, fetch_all
+from app.tracing import traced
+
+logger = get_logger()
+
+@dataclass
+class KafkaOffset:
+    connection_id: int
+    topic: str
+    partition: int
+    committed_offset: int
+    update_date: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+    @staticmethod
+    @traced("postgres.KafkaOffset.save_offsets", child_only=True)
+    def save_offsets(connection_id: int, topic: str, offsets: Dict[int, int]) -> bool:
+        """
+        Records the last offset written to HDFS for every partition of a topic.
+
+        Parameters:
+        - offsets: Dict[int, int] — partition to the highest offset stored
+
+        Returns:
+        - bool: True if the offsets were saved, False otherwise
+        """
+        logger.info(f"Module:KafkaOffsetModels. Saving committed offsets of topic {topic} for Connection ID {connection_id}.")
+        try:
+            with transaction() as cursor:
+                upsert_query = """
+                    INSERT INTO Kafka_Offsets (connection_id, topic, partition, committed_offset, update_date)
+                    VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+                    ON CONFLICT (connection_id, topic, partition) DO UPDATE
+                    SET committed_offset = GREATEST(Kafka_Offsets.committed_offset, EXCLUDED.committed_offset),
+                        update_date = EXCLUDED.update_date;
+                """
+                cursor.executemany(upsert_query, [
+                    (connection_id, topic, partition, offset) for partition, offset in offsets.items()
+                ])
+            return True
+        except Exception as e:
+            logger.error(f"Module:KafkaOffsetModels. Failed to save committed offsets of topic {topic}: {e}")
+            return False
+
+    @staticmethod
+    @traced("postgres.KafkaOffset.list_for_connection", child_only=True)
+    def list_for_connection(connection_id: int) -> List["KafkaOffset"]:
+        """
+        Retrieves the committed offsets of every topic of a connection.
+        """
+        try:
+            with transaction() as cursor:
+                cursor.execute("""
+                    SELECT connection_id, topic, partition, committed_offset, update_date
+                    FROM Kafka_Offsets WHERE connection_id = %s ORDER BY topic, partition;
+                """, (connection_id,))
+                return [KafkaOffset(**record) for record in fetch_all(cursor)]
+        except Exception as e:
+            logger.error(f"Module:KafkaOffsetModels. Failed to retrieve committed offsets for Connection ID {connection_id}: {e}")
+            return []
@@ -0,0 +1,149 @@
+from typing import Optional
+
+from structlog import get_logger
+
+from app.models.repository import transaction, fetch_one
+from app.tracing import traced
+
+logger = get_logger()
+
+# Advisory lock serializing the size checks of the warm pool, so it is never overfilled by concurrent processes.
+POOL_LOCK_ID = 7_340_020
+
+class PoolGroup:
+    """
+    The rows of the Pool_Groups table are the single owner of the NiFi warm pool. Every process checks
+    groups out and returns them through this table, so a group is only ever handed to one connection.
+
+    A row is 'creating' while its process group is instantiated, 'idle' when it can be checked out and
+    'in_use' while a connection runs on it. The size of the pool of a source type counts its creating
+    and idle rows.
+    """
+
+    @staticmethod
+    @traced("postgres.PoolGroup.reserve", child_only=True)
+    def reserve(source_type: str, size: int, stale_after: float) -> Optional[int]:
+        """
+        Reserves a slot for a new process group if the pool of the source type is below its size.
+        Reservations older than stale_after seconds were left by a crashed process and are dropped first.
+
+        Returns:
+        - int: the id of the reserved row, or None if the pool is full or the reservation failed
+        """
+        try:
+            with transaction() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s);", (POOL_LOCK_ID,))
+                cursor.execute("""
+                    DELETE FROM Pool_Groups
+                    WHERE state = 'creating' AND update_date < CURRENT_TIMESTAMP - make_interval(secs => %s);
+                """, (stale_after,))
+                cursor.execute("""
+                    INSERT INTO Pool_Groups (source_type, state)
+                    SELECT %(source_type)s, 'creating'
+                    WHERE (SELECT COUNT(*) FROM Pool_Groups
+                           WHERE source_type = %(source_type)s AND state IN ('creating', 'idle')) < %(size)s
+                    RETURNING id;
+                """, {"source_type": source_type, "size": size})
+                row = cursor.fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            logger.error(f"Module:PoolGroupModels. Failed to reserve a {source_type} warm pool slot: {e}")
+            return None
+
+    @staticmethod
+    @traced("postgres.PoolGroup.add", child_only=True)
+    def add(slot_id: int, process_group_id: str) -> bool:
+        """
+        Makes the process group created for a reserved slot available for checkout.
+        """
+        try:
+            with transaction() as cursor:
+                cursor.execute("""
+                    UPDATE Pool_Groups SET process_group_id = %s, state = 'idle', update_date = CURRENT_TIMESTAMP
+                    WHERE id = %s AND state = 'creating';
+                """, (process_group_id, slot_id))
+                return cursor.rowcount == 1
+        except Exception as e:
+            logger.error(f"Module:PoolGroupModels. Failed to add process group {process_group_id} to the warm pool: {e}")
+            return False
+
+    @staticmethod
+    @traced("postgres.PoolGroup.checkout", child_only=True)
+    def checkout(source_type: str) -> Optional[str]:
+        """
+        Claims the longest idle process group of a source type.
+
+        Returns:
+        - str: the id of the process group, or None if no group is idle
+        """
+        try:
+            with transaction() as cursor:
+                cursor.execute("""
+                    UPDATE Pool_Groups SET state = 'in_use', update_date = CURRENT_TIMESTAMP
+                    WHERE id = (
+                        SELECT id FROM Pool_Groups
+                        WHERE source_type = %s AND state = 'idle'
+                        ORDER BY update_date
+                        LIMIT 1
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING process_group_id;
+                """, (source_type,))
+                record = fetch_one(cursor)
+            return record["process_group_id"] if record else None
+        except Exception as e:
+            logger.error(f"Module:PoolGroupModels. Failed to check out a {source_type} process group: {e}")
+            return None
+
+    @staticmethod
+    @traced("postgres.PoolGroup.is_in_use", child_only=True)
+    def is_in_use(process_group_id: str) -> bool:
+        """
+        Whether the process group was checked out of the warm pool and not yet returned.
+        """
+        try:
+            with transaction() as cursor:
+                cursor.execute("""
+                    SELECT 1 FROM Pool_Groups WHERE process_group_id = %s AND state = 'in_use';
+                """, (process_group_id,))
+                return cursor.fetchone() is not None
+        except Exception as e:
+            logger.error(f"Module:PoolGroupModels. Failed to look up process group {process_group_id}: {e}")
+            return False
+
+    @staticmethod
+    @traced("postgres.PoolGroup.release", child_only=True)
+    def release(process_group_id: str, size: int) -> bool:
+        """
+        Returns a checked out process group to the idle groups, unless the pool of its source type is full.
+        """
+        try:
+            with transaction() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s);", (POOL_LOCK_ID,))
+                cursor.execute("""
+                    UPDATE Pool_Groups p SET state = 'idle', update_date = CURRENT_TIMESTAMP
+                    WHERE p.process_group_id = %s AND p.state = 'in_use'
+                      AND (SELECT COUNT(*) FROM Pool_Groups o
+                           WHERE o.source_type = p.source_type AND o.state IN ('creating', 'idle')) < %s;
+                """, (process_group_id, size))
+                return cursor.rowcount == 1
+        except Exception as e:
+            logger.error(f"Module:PoolGroupModels. Failed to return process group {process_group_id} to the warm pool: {e}")
+            return False
+
+    @staticmethod
+    @traced("postgres.PoolGroup.remove", child_only=True)
+    def remove(process_group_id: Optional[str] = None, slot_id: Optional[int] = None) -> bool:
+        """
+        Removes a process group, or an unfilled reservation, from the warm pool.
+        """
+        try:
+            with transaction() as cursor:
+                if slot_id is not None:
+                    cursor.execute("DELETE FROM Pool_Groups WHERE id = %s;", (slot_id,))
+                else:
+                    cursor.execute("DELETE FROM Pool_Groups WHERE process_group_id = %s;", (process_group_id,))
+            return True
+        except Exception as e:
+            logger.error(f"Module:PoolGroupModels. Failed to remove process group {process_group_id} from the warm pool: {e}")
+            return False
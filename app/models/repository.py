@@ -0,0 +1,77 @@
+import select
+import psycopg2
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+from structlog import get_logger
+
+from app.config import config
+
+logger = get_logger()
+
+@contextmanager
+def transaction():
+    """
+    Borrows a connection from the shared metadata store pool and yields a cursor.
+
+    The transaction is committed when the block exits normally and rolled back on error.
+    Connections that were broken by the error are discarded instead of returned to the pool.
+    """
+    conn = config.database.acquire()
+    discard = False
+    try:
+        with conn.cursor() as cursor:
+            yield cursor
+        conn.commit()
+    except Exception as e:
+        discard = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            discard = True
+        raise
+    finally:
+        config.database.release(conn, discard=discard)
+
+def fetch_one(cursor) -> Optional[Dict]:
+    """
+    Returns the next row of the cursor as a dict keyed by column name.
+    """
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    columns = [desc[0] for desc in cursor.description]
+    return dict(zip(columns, row))
+
+def fetch_all(cursor) -> List[Dict]:
+    """
+    Returns the remaining rows of the cursor as dicts keyed by column name.
+    """
+    columns = [desc[0] for desc in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def listen(channel: str, on_notify: Callable[[str], None], stop_event: threading.Event):
+    """
+    Calls on_notify with the payload of every notification on a Postgres channel until stop_event is set,
+    reconnecting after errors. LISTEN needs a dedicated session, so this keeps its own connection outside the pool.
+    """
+    while not stop_event.is_set():
+        conn = None
+        try:
+            conn = config.database.get_connection()
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {channel};")
+            logger.info(f"Module:Repository. Listening on channel {channel}.")
+            while not stop_event.is_set():
+                if select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    on_notify(conn.notifies.pop(0).payload)
+        except Exception as e:
+            logger.error(f"Module:Repository. Listener on channel {channel} failed, reconnecting: {e}")
+            stop_event.wait(5)
+        finally:
+            if conn:
+                conn.close()
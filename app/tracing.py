@@ -0,0 +1,135 @@
+import os
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Optional
+from uuid import uuid4
+
+from asgi_correlation_id import correlation_id
+from opentelemetry import context as otel_context, trace
+from opentelemetry.propagate import extract, inject
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind
+
+from app.config import config
+
+tracer = trace.get_tracer("data-studio")
+
+# Key of the request id in stored trace contexts, next to the W3C traceparent.
+REQUEST_ID_KEY = "x-request-id"
+# The request id of work outside an API request: a UI action, or a job continuing a stored context.
+request_id_var = contextvars.ContextVar("request_id", default=None)
+setup_lock = threading.Lock()
+configured = False
+
+def make_exporter(service_name: str):
+    if config.tracing.exporter == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter(endpoint=config.tracing.otlp_endpoint)
+    # One JSON span per line, in a file per process so concurrent workers never interleave.
+    os.makedirs(config.tracing.file_dir, exist_ok=True)
+    out = open(os.path.join(config.tracing.file_dir, f"{service_name}-{os.getpid()}.jsonl"), "a")
+    return ConsoleSpanExporter(service_name=service_name, out=out, formatter=lambda span: span.to_json(indent=None) + os.linesep)
+
+def setup_tracing(service_name: str):
+    """
+        Install the tracer provider of this process, once. While TRACING_ENABLED is off every span is a no-op.
+    """
+    global configured
+    with setup_lock:
+        if configured or not config.tracing.enabled:
+            return
+        configured = True
+        provider = TracerProvider(
+            resource=Resource.create({"service.name": service_name}),
+            sampler=ParentBased(TraceIdRatioBased(config.tracing.sample_ratio))
+        )
+        provider.add_span_processor(BatchSpanProcessor(make_exporter(service_name)))
+        trace.set_tracer_provider(provider)
+
+def current_request_id() -> Optional[str]:
+    return correlation_id.get() or request_id_var.get()
+
+def has_active_span() -> bool:
+    return trace.get_current_span().get_span_context().is_valid
+
+@contextmanager
+def span(name: str, child_only: bool = False, kind: SpanKind = SpanKind.INTERNAL, **attributes):
+    """
+        Run a block in a span. With child_only the span is only recorded inside an existing trace,
+        which keeps background polling (job claims, flow monitoring) from starting traces of its own.
+    """
+    if child_only and not has_active_span():
+        yield None
+        return
+    with tracer.start_as_current_span(name, kind=kind) as current:
+        request_id = current_request_id()
+        if request_id:
+            current.set_attribute("request.id", request_id)
+        for key, value in attributes.items():
+            if value is not None:
+                current.set_attribute(key, value if isinstance(value, (str, bool, int, float)) else str(value))
+        yield current
+
+def traced(name: str, child_only: bool = False, kind: SpanKind = SpanKind.INTERNAL):
+    """
+        Decorate a function to run it in a span.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, child_only=child_only, kind=kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def inject_context() -> Dict[str, str]:
+    """
+        The current trace context and request id, to store on a record or send as HTTP headers.
+    """
+    carrier = {}
+    inject(carrier)
+    request_id = current_request_id()
+    if request_id:
+        carrier[REQUEST_ID_KEY] = request_id
+    return carrier
+
+@contextmanager
+def attach_context(carrier: Optional[Dict[str, str]]):
+    """
+        Continue the trace and request id of a stored context, such as the one on a Connection record.
+    """
+    if not carrier:
+        yield
+        return
+    token = otel_context.attach(extract(carrier))
+    request_token = request_id_var.set(carrier.get(REQUEST_ID_KEY))
+    try:
+        yield
+    finally:
+        request_id_var.reset(request_token)
+        otel_context.detach(token)
+
+@contextmanager
+def new_request():
+    """
+        Give an action that does not come in through the API, such as a UI button, a request id of its own.
+    """
+    token = request_id_var.set(uuid4().hex)
+    try:
+        yield
+    finally:
+        request_id_var.reset(token)
+
+def start_thread(target, *args, **kwargs) -> threading.Thread:
+    """
+        Start a daemon thread that keeps the trace context of the caller.
+    """
+    context = contextvars.copy_context()
+    thread = threading.Thread(target=context.run, args=(target, *args), kwargs=kwargs, daemon=True)
+    thread.start()
+    return thread
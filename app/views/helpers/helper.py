@@ -1,4 +1,6 @@
+import math
 import base64
+import streamlit as st
 
 def get_base64_image(image_path):
     with open(image_path, "rb") as img_file:
@@ -10,4 +12,27 @@ def get_gif_image(image_path):
 
 def clean_text(text: str) -> str:
     text = text.strip()
-    return text
\ No newline at end of file
+    return text
+
+def get_page_cursor(key: str):
+    """
+    Return the keyset cursor of the current page of a paginated list. The session keeps
+    the cursors of every visited page so the previous button can walk back.
+    """
+    if f"{key}_cursors" not in st.session_state:
+        st.session_state[f"{key}_cursors"] = [None]
+    return st.session_state[f"{key}_cursors"][-1]
+
+def reset_pagination(key: str):
+    st.session_state[f"{key}_cursors"] = [None]
+
+def pagination_controls(key: str, next_after_id, total: int, page_size: int):
+    cursors = st.session_state[f"{key}_cursors"]
+    col1, col2, col3 = st.columns([1, 10, 1])
+    if col1.button("", icon=":material/chevron_left:", key=f"{key}_previous", help="Previous Page", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    col2.markdown(f"<span class='date'>Page {len(cursors)} of {max(1, math.ceil(total / page_size))} · {total} record(s)</span>", unsafe_allow_html=True)
+    if col3.button("", icon=":material/chevron_right:", key=f"{key}_next", help="Next Page", disabled=next_after_id is None):
+        cursors.append(next_after_id)
+        st.rerun()
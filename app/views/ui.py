@@ -2,6 +2,9 @@ import asyncio
 import streamlit as st
 
 from app.views.ui_pages.home import home as home
+from app.tracing import setup_tracing
+
+setup_tracing("data-studio-ui")
 
 async def main():
     st.set_page_config(page_title="TechHub Data Studio",layout="wide")
@@ -5,6 +5,7 @@ from app.models.connection import Connection
 from app.models.connector.sql_server import SQLServer
 
 from app.views.helpers.helper import clean_text
+from app.tracing import new_request, span
 
 @st.dialog("Select the Tables You Want to Load")
 def open_sql_server_popup(connection:Connection, sql_server:SQLServer):
@@ -20,7 +21,9 @@ def open_sql_server_popup(connection:Connection, sql_server:SQLServer):
             if tables:
                 sql_server.tables = tables
                 connection.connection_properties = sql_server.to_connection_properties()
-                with st.spinner("Instantiating data flow... Please wait."):
+                # The root of the trace followed by the monitoring and the Kafka to Hadoop transfer.
+                with st.spinner("Instantiating data flow... Please wait."), new_request(), \
+                        span("ui.connect_source", source_type=connection.source_type, tables=len(tables)):
                     start_flow = instantiate_flow(connection)
                 if start_flow:
                     st.session_state.popupmsg = "✅ The Data Source Connected Successfully."
@@ -1,12 +1,16 @@
 import streamlit as st
 from structlog import get_logger
 
-from app.views.helpers.helper import get_gif_image
+from app.views.helpers.helper import get_gif_image, get_page_cursor, reset_pagination, pagination_controls
 from app.models.connection import Connection
 from app.controllers.kafka import run_kafka_to_hadoop_thread
+from app.tracing import new_request, span
 
 logger = get_logger()
 
+PAGE_SIZE = 20
+CONNECTION_STATES = ["All", "Loading", "Loaded", "Storing", "Stored", "Failed"]
+
 @st.dialog("Are You Sure?")
 def delete_popup(record : Connection):
     st.write("You won't be able to revert this!")
@@ -32,13 +36,18 @@ async def connections() -> None:
 
     st.title("Connections List")
 
-    connections = Connection.list_all()
-
     with st.container():
         st.markdown(f"""<p class="table-title">My Data Connections</p>""", unsafe_allow_html=True)
 
         with st.container():
             st.button("Connect Source", on_click=lambda: setattr(st.session_state, "menu_item", "connect_source"))
+            state_filter = st.selectbox("State", options=CONNECTION_STATES, key="connections_state_filter",
+                                        on_change=reset_pagination, args=("connections",))
+
+        # Load only the current page of connections
+        state = None if state_filter == "All" else state_filter
+        connections, next_after_id = Connection.list_page(PAGE_SIZE, get_page_cursor("connections"), state=state)
+        total = Connection.count(state=state)
                 
         with st.container():
             for record in connections:
@@ -67,7 +76,8 @@ async def connections() -> None:
                         left.markdown("You clicked the plain button.")
                     if middle.button("",icon=":material/cloud_download:", key=f"load_{record.id}", help="Load To Storage", use_container_width=False):
                         if record.state != "Loading" and record.state != "Storing":
-                            started = run_kafka_to_hadoop_thread(record)
+                            with new_request(), span("ui.load_to_storage", connection_id=record.id):
+                                started = run_kafka_to_hadoop_thread(record)
                             if started:
                                 st.toast("✅ The pipeline started successfully.")
                             else:
@@ -78,4 +88,6 @@ async def connections() -> None:
                         if record.state != "Loading" and record.state != "Storing":
                             delete_popup(record)
                         else:
-                            st.toast("❌ Cannot delete a connection while it's Loading or Storing.")
\ No newline at end of file
+                            st.toast("❌ Cannot delete a connection while it's Loading or Storing.")
+
+        pagination_controls("connections", next_after_id, total, PAGE_SIZE)
@@ -1,6 +1,7 @@
-import io
 import streamlit as st
-from app.controllers.hadoop import get_list_hdfs_directory, fetch_file_bytes, fetch_head_from_file
+from urllib.parse import quote
+from app.config import config
+from app.controllers.hadoop import get_list_hdfs_directory, fetch_head_from_file
 
 def update_current_path(item_type, item_path):
     st.session_state.file_triggered = False
@@ -10,12 +11,11 @@ def update_current_path(item_type, item_path):
         st.session_state.display_path = st.session_state.display_path.title()
         st.session_state.display_path = '... ' + st.session_state.display_path[len(st.session_state.display_path) - 90:] if len(st.session_state.display_path) > 90 else st.session_state.display_path
     else:
-        file_bytes = fetch_file_bytes(item_path)
-        if isinstance(file_bytes, bytes):
-            st.session_state.file_data = file_bytes
-            st.session_state.sample_data = fetch_head_from_file(item_path)
-            st.session_state.file_name = item_path.split("/")[-1]
-            st.session_state.file_triggered = True
+        # Only the preview is read here, the download itself is streamed by the API service.
+        st.session_state.file_url = f"{config.api_service.get_api_url()}/api/v1/files?path={quote(item_path)}"
+        st.session_state.sample_data = fetch_head_from_file(item_path)
+        st.session_state.file_name = item_path.split("/")[-1]
+        st.session_state.file_triggered = True
     st.rerun()
 
 async def data_explorer() -> None:
@@ -65,7 +65,8 @@ async def data_explorer() -> None:
                     item_icon = "📄"
                     item_size = str(item['size_kb']) + " KB"
 
-                if item["name"] != "_SUCCESS":
+                # Hide Spark markers and the dataset manifest
+                if not item["name"].startswith("_"):
                     with col1:
                         item_name = item['name'][:30] + ' ...' if len(item['name']) > 30 else item['name']
                         item_name = item_name.title() # Capitalize each word
@@ -90,13 +91,10 @@ async def data_explorer() -> None:
                             with col1:
                                 st.write(f"📖 {st.session_state.file_name}")
                             with col2:
-                                st.download_button(
+                                st.link_button(
                                     icon=":material/download:",
                                     label="Download",
-                                    data=io.BytesIO(st.session_state.file_data),
-                                    file_name=st.session_state.file_name,
-                                    mime="application/octet-stream",
-                                    key="download_button"
+                                    url=st.session_state.file_url
                                 )
                         st.text_area("Text Area", st.session_state.sample_data, label_visibility="hidden", height=300, disabled=True)
 
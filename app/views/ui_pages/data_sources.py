@@ -5,16 +5,21 @@ from structlog import get_logger
 from app.config import config
 
 from app.models.dataset import Dataset
+from app.views.helpers.helper import get_page_cursor, pagination_controls
 
 logger = get_logger()
 
+PAGE_SIZE = 20
+
 async def data_sources() -> None:
     with open('app/views/styles/data_sources.css') as f:
         st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True) 
 
     st.title("Data Sources")
 
-    datasets = Dataset.list_all()
+    # Load only the current page of datasets
+    datasets, next_after_id = Dataset.list_page(PAGE_SIZE, get_page_cursor("data_sources"))
+    total = Dataset.count()
 
     with st.container():
         st.markdown(f"""<p class="table-title">My Data Sources</p>""", unsafe_allow_html=True)
@@ -46,4 +51,6 @@ async def data_sources() -> None:
                     if btn3.button("",icon=":material/edit_document:", key=f"edit_document_{record.id}", help="Update BI Link", use_container_width=False):
                         btn3.markdown("You clicked the emoji button.")
                     if btn4.button("",icon=":material/bar_chart_4_bars:", key=f"bar_chart_4_bars_{record.id}", help="Power BI", disabled= False if record.dashboard_url != "" else True, use_container_width=False):
-                        webbrowser.open(record.dashboard_url)
\ No newline at end of file
+                        webbrowser.open(record.dashboard_url)
+
+        pagination_controls("data_sources", next_after_id, total, PAGE_SIZE)
@@ -1,6 +1,7 @@
-import io
 import streamlit as st
-from app.controllers.hadoop import get_list_hdfs_directory, fetch_file_bytes, fetch_head_from_file
+from urllib.parse import quote
+from app.config import config
+from app.controllers.hadoop import get_list_hdfs_directory, fetch_head_from_file
 
 def update_current_path(item_type, item_path):
     st.session_state.delta_file_triggered = False
@@ -10,12 +11,11 @@ def update_current_path(item_type, item_path):
         st.session_state.display_delta_path = st.session_state.display_delta_path.title()
         st.session_state.display_delta_path = '... ' + st.session_state.display_delta_path[len(st.session_state.display_delta_path) - 90:] if len(st.session_state.display_delta_path) > 90 else st.session_state.display_delta_path
     else:
-        file_bytes = fetch_file_bytes(item_path)
-        if isinstance(file_bytes, bytes):
-            st.session_state.delta_file_data = file_bytes
-            st.session_state.delta_sample_data = fetch_head_from_file(item_path)
-            st.session_state.delta_file_name = item_path.split("/")[-1]
-            st.session_state.delta_file_triggered = True
+        # Only the preview is read here, the download itself is streamed by the API service.
+        st.session_state.delta_file_url = f"{config.api_service.get_api_url()}/api/v1/files?path={quote(item_path)}"
+        st.session_state.delta_sample_data = fetch_head_from_file(item_path)
+        st.session_state.delta_file_name = item_path.split("/")[-1]
+        st.session_state.delta_file_triggered = True
     st.rerun()
 
 async def delta_storage() -> None:
@@ -90,13 +90,10 @@ async def delta_storage() -> None:
                             with col1:
                                 st.write(f"📖 {st.session_state.delta_file_name}")
                             with col2:
-                                st.download_button(
+                                st.link_button(
                                     icon=":material/download:",
                                     label="Download",
-                                    data=io.BytesIO(st.session_state.delta_file_data),
-                                    file_name=st.session_state.delta_file_name,
-                                    mime="application/octet-stream",
-                                    key="download_button" + item_path
+                                    url=st.session_state.delta_file_url
                                 )
                         st.text_area("Text Area", st.session_state.delta_sample_data, label_visibility="hidden", height=300, disabled=True, key="text"+item_path)
 
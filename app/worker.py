@@ -0,0 +1,11 @@
+
+import subprocess
+
+def run_workers():
+    command = [
+        "python", "-m", "app.controllers.jobs"
+    ]
+    subprocess.run(command)
+
+if __name__ == "__main__":
+    run_workers()
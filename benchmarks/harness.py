@@ -0,0 +1,53 @@
+import time
+import statistics
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+
+@dataclass
+class Result:
+    """
+        The metrics of one benchmark case. Metrics named *_per_second are better when higher,
+        every other metric (seconds, megabytes) is better when lower.
+    """
+    name: str
+    metrics: Dict[str, float] = field(default_factory=dict)
+    skipped: str = ""
+
+def higher_is_better(metric: str) -> bool:
+    return metric.endswith("per_second")
+
+def time_calls(func: Callable, repeats: int, warmup: int = 1) -> List[float]:
+    for _ in range(warmup):
+        func()
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def summarize(durations: List[float], prefix: str = "") -> Dict[str, float]:
+    return {
+        f"{prefix}seconds": statistics.median(durations),
+        f"{prefix}p95_seconds": percentile(durations, 0.95),
+    }
+
+def peak_memory_mb(func: Callable) -> float:
+    """
+        Peak Python heap growth while func runs, across all threads. Measured in a separate call
+        because tracing slows down the code under test.
+    """
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return (peak - baseline) / (1024 * 1024)
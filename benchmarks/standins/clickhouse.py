@@ -0,0 +1,153 @@
+import io
+import csv
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Synthetic tables are named rows_<count> and all share this layout. id is the primary key.
+COLUMNS = [
+    ("id", "UInt64", True),
+    ("name", "String", False),
+    ("amount", "Float64", False),
+    ("created", "DateTime", False),
+    ("active", "UInt8", False),
+]
+EPOCH = datetime(2024, 1, 1)
+
+def make_row(index: int) -> Tuple:
+    return (index, f"customer-{index}", index * 0.25, EPOCH + timedelta(seconds=index), index % 2)
+
+def table_size(table: str) -> int:
+    if not table.startswith("rows_"):
+        raise ValueError(f"Unknown benchmark table {table}, expected rows_<count>")
+    return int(table[len("rows_"):])
+
+class QueryResult:
+    def __init__(self, column_names: List[str], result_rows: List[Tuple]):
+        self.column_names = column_names
+        self.result_rows = result_rows
+
+class RowBlockStream:
+    """
+        Mimics the context manager returned by clickhouse_connect's query_row_block_stream:
+        rows are generated block by block, so only one block is alive at a time.
+    """
+    def __init__(self, rows: range, block_size: int):
+        self.rows = rows
+        self.block_size = block_size
+        self.source = QueryResult([name for name, _, _ in COLUMNS], [])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self) -> Iterator[List[Tuple]]:
+        for start in range(self.rows.start, self.rows.stop, self.block_size):
+            yield [make_row(index) for index in range(start, min(start + self.block_size, self.rows.stop))]
+
+def take_bytes(sink: io.BytesIO) -> bytes:
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+def render_csv(blocks: Iterator[List[Tuple]]) -> Iterator[bytes]:
+    sink = io.StringIO()
+    writer = csv.writer(sink, quoting=csv.QUOTE_NONNUMERIC, lineterminator="\n")
+    writer.writerow([name for name, _, _ in COLUMNS])
+    for block in blocks:
+        writer.writerows((row[:3] + (row[3].strftime("%Y-%m-%d %H:%M:%S"),) + row[4:]) for row in block)
+        yield sink.getvalue().encode()
+        sink.seek(0)
+        sink.truncate()
+
+def arrow_schema():
+    import pyarrow as pa
+    types = {"UInt64": pa.uint64(), "String": pa.string(), "Float64": pa.float64(),
+             "DateTime": pa.timestamp("s"), "UInt8": pa.uint8()}
+    return pa.schema([(name, types[column_type]) for name, column_type, _ in COLUMNS])
+
+def render_arrow(blocks: Iterator[List[Tuple]], file_format: str) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = arrow_schema()
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, schema) if file_format == "ArrowStream" else pq.ParquetWriter(sink, schema)
+    for block in blocks:
+        # One record batch or row group per block, like ClickHouse.
+        writer.write_table(pa.Table.from_pylist([dict(zip(schema.names, row)) for row in block], schema=schema))
+        yield take_bytes(sink)
+    writer.close()
+    yield take_bytes(sink)
+
+class RawStream:
+    """
+        Mimics the response returned by clickhouse_connect's raw_stream: a readable stream of a query
+        rendered in a ClickHouse output format. The bytes are produced block by block as they are read.
+    """
+    def __init__(self, chunks: Iterator[bytes]):
+        self.chunks = chunks
+        self.buffer = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.chunks.close()
+        return False
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        size = len(self.buffer) if size < 0 else size
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+class FakeClickHouseClient:
+    """
+        An in-process stand-in for a clickhouse_connect client. It answers the system.columns and
+        system.tables lookups of the data API and serves SELECTs on synthetic rows_<count> tables,
+        honouring the limit, offset and keyset cursor parameters bound by build_select_query, as
+        rows or rendered in the CSVWithNames, ArrowStream and Parquet formats of the data API.
+        Only what the data API calls is implemented.
+    """
+    def __init__(self, block_size: int = 65536):
+        self.block_size = block_size
+
+    def rows(self, parameters: Dict) -> range:
+        start = int(parameters["after"]) + 1 if "after" in parameters else int(parameters.get("offset", 0))
+        stop = table_size(parameters["table"])
+        if "limit" in parameters:
+            stop = min(stop, start + int(parameters["limit"]))
+        return range(min(start, stop), stop)
+
+    def query(self, query: str, parameters: Optional[Dict] = None) -> QueryResult:
+        parameters = parameters or {}
+        if "system.columns" in query:
+            table_size(parameters["table"])
+            return QueryResult(["name", "type", "is_in_primary_key"], [(name, column_type, int(key)) for name, column_type, key in COLUMNS])
+        if "system.tables" in query:
+            return QueryResult(["sampling_key"], [("",)])
+        return QueryResult([name for name, _, _ in COLUMNS], [make_row(index) for index in self.rows(parameters)])
+
+    def query_row_block_stream(self, query: str, parameters: Optional[Dict] = None) -> RowBlockStream:
+        return RowBlockStream(self.rows(parameters or {}), self.block_size)
+
+    def raw_stream(self, query: str, parameters: Optional[Dict] = None, fmt: str = None) -> RawStream:
+        blocks = iter(RowBlockStream(self.rows(parameters or {}), self.block_size))
+        if fmt == "CSVWithNames":
+            return RawStream(render_csv(blocks))
+        if fmt in ("ArrowStream", "Parquet"):
+            return RawStream(render_arrow(blocks, fmt))
+        raise ValueError(f"The ClickHouse stand-in cannot render the {fmt} format")
+
+    def ping(self) -> bool:
+        return True
+
+    def close(self):
+        pass
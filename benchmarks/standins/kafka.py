@@ -0,0 +1,47 @@
+import os
+import json
+import time
+from typing import Optional
+
+# The columns of Spark's Kafka source, with the value already decoded as done by get_kafka_stream.
+KAFKA_SCHEMA = "topic STRING, partition INT, offset LONG, timestamp LONG, key STRING, value STRING"
+
+def make_value(index: int) -> str:
+    """
+        A Debezium style change event, as written by the NiFi flows.
+    """
+    return json.dumps({"payload": {"op": "c", "after": {
+        "id": index, "name": f"customer-{index}", "amount": index * 0.25, "active": index % 2 == 1
+    }}})
+
+def write_topic(directory: str, topic: str, rows: int, partitions: int = 4, rows_per_file: int = 100000) -> str:
+    """
+        Write a topic as JSON lines files, one record per line, spread round robin over the partitions.
+        Returns the folder of the topic.
+    """
+    topic_dir = os.path.join(directory, topic)
+    os.makedirs(topic_dir, exist_ok=True)
+    timestamp = int(time.time() * 1000)
+    offsets = [0] * partitions
+    for file_index, start in enumerate(range(0, rows, rows_per_file)):
+        with open(os.path.join(topic_dir, f"part-{file_index:05d}.json"), "w", encoding="utf-8") as f:
+            for index in range(start, min(start + rows_per_file, rows)):
+                partition = index % partitions
+                f.write(json.dumps({
+                    "topic": topic, "partition": partition, "offset": offsets[partition],
+                    "timestamp": timestamp, "key": str(index), "value": make_value(index)
+                }) + "\n")
+                offsets[partition] += 1
+    return topic_dir
+
+def get_file_stream(spark, directory: str, topic: str, with_offsets: bool = False, max_files_per_trigger: Optional[int] = None):
+    """
+        A streaming DataFrame over the files of a topic with the same columns as get_kafka_stream,
+        so the ingestion functions can be run without a broker.
+    """
+    reader = spark.readStream.schema(KAFKA_SCHEMA)
+    if max_files_per_trigger:
+        reader = reader.option("maxFilesPerTrigger", max_files_per_trigger)
+    # Spark's Kafka source has the record timestamp as a TIMESTAMP, the files keep it in milliseconds.
+    columns = ["partition", "offset", "timestamp_millis(timestamp) AS timestamp", "value"] if with_offsets else ["timestamp_millis(timestamp) AS timestamp", "value"]
+    return reader.json(os.path.join(directory, topic)).selectExpr(*columns)
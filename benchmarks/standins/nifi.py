@@ -0,0 +1,273 @@
+import os
+import ssl
+import json
+import time
+import uuid
+import base64
+import tempfile
+import threading
+import subprocess
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+API_PREFIX = "/nifi-api"
+ROOT_GROUP_ID = "00000000-0000-0000-0000-000000000000"
+TEMPLATE_ID = "11111111-1111-1111-1111-111111111111"
+
+def make_token(lifetime: int = 3600) -> str:
+    def encode(payload: Dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+    return f"{encode({'alg': 'none'})}.{encode({'sub': 'bench', 'exp': int(time.time()) + lifetime})}.signature"
+
+def make_certificate(directory: str):
+    """
+        Create a throwaway self-signed certificate, NiFi is only served over HTTPS.
+    """
+    cert_file, key_file = os.path.join(directory, "nifi.crt"), os.path.join(directory, "nifi.key")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=127.0.0.1",
+         "-keyout", key_file, "-out", cert_file],
+        check=True, capture_output=True
+    )
+    return cert_file, key_file
+
+class FakeFlow:
+    """
+        The state the stand-in keeps for one instantiated template: its revision, variables,
+        controller services and processors.
+    """
+    def __init__(self, services: int, processors: int):
+        self.id = str(uuid.uuid4())
+        self.version = 0
+        self.comments = ""
+        self.variables = []
+        self.services = {
+            str(uuid.uuid4()): {"name": f"service-{index}", "state": "DISABLED", "enabled_at": None, "version": 0}
+            for index in range(services)
+        }
+        self.processors = {str(uuid.uuid4()): "STOPPED" for _ in range(processors)}
+
+class NiFiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeNiFi"
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status: int, payload=None, text: Optional[str] = None):
+        body = text.encode("utf-8") if text is not None else json.dumps(payload or {}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain" if text is not None else "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(body) if body else {}
+        except ValueError:
+            return {}
+
+    def dispatch(self, method: str):
+        path = urlsplit(self.path).path
+        if not path.startswith(API_PREFIX):
+            return self.reply(HTTPStatus.NOT_FOUND, text="Not found")
+        parts = [part for part in path[len(API_PREFIX):].split("/") if part]
+        body = self.read_json() if method in ("POST", "PUT") else {}
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if method == "POST" and parts == ["access", "token"]:
+            return self.reply(HTTPStatus.CREATED, text=make_token())
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            return self.reply(HTTPStatus.UNAUTHORIZED, text="Unauthorized")
+
+        # /flow/... endpoints are prefixed, the rest alternate between a resource and its id.
+        prefix, rest = (["flow"], parts[1:]) if parts[:1] == ["flow"] else ([], parts)
+        handler = getattr(self, "_".join([method.lower()] + prefix + rest[::2]).replace("-", "_"), None)
+        if handler is None:
+            return self.reply(HTTPStatus.NOT_FOUND, text=f"{method} {path} is not supported by the stand-in")
+        status, payload = handler(rest[1::2], body)
+        self.reply(status, payload)
+
+    def flow(self, group_id: str) -> Optional[FakeFlow]:
+        return self.server.flows.get(group_id)
+
+    def group_entity(self, flow: FakeFlow) -> Dict:
+        return {"id": flow.id, "revision": {"version": flow.version}, "component": {"id": flow.id, "comments": flow.comments}}
+
+    def service_entity(self, flow: FakeFlow, service_id: str) -> Dict:
+        service = flow.services[service_id]
+        if service["state"] == "ENABLING" and time.monotonic() >= service["enabled_at"]:
+            service["state"] = "ENABLED"
+        return {
+            "id": service_id,
+            "parentGroupId": flow.id,
+            "revision": {"version": service["version"]},
+            "component": {"id": service_id, "name": service["name"], "state": service["state"],
+                          "type": "org.apache.nifi.dbcp.DBCPConnectionPool", "properties": {}}
+        }
+
+    # POST /process-groups/{root}/template-instance
+    def post_process_groups_template_instance(self, ids, body):
+        if body.get("templateId") != TEMPLATE_ID:
+            return HTTPStatus.NOT_FOUND, {"message": "Unknown template"}
+        flow = FakeFlow(self.server.services, self.server.processors)
+        with self.server.lock:
+            self.server.flows[flow.id] = flow
+        return HTTPStatus.CREATED, {"flow": {"processGroups": [self.group_entity(flow)]}}
+
+    # GET /process-groups/{root}/process-groups
+    def get_process_groups_process_groups(self, ids, body):
+        with self.server.lock:
+            groups = [self.group_entity(flow) for flow in self.server.flows.values()]
+        return HTTPStatus.OK, {"processGroups": groups}
+
+    # GET and PUT /process-groups/{id}
+    def get_process_groups(self, ids, body):
+        flow = self.flow(ids[0])
+        return (HTTPStatus.OK, self.group_entity(flow)) if flow else (HTTPStatus.NOT_FOUND, {})
+
+    def put_process_groups(self, ids, body):
+        flow = self.flow(ids[0])
+        if flow is None:
+            return HTTPStatus.NOT_FOUND, {}
+        flow.version += 1
+        flow.comments = body.get("component", {}).get("comments", flow.comments)
+        return HTTPStatus.OK, self.group_entity(flow)
+
+    # DELETE /process-groups/{id}
+    def delete_process_groups(self, ids, body):
+        with self.server.lock:
+            flow = self.server.flows.pop(ids[0], None)
+        return (HTTPStatus.OK, self.group_entity(flow)) if flow else (HTTPStatus.NOT_FOUND, {})
+
+    # GET and PUT /process-groups/{id}/variable-registry
+    def get_process_groups_variable_registry(self, ids, body):
+        flow = self.flow(ids[0])
+        if flow is None:
+            return HTTPStatus.NOT_FOUND, {}
+        return HTTPStatus.OK, {
+            "processGroupRevision": {"version": flow.version},
+            "variableRegistry": {"processGroupId": flow.id, "variables": flow.variables}
+        }
+
+    def put_process_groups_variable_registry(self, ids, body):
+        flow = self.flow(ids[0])
+        if flow is None:
+            return HTTPStatus.NOT_FOUND, {}
+        if body.get("processGroupRevision", {}).get("version") != flow.version:
+            return HTTPStatus.CONFLICT, {"message": "Stale revision"}
+        flow.version += 1
+        flow.variables = body["variableRegistry"]["variables"]
+        return HTTPStatus.OK, self.get_process_groups_variable_registry(ids, body)[1]
+
+    # GET /process-groups/{id}/processors
+    def get_process_groups_processors(self, ids, body):
+        flow = self.flow(ids[0])
+        if flow is None:
+            return HTTPStatus.NOT_FOUND, {}
+        return HTTPStatus.OK, {"processors": [
+            {"id": processor_id, "revision": {"version": 0}, "component": {"id": processor_id, "state": state}}
+            for processor_id, state in flow.processors.items()
+        ]}
+
+    # PUT /processors/{id}
+    def put_processors(self, ids, body):
+        with self.server.lock:
+            flow = next((flow for flow in self.server.flows.values() if ids[0] in flow.processors), None)
+        if flow is None:
+            return HTTPStatus.NOT_FOUND, {}
+        flow.processors[ids[0]] = body.get("component", {}).get("state", "STOPPED")
+        return HTTPStatus.OK, {"id": ids[0], "component": {"id": ids[0], "state": flow.processors[ids[0]]}}
+
+    # POST /processors/{id}/state/clear-requests
+    def post_processors_state(self, ids, body):
+        return HTTPStatus.OK, {}
+
+    # GET /process-groups/{id}/connections, the stand-in never queues flowfiles.
+    def get_process_groups_connections(self, ids, body):
+        return (HTTPStatus.OK, {"connections": []}) if self.flow(ids[0]) else (HTTPStatus.NOT_FOUND, {})
+
+    # GET /flow/process-groups/{id}/controller-services
+    def get_flow_process_groups_controller_services(self, ids, body):
+        flow = self.flow(ids[0])
+        if flow is None:
+            return HTTPStatus.NOT_FOUND, {}
+        return HTTPStatus.OK, {"controllerServices": [self.service_entity(flow, service_id) for service_id in flow.services]}
+
+    # PUT /flow/process-groups/{id}
+    def put_flow_process_groups(self, ids, body):
+        flow = self.flow(ids[0])
+        if flow is None:
+            return HTTPStatus.NOT_FOUND, {}
+        for processor_id in flow.processors:
+            flow.processors[processor_id] = body.get("state")
+        return HTTPStatus.OK, {"id": flow.id, "state": body.get("state")}
+
+    # PUT /controller-services/{id}
+    def put_controller_services(self, ids, body):
+        with self.server.lock:
+            flow = next((flow for flow in self.server.flows.values() if ids[0] in flow.services), None)
+        if flow is None:
+            return HTTPStatus.NOT_FOUND, {}
+        service = flow.services[ids[0]]
+        state = body.get("component", {}).get("state")
+        if state == "ENABLED" and service["state"] == "DISABLED":
+            service["state"], service["enabled_at"] = "ENABLING", time.monotonic() + self.server.enable_delay
+        elif state == "DISABLED":
+            service["state"] = "DISABLED"
+        service["version"] += 1
+        return HTTPStatus.OK, self.service_entity(flow, ids[0])
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_PUT(self):
+        self.dispatch("PUT")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+class FakeNiFi(ThreadingHTTPServer):
+    """
+        A NiFi REST server over HTTPS covering the calls made by instantiate_flow and the warm pool.
+        Every request can be delayed to emulate NiFi's response time, and controller services take
+        enable_delay seconds to move from ENABLING to ENABLED.
+    """
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, enable_delay: float = 0.2,
+                 services: int = 2, processors: int = 4):
+        super().__init__((host, port), NiFiHandler)
+        self.latency = latency
+        self.enable_delay = enable_delay
+        self.services = services
+        self.processors = processors
+        self.flows: Dict[str, FakeFlow] = {}
+        self.lock = threading.Lock()
+        self.thread = None
+        with tempfile.TemporaryDirectory() as directory:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(*make_certificate(directory))
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "FakeNiFi":
+        self.thread = threading.Thread(target=self.serve_forever, name="fake-nifi", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,254 @@
+import json
+import time
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+
+WEBHDFS_PREFIX = "/webhdfs/v1"
+
+class Node:
+    __slots__ = ("is_dir", "children", "data", "length", "modification_time")
+
+    def __init__(self, is_dir: bool, length: int = 0):
+        self.is_dir = is_dir
+        self.children: Optional[Dict[str, "Node"]] = {} if is_dir else None
+        self.data: Optional[bytearray] = None if is_dir else bytearray()
+        # Synthetic files only carry a size, files written through the API also keep their bytes.
+        self.length = length
+        self.modification_time = int(time.time() * 1000)
+
+    def status(self, name: str) -> Dict:
+        return {
+            "pathSuffix": name,
+            "type": "DIRECTORY" if self.is_dir else "FILE",
+            "length": 0 if self.is_dir else self.length,
+            "modificationTime": self.modification_time,
+            "accessTime": self.modification_time,
+            "blockSize": 0 if self.is_dir else 134217728,
+            "replication": 0 if self.is_dir else 3,
+            "permission": "755",
+            "owner": "bench",
+            "group": "supergroup",
+            "childrenNum": len(self.children) if self.is_dir else 0,
+            "fileId": id(self),
+        }
+
+class FakeFileSystem:
+    """
+        An in-memory namespace for the fake WebHDFS server. LISTSTATUS responses are rendered once
+        per directory version, so the benchmarks measure the client rather than the stand-in.
+    """
+    def __init__(self):
+        self.root = Node(is_dir=True)
+        self.lock = threading.Lock()
+        self.listings: Dict[str, bytes] = {}
+
+    @staticmethod
+    def split(path: str):
+        return [part for part in path.split("/") if part]
+
+    def lookup(self, path: str) -> Optional[Node]:
+        node = self.root
+        for part in self.split(path):
+            if not node.is_dir or part not in node.children:
+                return None
+            node = node.children[part]
+        return node
+
+    def make_dirs(self, path: str) -> Node:
+        node = self.root
+        for part in self.split(path):
+            node = node.children.setdefault(part, Node(is_dir=True))
+        return node
+
+    def touched(self, path: str):
+        parent = "/" + "/".join(self.split(path)[:-1])
+        self.listings.pop(parent, None)
+        self.listings.pop("/" + "/".join(self.split(path)), None)
+
+    def add_directory(self, path: str, files: int, folders: int = 0, file_size: int = 4096):
+        """
+            Create a synthetic directory with the given number of files and sub folders.
+        """
+        with self.lock:
+            directory = self.make_dirs(path)
+            for index in range(folders):
+                directory.children[f"folder-{index:06d}"] = Node(is_dir=True)
+            for index in range(files):
+                directory.children[f"part-{index:06d}.json"] = Node(is_dir=False, length=file_size)
+            self.touched(path)
+
+    def write(self, path: str, data: bytes, append: bool = False):
+        with self.lock:
+            parts = self.split(path)
+            parent = self.make_dirs("/" + "/".join(parts[:-1]))
+            node = parent.children.get(parts[-1])
+            if node is None or not append:
+                node = parent.children[parts[-1]] = Node(is_dir=False)
+            node.data.extend(data)
+            node.length = len(node.data)
+            node.modification_time = int(time.time() * 1000)
+            self.touched(path)
+
+    def list_status(self, path: str) -> Optional[bytes]:
+        with self.lock:
+            key = "/" + "/".join(self.split(path))
+            if key not in self.listings:
+                node = self.lookup(path)
+                if node is None:
+                    return None
+                statuses = [child.status(name) for name, child in node.children.items()] if node.is_dir else [node.status("")]
+                self.listings[key] = json.dumps({"FileStatuses": {"FileStatus": statuses}}).encode("utf-8")
+            return self.listings[key]
+
+    def delete(self, path: str, recursive: bool) -> bool:
+        with self.lock:
+            parts = self.split(path)
+            parent = self.lookup("/" + "/".join(parts[:-1]))
+            node = parent.children.get(parts[-1]) if parent and parent.is_dir else None
+            if node is None or (node.is_dir and node.children and not recursive):
+                return False
+            del parent.children[parts[-1]]
+            self.touched(path)
+            self.listings.pop("/" + "/".join(parts), None)
+            return True
+
+    def rename(self, path: str, destination: str) -> bool:
+        with self.lock:
+            parts, target = self.split(path), self.split(destination)
+            parent = self.lookup("/" + "/".join(parts[:-1]))
+            node = parent.children.get(parts[-1]) if parent and parent.is_dir else None
+            target_parent = self.lookup("/" + "/".join(target[:-1]))
+            if node is None or target_parent is None or target[-1] in target_parent.children:
+                return False
+            target_parent.children[target[-1]] = parent.children.pop(parts[-1])
+            self.touched(path)
+            self.touched(destination)
+            return True
+
+class WebHDFSHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeWebHDFS"
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status: int, body: bytes = b"", content_type: str = "application/json", headers: Optional[Dict] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def reply_json(self, payload: Dict, status: int = HTTPStatus.OK):
+        self.reply(status, json.dumps(payload).encode("utf-8"))
+
+    def not_found(self, path: str):
+        self.reply_json({"RemoteException": {
+            "exception": "FileNotFoundException",
+            "javaClassName": "java.io.FileNotFoundException",
+            "message": f"File does not exist: {path}"
+        }}, HTTPStatus.NOT_FOUND)
+
+    def redirect(self):
+        # WebHDFS sends data operations to a DataNode; the stand-in redirects to itself.
+        host, port = self.server.server_address[:2]
+        self.reply(HTTPStatus.TEMPORARY_REDIRECT, headers={"Location": f"http://{host}:{port}{self.path}&datanode=true"})
+
+    def read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def dispatch(self, method: str):
+        url = urlsplit(self.path)
+        if not url.path.startswith(WEBHDFS_PREFIX):
+            return self.reply(HTTPStatus.NOT_FOUND)
+        path = unquote(url.path[len(WEBHDFS_PREFIX):]) or "/"
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        op = params.get("op", "").upper()
+        datanode = params.get("datanode") == "true"
+        fs = self.server.fs
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if method == "GET" and op == "LISTSTATUS":
+            body = fs.list_status(path)
+            return self.reply(HTTPStatus.OK, body) if body is not None else self.not_found(path)
+        if method == "GET" and op == "GETFILESTATUS":
+            node = fs.lookup(path)
+            return self.reply_json({"FileStatus": node.status("")}) if node else self.not_found(path)
+        if method == "GET" and op == "OPEN":
+            node = fs.lookup(path)
+            if node is None or node.is_dir:
+                return self.not_found(path)
+            if not datanode:
+                return self.redirect()
+            data = bytes(node.data) if node.data else b"\0" * node.length
+            offset = int(params.get("offset", 0))
+            length = int(params["length"]) if "length" in params else len(data) - offset
+            return self.reply(HTTPStatus.OK, data[offset:offset + length], "application/octet-stream")
+        if method in ("PUT", "POST") and op in ("CREATE", "APPEND"):
+            body = self.read_body()
+            if op == "APPEND" and fs.lookup(path) is None:
+                return self.not_found(path)
+            if not datanode:
+                return self.redirect()
+            fs.write(path, body, append=op == "APPEND")
+            return self.reply(HTTPStatus.CREATED if op == "CREATE" else HTTPStatus.OK)
+        if method == "PUT" and op == "MKDIRS":
+            with fs.lock:
+                fs.make_dirs(path)
+                fs.touched(path)
+            return self.reply_json({"boolean": True})
+        if method == "PUT" and op == "RENAME":
+            return self.reply_json({"boolean": fs.rename(path, params["destination"])})
+        if method == "DELETE" and op == "DELETE":
+            return self.reply_json({"boolean": fs.delete(path, params.get("recursive") == "true")})
+        self.reply_json({"RemoteException": {
+            "exception": "UnsupportedOperationException",
+            "javaClassName": "java.lang.UnsupportedOperationException",
+            "message": f"{method} {op} is not supported by the stand-in"
+        }}, HTTPStatus.BAD_REQUEST)
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_PUT(self):
+        self.dispatch("PUT")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+class FakeWebHDFS(ThreadingHTTPServer):
+    """
+        A WebHDFS REST server backed by an in-memory namespace, with an optional delay per request
+        to emulate NameNode round trips.
+    """
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        super().__init__((host, port), WebHDFSHandler)
+        self.fs = FakeFileSystem()
+        self.latency = latency
+        self.thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "FakeWebHDFS":
+        self.thread = threading.Thread(target=self.serve_forever, name="fake-webhdfs", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,95 @@
+import asyncio
+from typing import List, Tuple
+
+from app.config import config
+from app.api.v1.routes import app
+from benchmarks.harness import Result, time_calls, summarize, peak_memory_mb
+from benchmarks.standins.clickhouse import FakeClickHouseClient
+
+DATABASE = "bench"
+
+async def asgi_get(path: str, query_string: str = "") -> Tuple[int, int]:
+    """
+        Send a GET straight to the ASGI app, through its middlewares, and drain the response
+        without keeping it. Returns the status code and the number of body bytes.
+    """
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query_string.encode(), "root_path": "",
+        "headers": [(b"host", b"benchmarks")], "client": ("127.0.0.1", 0), "server": ("benchmarks", 80),
+    }
+    sent = False
+    status, byte_count = 0, 0
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # The client never disconnects, the app cancels this wait once the response is complete.
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status, byte_count
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            byte_count += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, byte_count
+
+def seed_local_tables(row_counts: List[int]):
+    """
+        Create the rows_<count> tables in the ClickHouse server of CLICKHOUSE_HOST, with the same
+        layout as the in-process stand-in.
+    """
+    client = config.clickhouse.get_connection("default")
+    client.command(f"CREATE DATABASE IF NOT EXISTS {DATABASE}")
+    for rows in row_counts:
+        client.command(f"""
+            CREATE TABLE IF NOT EXISTS {DATABASE}.rows_{rows}
+            (id UInt64, name String, amount Float64, created DateTime, active UInt8)
+            ENGINE = MergeTree ORDER BY id
+            AS SELECT number, concat('customer-', toString(number)), number * 0.25,
+                      toDateTime('2024-01-01 00:00:00') + number, number % 2
+            FROM numbers({rows})
+        """)
+    client.close()
+
+def run(args) -> List[Result]:
+    if args.clickhouse == "fake":
+        config.clickhouse.get_connection = lambda database: FakeClickHouseClient()
+    else:
+        seed_local_tables(args.rows)
+
+    loop = asyncio.new_event_loop()
+    results = []
+    for rows in args.rows:
+        for output_format in ("json", "ndjson"):
+            name = f"data_api.{output_format}.rows_{rows}"
+            if output_format == "json" and rows > args.max_buffered_rows:
+                results.append(Result(name, skipped=f"buffered JSON is limited to {args.max_buffered_rows} rows"))
+                continue
+            path = f"/api/v1/data/{DATABASE}/rows_{rows}"
+            # Buffered JSON is limited to API_DEFAULT_LIMIT rows unless a limit is given.
+            query_string = "format=ndjson" if output_format == "ndjson" else f"limit={rows}"
+            byte_counts = []
+
+            def call():
+                status, byte_count = loop.run_until_complete(asgi_get(path, query_string))
+                if status != 200:
+                    raise RuntimeError(f"GET {path}?{query_string} returned {status}")
+                byte_counts.append(byte_count)
+
+            # Large results are slow enough that a single timed run is representative.
+            repeats = args.repeats if rows <= 1_000_000 else 1
+            durations = time_calls(call, repeats=repeats, warmup=1 if rows <= 1_000_000 else 0)
+            metrics = summarize(durations)
+            metrics["rows_per_second"] = rows / metrics["seconds"]
+            metrics["mb_per_second"] = byte_counts[-1] / (1024 * 1024) / metrics["seconds"]
+            metrics["peak_memory_mb"] = peak_memory_mb(call)
+            results.append(Result(name, metrics))
+            print(f"  {name}: {metrics['seconds']:.3f}s, {metrics['rows_per_second']:.0f} rows/s, peak {metrics['peak_memory_mb']:.1f} MB")
+    loop.close()
+    return results
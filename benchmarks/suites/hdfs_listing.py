@@ -0,0 +1,53 @@
+import json
+import time
+from typing import List
+
+from app.controllers.hadoop import MANIFEST_FILE, get_list_hdfs_directory, listing_cache
+from benchmarks.harness import Result, time_calls, summarize
+from benchmarks.standins.webhdfs import FakeWebHDFS
+
+FOLDERS = 10
+
+def add_manifest_directory(server: FakeWebHDFS, path: str, files: int):
+    """
+        A dataset folder as written by the ingestion output layer, listed from its manifest.
+    """
+    modification_time = int(time.time() * 1000)
+    manifest = {
+        "dataset": path.rsplit("/", 1)[-1],
+        "format": "json",
+        "files": [
+            {"path": f"part-{index:06d}.json", "rows": 1000, "bytes": 4096, "modification_time": modification_time}
+            for index in range(files)
+        ]
+    }
+    server.fs.add_directory(path, files=files)
+    server.fs.write(f"{path}/{MANIFEST_FILE}", json.dumps(manifest).encode("utf-8"))
+
+def run(args, server: FakeWebHDFS) -> List[Result]:
+    results = []
+    for entries in args.hdfs_entries:
+        for kind in ("liststatus", "manifest"):
+            path = f"/DataLake/bench/{kind}_{entries}"
+            if kind == "manifest":
+                add_manifest_directory(server, path, entries)
+            else:
+                server.fs.add_directory(path, files=entries, folders=FOLDERS)
+            expected = entries if kind == "manifest" else entries + FOLDERS
+
+            def cold():
+                listing_cache.invalidate(path)
+                listing = get_list_hdfs_directory(path, use_cache=False)
+                if listing is None or len(listing) != expected:
+                    raise RuntimeError(f"Listing {path} returned {len(listing or [])} entries, expected {expected}")
+
+            def cached():
+                get_list_hdfs_directory(path)
+
+            name = f"hdfs_listing.{kind}.entries_{entries}"
+            metrics = summarize(time_calls(cold, repeats=args.repeats))
+            cached()
+            metrics.update(summarize(time_calls(cached, repeats=args.repeats * 10, warmup=0), prefix="cached_"))
+            results.append(Result(name, metrics))
+            print(f"  {name}: cold {metrics['seconds'] * 1000:.1f} ms, cached {metrics['cached_seconds'] * 1000:.3f} ms")
+    return results
@@ -0,0 +1,49 @@
+import uuid
+from typing import List
+
+from app.models.connection import Connection
+from app.models.repository import transaction
+from app.controllers.nifi import instantiate_flow
+from app.controllers.nifi_client import nifi_client
+from benchmarks.harness import Result, time_calls, summarize
+
+SOURCE_TYPE = "Microsoft SQL Server"
+
+def make_connection(name: str) -> Connection:
+    return Connection(
+        connection_name=name,
+        source_type=SOURCE_TYPE,
+        connection_properties={
+            "db_url": "jdbc:sqlserver://127.0.0.1:1433", "db_name": "bench", "db_username": "bench",
+            "db_password": "bench", "tables": ["dbo.customers", "dbo.orders"]
+        }
+    )
+
+def delete_connections(prefix: str):
+    # Jobs enqueued for the benchmark connections are removed by the cascade.
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM Connections WHERE connection_name LIKE %s;", (f"{prefix}%",))
+
+def run(args) -> List[Result]:
+    if not args.database_url:
+        return [Result("nifi.instantiate_flow", skipped="needs --database-url of a throwaway PostgreSQL database")]
+    # The saved connection goes to the metadata database, so it has to be reachable.
+    with transaction() as cursor:
+        cursor.execute("SELECT 1;")
+
+    prefix = f"benchmark-{uuid.uuid4().hex[:8]}-"
+
+    def call():
+        if not instantiate_flow(make_connection(f"{prefix}{uuid.uuid4().hex[:8]}")):
+            raise RuntimeError("instantiate_flow failed against the NiFi stand-in, see the log above")
+
+    try:
+        durations = time_calls(call, repeats=args.flows)
+    finally:
+        delete_connections(prefix)
+
+    metrics = summarize(durations)
+    stats = nifi_client.latency_stats()
+    metrics["requests_per_flow"] = sum(endpoint["count"] for endpoint in stats.values()) / (args.flows + 1)
+    print(f"  nifi.instantiate_flow: {metrics['seconds'] * 1000:.1f} ms median, {metrics['p95_seconds'] * 1000:.1f} ms p95")
+    return [Result("nifi.instantiate_flow", metrics)]
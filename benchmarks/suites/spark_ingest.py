@@ -0,0 +1,34 @@
+import tempfile
+from typing import List
+
+from benchmarks.harness import Result, time_calls, summarize
+from benchmarks.standins.kafka import write_topic, get_file_stream
+
+TOPIC_PREFIX = "bench"
+
+def run(args) -> List[Result]:
+    try:
+        from pyspark.sql import SparkSession
+        from app.controllers.kafka import store_kafka_stream
+    except ImportError as e:
+        return [Result(f"spark_ingest.rows_{rows}", skipped=f"pyspark is not available: {e}") for rows in args.spark_rows]
+
+    # A local session without the Kafka and Delta packages, the topic is read from files.
+    spark = SparkSession.builder.master(args.spark_master).appName("benchmarks").getOrCreate()
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.spark_rows:
+            topic = f"{TOPIC_PREFIX}.dbo.rows_{rows}"
+            write_topic(directory, topic, rows)
+
+            def call():
+                if not store_kafka_stream(get_file_stream(spark, directory, topic), TOPIC_PREFIX, f"rows_{rows}"):
+                    raise RuntimeError(f"store_kafka_stream failed for {topic}, see the log above")
+
+            name = f"spark_ingest.rows_{rows}"
+            metrics = summarize(time_calls(call, repeats=args.repeats))
+            metrics["rows_per_second"] = rows / metrics["seconds"]
+            results.append(Result(name, metrics))
+            print(f"  {name}: {metrics['seconds']:.2f}s, {metrics['rows_per_second']:.0f} rows/s")
+    spark.stop()
+    return results
@@ -76,11 +76,14 @@ def create_connections_table():
             connection_properties JSONB NOT NULL,
             state VARCHAR(50) NOT NULL,
             nifi_process_id VARCHAR(255),
+            trace_context JSONB NOT NULL DEFAULT '{}'::jsonb,
             create_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
         '''
         
         cur.execute(create_table_query)
+        # Tables created before tracing was added get the column too.
+        cur.execute("ALTER TABLE Connections ADD COLUMN IF NOT EXISTS trace_context JSONB NOT NULL DEFAULT '{}'::jsonb;")
         logger.info("Table 'Connections' created successfully.")
         
         cur.close()
@@ -132,9 +135,171 @@ def create_datasets_table():
             conn.close()
         logger.error(f"Failed to create table 'Datasets' : {e}")
 
+def create_kafka_offsets_table():
+    env = get_db_env()
+    
+    try:
+        # Connect to the specified database
+        conn = psycopg2.connect(
+            dbname=env["dbname"], host=env["host"], user=env["user"], 
+            password=env["password"], port=env["port"]
+        )
+        conn.autocommit = True
+        cur = conn.cursor()
+        
+        # Create the Kafka_Offsets table
+        create_table_query = '''
+        CREATE TABLE IF NOT EXISTS Kafka_Offsets (
+            connection_id INT NOT NULL,
+            topic VARCHAR(255) NOT NULL,
+            partition INT NOT NULL,
+            committed_offset BIGINT NOT NULL,
+            update_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (connection_id, topic, partition),
+            FOREIGN KEY (connection_id) REFERENCES Connections(id) ON DELETE CASCADE
+        );
+        '''
+        
+        cur.execute(create_table_query)
+        logger.info("Table 'Kafka_Offsets' created successfully.")
+        
+        cur.close()
+        conn.close()
+    except Exception as e:
+        if 'cur' in locals() and cur:
+            cur.close()
+        if 'conn' in locals() and conn:
+            conn.close()
+        logger.error(f"Failed to create table 'Kafka_Offsets' : {e}")
+
+def create_jobs_table():
+    env = get_db_env()
+    
+    try:
+        # Connect to the specified database
+        conn = psycopg2.connect(
+            dbname=env["dbname"], host=env["host"], user=env["user"], 
+            password=env["password"], port=env["port"]
+        )
+        conn.autocommit = True
+        cur = conn.cursor()
+        
+        # Create the Jobs table
+        create_table_query = '''
+        CREATE TABLE IF NOT EXISTS Jobs (
+            id SERIAL PRIMARY KEY,
+            job_type VARCHAR(50) NOT NULL,
+            connection_id INT NOT NULL,
+            source_type VARCHAR(100) NOT NULL,
+            payload JSONB NOT NULL DEFAULT '{}',
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            attempts INT NOT NULL DEFAULT 0,
+            worker_id VARCHAR(255),
+            error TEXT,
+            heartbeat_date TIMESTAMP,
+            start_date TIMESTAMP,
+            finish_date TIMESTAMP,
+            create_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (connection_id) REFERENCES Connections(id) ON DELETE CASCADE
+        );
+        '''
+        
+        cur.execute(create_table_query)
+        # At most one active job of a type per connection.
+        cur.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active_connection ON Jobs (connection_id, job_type)
+        WHERE status IN ('queued', 'running');
+        ''')
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON Jobs (status, job_type, id);")
+        logger.info("Table 'Jobs' created successfully.")
+        
+        cur.close()
+        conn.close()
+    except Exception as e:
+        if 'cur' in locals() and cur:
+            cur.close()
+        if 'conn' in locals() and conn:
+            conn.close()
+        logger.error(f"Failed to create table 'Jobs' : {e}")
+
+def create_pool_groups_table():
+    env = get_db_env()
+    
+    try:
+        # Connect to the specified database
+        conn = psycopg2.connect(
+            dbname=env["dbname"], host=env["host"], user=env["user"], 
+            password=env["password"], port=env["port"]
+        )
+        conn.autocommit = True
+        cur = conn.cursor()
+        
+        # Create the Pool_Groups table, the NiFi warm pool shared by every process
+        create_table_query = '''
+        CREATE TABLE IF NOT EXISTS Pool_Groups (
+            id SERIAL PRIMARY KEY,
+            source_type VARCHAR(100) NOT NULL,
+            process_group_id VARCHAR(255) UNIQUE,
+            state VARCHAR(20) NOT NULL DEFAULT 'creating',
+            update_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        '''
+        
+        cur.execute(create_table_query)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_pool_groups_state ON Pool_Groups (source_type, state, update_date);")
+        logger.info("Table 'Pool_Groups' created successfully.")
+        
+        cur.close()
+        conn.close()
+    except Exception as e:
+        if 'cur' in locals() and cur:
+            cur.close()
+        if 'conn' in locals() and conn:
+            conn.close()
+        logger.error(f"Failed to create table 'Pool_Groups' : {e}")
+
+def create_indexes():
+    env = get_db_env()
+    
+    try:
+        # Connect to the specified database
+        conn = psycopg2.connect(
+            dbname=env["dbname"], host=env["host"], user=env["user"], 
+            password=env["password"], port=env["port"]
+        )
+        conn.autocommit = True
+        cur = conn.cursor()
+        
+        # Indexes backing the filtered, paginated listings
+        create_index_queries = [
+            "CREATE INDEX IF NOT EXISTS idx_connections_state ON Connections (state, id);",
+            "CREATE INDEX IF NOT EXISTS idx_connections_source_type ON Connections (source_type, id);",
+            "CREATE INDEX IF NOT EXISTS idx_connections_create_date ON Connections (create_date);",
+            "CREATE INDEX IF NOT EXISTS idx_datasets_connection_id ON Datasets (connection_id);",
+            "CREATE INDEX IF NOT EXISTS idx_datasets_dataset_owner ON Datasets (dataset_owner, id);",
+            # A table published by a connection is registered once, even by concurrent publishes.
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_datasets_connection_table ON Datasets (connection_id, dataset_owner, table_name);",
+        ]
+        for create_index_query in create_index_queries:
+            cur.execute(create_index_query)
+        logger.info("Indexes created successfully.")
+        
+        cur.close()
+        conn.close()
+    except Exception as e:
+        if 'cur' in locals() and cur:
+            cur.close()
+        if 'conn' in locals() and conn:
+            conn.close()
+        logger.error(f"Failed to create indexes : {e}")
+
 if __name__ == "__main__":
     database = check_and_create_database()
 
     if database:
         create_connections_table()
         create_datasets_table()
+        create_kafka_offsets_table()
+        create_jobs_table()
+        create_pool_groups_table()
+        create_indexes()